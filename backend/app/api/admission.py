@@ -0,0 +1,114 @@
+"""
+Admission control for the synchronous pipeline routes.
+
+Under a burst, accepting every request only makes every request late: they
+all queue behind the same thread pool and model slots until the client gives
+up. Instead each request is checked on arrival against three load signals,
+
+- requests already admitted and still in flight,
+- tasks queued for a blocking-stage thread (see executors),
+- the wait a new model call would face (calls queued for a model slot times
+  recent model latency, spread over the slots),
+
+and refused with 429 and a `Retry-After` estimate while any of them is over
+its limit, so latency stays bounded for the requests that are admitted.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+
+from app.api.scheduling import fill_limiter
+from app.config import settings
+from app.executors import executors
+from app.extraction.ai_extractor import model_latency, model_limiter
+from app.extraction.resilience import LatencyTracker
+
+
+@dataclass(frozen=True)
+class AdmissionLimits:
+    max_inflight: int = 32
+    max_threadpool_waiting: int = 64
+    max_model_wait: float = 30.0
+    # Used while there is no latency history to estimate from.
+    default_retry_after: int = 10
+    min_retry_after: int = 1
+    max_retry_after: int = 120
+
+
+@dataclass(frozen=True)
+class Rejection:
+    reason: str  # "inflight", "threadpool" or "model"
+    retry_after: int  # whole seconds, for the Retry-After header
+
+
+def _blocking_backlog() -> tuple[int, int]:
+    """Tasks queued for a blocking-stage thread, and the threads serving them."""
+    # Fills wait in the fill scheduler rather than in their executor.
+    waiting = sum(e.waiting for e in executors) + fill_limiter.waiting
+    return waiting, sum(e.threads for e in executors)
+
+
+class AdmissionController:
+    """Admits or sheds requests; admitted ones must be released when done."""
+
+    def __init__(self, limits: AdmissionLimits):
+        self.limits = limits
+        self.inflight = 0
+        # Duration of recent admitted requests, to estimate how fast a backlog drains.
+        self.request_latency = LatencyTracker(window=200, min_samples=5)
+
+    def check(self) -> Rejection | None:
+        """Why a new request should be refused right now, or None to admit it."""
+        limits = self.limits
+        request_p50 = self.request_latency.percentile(0.5)
+        if self.inflight >= limits.max_inflight:
+            # The overflow drains at about max_inflight requests per request time.
+            excess = self.inflight - limits.max_inflight + 1
+            return self._reject("inflight", _drain_seconds(excess, limits.max_inflight, request_p50))
+
+        waiting, threads = _blocking_backlog()
+        if waiting >= limits.max_threadpool_waiting:
+            excess = waiting - limits.max_threadpool_waiting + 1
+            return self._reject("threadpool", _drain_seconds(excess, threads, request_p50))
+
+        model_wait = self.model_wait()
+        if model_wait > limits.max_model_wait:
+            return self._reject("model", model_wait - limits.max_model_wait)
+        return None
+
+    def model_wait(self) -> float:
+        """Estimated seconds a model call started now would queue for a slot."""
+        p50 = model_latency.percentile(0.5)
+        if p50 is None:
+            return 0.0  # no history yet: nothing to base an estimate on
+        ahead = model_limiter.active + model_limiter.waiting - model_limiter.limit + 1
+        return max(0, ahead) / model_limiter.limit * p50
+
+    def admit(self) -> float:
+        """Count an admitted request; returns its start time for release()."""
+        self.inflight += 1
+        return time.perf_counter()
+
+    def release(self, started: float) -> None:
+        self.inflight -= 1
+        self.request_latency.record(time.perf_counter() - started)
+
+    def _reject(self, reason: str, seconds: float | None) -> Rejection:
+        limits = self.limits
+        retry_after = limits.default_retry_after if seconds is None else math.ceil(seconds)
+        return Rejection(reason, min(limits.max_retry_after, max(limits.min_retry_after, retry_after)))
+
+
+def _drain_seconds(excess: int, parallelism: int, unit_seconds: float | None) -> float | None:
+    """Time for `excess` queued units to drain `parallelism` at a time (None if unknown)."""
+    if unit_seconds is None:
+        return None
+    return excess / max(1, parallelism) * unit_seconds
+
+
+admission = AdmissionController(AdmissionLimits(
+    max_inflight=settings.admission_max_inflight,
+    max_threadpool_waiting=settings.admission_max_threadpool_waiting,
+    max_model_wait=settings.admission_max_model_wait_seconds,
+))
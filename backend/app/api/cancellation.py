@@ -0,0 +1,82 @@
+"""
+Stop pipeline work nobody is waiting for any more.
+
+When a browser tab is closed mid-request, the model call and the fill would
+otherwise run to completion and the result be thrown away. A RequestGuard
+runs each pipeline stage as a task and, between and during stages, checks
+whether the client has disconnected or the request's deadline has passed; if
+so the stage is cancelled. Cancelling a stage's task also drops work still
+queued for a thread-pool worker, a fill slot or a model slot, and (through
+SingleFlight) the model call itself once no other request shares it.
+
+The deadline is also published to the resilience layer (set_deadline), so
+model retries and backoff never run past it.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app.extraction.resilience import set_deadline
+from app.observability.metrics import requests_cancelled_total
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How often a running stage polls for a client disconnect.
+DISCONNECT_POLL_SECONDS = 0.25
+# nginx's status for "client closed request"; never seen by the client.
+CLIENT_CLOSED_REQUEST = 499
+
+
+class RequestGuard:
+    def __init__(self, request: Request, timeout: float | None):
+        self.request = request
+        self.deadline = time.monotonic() + timeout if timeout else None
+        set_deadline(self.deadline)
+
+    async def run(self, stage: str, work: Awaitable[T]) -> T:
+        """Run one pipeline stage, cancelling it if the request is abandoned."""
+        task = asyncio.ensure_future(work)
+        try:
+            await self.check(stage)
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self._poll_interval())
+                if done:
+                    if task.exception() is not None and self._expired():
+                        # The stage gave up because of the deadline (e.g. the
+                        # model budget was cut short): report it as such.
+                        self._cancelled("deadline", stage)
+                        raise HTTPException(status_code=504, detail="Request deadline exceeded.")
+                    return task.result()
+                await self.check(stage)
+        finally:
+            if not task.done():
+                task.cancel()
+                # Let the stage unwind (release slots, close files) before we return.
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def check(self, stage: str) -> None:
+        """Raise if the client has gone away or the deadline has passed."""
+        if await self.request.is_disconnected():
+            self._cancelled("disconnect", stage)
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request.")
+        if self._expired():
+            self._cancelled("deadline", stage)
+            raise HTTPException(status_code=504, detail="Request deadline exceeded.")
+
+    def _expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _poll_interval(self) -> float:
+        if self.deadline is None:
+            return DISCONNECT_POLL_SECONDS
+        return max(0.0, min(DISCONNECT_POLL_SECONDS, self.deadline - time.monotonic()))
+
+    def _cancelled(self, reason: str, stage: str) -> None:
+        requests_cancelled_total.inc(reason=reason, stage=stage)
+        logger.info("cancelled %s %s at stage=%s (%s)", self.request.method, self.request.url.path, stage, reason)
@@ -0,0 +1,216 @@
+"""ASGI middleware for the API."""
+
+import json
+import logging
+import time
+
+from app.config import settings
+from app.executors import io_executor
+from app.observability.metrics import admission_rejections_total, request_seconds, requests_total, track_request
+from app.observability.profiling import start_session, token_matches
+from app.observability.tracing import current_span, server_timing, span
+
+logger = logging.getLogger(__name__)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Refuse uploads whose Content-Length is already over the route's limit.
+
+    FastAPI parses (and spools) the whole multipart body before an endpoint
+    runs, so the per-file check in _read_upload only happens after an
+    oversized body has been received. This check runs first and answers
+    without reading the body at all.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self.limits.get(scope["path"])
+            length = _content_length(scope)
+            if limit is not None and length is not None and length > limit:
+                await _send_error(send, 400, f"Request too large. Maximum upload size: {limit // (1024 * 1024)} MB.")
+                return
+        await self.app(scope, receive, send)
+
+
+def _content_length(scope) -> int | None:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _send_error(send, status: int, detail: str, headers: list[tuple[bytes, bytes]] = ()) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    Shed load on the given POST routes: answer 429 with a Retry-After when
+    the controller says the pipeline is saturated, before the upload is read.
+    Admitted requests count as in flight until their last body byte.
+    """
+
+    def __init__(self, app, controller, paths: tuple[str, ...]):
+        self.app = app
+        self.controller = controller
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+            or not settings.admission_enabled
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        rejection = self.controller.check()
+        if rejection is not None:
+            admission_rejections_total.inc(reason=rejection.reason)
+            logger.warning(
+                "admission: shed %s (%s limit), retry after %ds",
+                scope["path"], rejection.reason, rejection.retry_after,
+            )
+            await _send_error(
+                send, 429, "Server is busy. Try again shortly.",
+                [(b"retry-after", str(rejection.retry_after).encode())],
+            )
+            return
+
+        started = self.controller.admit()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(started)
+
+
+class MetricsMiddleware:
+    """
+    Count and time every HTTP request by route and template type. The route
+    label is the matched route's path template (e.g. /api/jobs/{job_id}) so
+    ids don't explode the label space; the timer stops at the last body
+    byte, so streamed responses are measured in full.
+    """
+
+    def __init__(self, app, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        labels = track_request()
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            template = labels.get("template", "")
+            requests_total.inc(route=route, method=scope["method"], status=str(status), template=template)
+            request_seconds.observe(time.perf_counter() - start, route=route, template=template)
+
+
+class TracingMiddleware:
+    """
+    Open a root span per HTTP request and report its stage spans in a
+    `Server-Timing` header. Stages still running when the response starts
+    (a streamed response) are left out. The trace id is returned as
+    `X-Request-Id`.
+    """
+
+    def __init__(self, app, exclude: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        with span("request", **{"http.method": scope["method"], "http.path": scope["path"]}) as root:
+
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    root.set(**{"http.status_code": message["status"]})
+                    headers = list(message.get("headers", []))
+                    timing = server_timing(root)
+                    if timing:
+                        headers.append((b"server-timing", timing.encode()))
+                    headers.append((b"x-request-id", root.trace_id.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    root.name = f"{scope['method']} {route}"
+                    root.set(**{"http.route": route})
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that carry the operator token in the X-Profile-Token
+    header (not the query string: it is a secret, and URLs are logged). Must
+    run inside TracingMiddleware: the
+    artifact is keyed by the request's trace id, returned as X-Profile-Id.
+    The artifact is written after the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.profiling_token:
+            await self.app(scope, receive, send)
+            return
+        supplied = dict(scope["headers"]).get(b"x-profile-token", b"").decode() or None
+        root = current_span()
+        if root is None or not token_matches(supplied, settings.profiling_token):
+            await self.app(scope, receive, send)
+            return
+
+        session = start_session(root.trace_id, settings.profiling_mode)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", session.request_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            path = await io_executor.run(session.save, settings.profiling_dir)
+            root.set(profile=path or "")
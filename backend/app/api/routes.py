@@ -1,32 +1,96 @@
 """API routes for the document formatter."""
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import Response
+import asyncio
+import json
+import time
+import zipfile
 
+from fastapi import APIRouter, File, Form, Header, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.config import settings
+
+from app.api.cancellation import RequestGuard
+from app.api.scheduling import fill_limiter, fill_priority
 from app.engine.docx_engine import fill_template
-from app.extraction.text_extractor import extract_text
-from app.extraction.ai_extractor import extract_fields
+from app.executors import extract_text_executor, fill_executor, io_executor
+from app.extraction.sandbox import extract_text_isolated
+from app.extraction.text_extractor import extract_text, extractor_fingerprint
+from app.extraction.ai_extractor import extract_fields, normalize_fields, track_model_call
 from app.models.template_registry import TEMPLATES, TemplateInfo, get_template
-from app.models.schemas import TemplateInfoResponse
+from app.jobs.manager import FAILED, SUCCEEDED, Job, QueueFullError, job_manager
+from app.models.schemas import ExtractResponse, FillRequest, JobStatusResponse, TemplateInfoResponse
+from app.observability.metrics import set_template, stage_timer
+from app.observability.profiling import active_session, find_artifact, profiled, token_matches
+from app.observability.tracing import current_span, span
+from app.storage.idempotency import MAX_KEY_LENGTH, NEW, idempotent_results, scoped_key
+from app.storage.results import new_token, result_store
+from app.storage.text_cache import text_cache, text_cache_key
+from app.storage.uploads import Upload, UploadSpool
 
 router = APIRouter()
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+# Multipart framing and form fields around an uploaded file stay well under
+# this, so a Content-Length beyond files * (MAX_FILE_SIZE + overhead) can be
+# refused before the body is read.
+MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# /fill takes fields as JSON, normally an /extract result (at most a few
+# hundred KB, bounded by the model's output budget), perhaps edited.
+MAX_FILL_BODY_SIZE = 1024 * 1024
+MAX_FIELD_CHARS = 100_000
 ALLOWED_EXTENSIONS = {"docx", "pdf", "txt"}
 
 DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
+# Seconds of silence after which the progress stream sends an SSE comment, so
+# proxies and browsers don't drop the connection during a long model call.
+SSE_KEEPALIVE_SECONDS = 15.0
+
 
 def _require_template(template_type: str) -> TemplateInfo:
     try:
-        return get_template(template_type)
+        info = get_template(template_type)
     except KeyError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    set_template(template_type)
+    root = current_span()
+    if root is not None:
+        root.set(template=template_type)
+    return info
+
 
+def upload_body_limits(prefix: str) -> dict[str, int]:
+    """Largest plausible request body per upload (and /fill) route (see UploadSizeLimitMiddleware)."""
+    per_file = MAX_FILE_SIZE + MULTIPART_OVERHEAD
+    files_per_route = {"/format": 1, "/format/stream": 1, "/extract": 1, "/jobs": 1, "/batch": settings.batch_max_files}
+    limits = {prefix + path: files * per_file for path, files in files_per_route.items()}
+    batch_total = settings.batch_max_total_bytes + settings.batch_max_files * MULTIPART_OVERHEAD
+    limits[prefix + "/batch"] = min(limits[prefix + "/batch"], batch_total)
+    limits[prefix + "/fill"] = MAX_FILL_BODY_SIZE
+    return limits
 
-async def _read_upload(file: UploadFile) -> bytes:
-    """Validate extension + size and return the uploaded bytes (capped)."""
+
+def _check_field_sizes(value) -> None:
+    """400 if any text in `value` (flat fields or nested sections) is over MAX_FIELD_CHARS."""
+    if isinstance(value, str):
+        if len(value) > MAX_FIELD_CHARS:
+            raise HTTPException(status_code=400, detail=f"Field value too long. Maximum: {MAX_FIELD_CHARS} characters.")
+    elif isinstance(value, dict):
+        for item in value.values():
+            _check_field_sizes(item)
+    elif isinstance(value, list):
+        for item in value:
+            _check_field_sizes(item)
+
+
+async def _read_upload(file: UploadFile) -> Upload:
+    """
+    Validate extension + size and receive the upload, in memory or spooled to
+    disk past settings.upload_spool_threshold_bytes. The caller owns the
+    returned Upload and must close() it.
+    """
     filename = file.filename or "upload"
     ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
     if ext not in ALLOWED_EXTENSIONS:
@@ -34,63 +98,225 @@ async def _read_upload(file: UploadFile) -> bytes:
             status_code=400,
             detail=f"Unsupported file type: .{ext}. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}",
         )
-    # Read at most one byte past the limit so an oversized upload is rejected
-    # without buffering the entire (potentially huge) file into memory.
-    file_bytes = await file.read(MAX_FILE_SIZE + 1)
-    if len(file_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large. Maximum size: 10 MB.")
-    if len(file_bytes) == 0:
-        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-    return file_bytes
-
-
-async def _extract(template_type: str, file: UploadFile) -> dict[str, str]:
-    """Shared upload → text → AI-extraction step."""
-    _require_template(template_type)
-    file_bytes = await _read_upload(file)
-    filename = file.filename or "upload"
+    with stage_timer("upload_read"), span("upload_read", file_type=ext) as sp:
+        spool = UploadSpool(filename, settings.upload_spool_threshold_bytes, settings.upload_spool_dir or None)
+        try:
+            # Stop reading as soon as the limit is crossed, so an oversized upload
+            # is rejected without receiving the entire (potentially huge) file.
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if spool.size + len(chunk) > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=400, detail="File too large. Maximum size: 10 MB.")
+                if spool.will_spill(len(chunk)):
+                    await io_executor.run(spool.write, chunk)
+                else:
+                    spool.write(chunk)
+        except BaseException:
+            spool.discard()
+            raise
+        upload = spool.finish()
+        sp.set(bytes=upload.size, spooled=upload.spooled)
+        if upload.size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+        return upload
+
+
+def _cached_extract_text(upload: Upload) -> str:
+    """Text of `upload`, from the text cache when this content was seen before."""
+    # A profiled (operator) request parses in-process so the profile shows
+    # the parse itself rather than a wait on a sandbox worker.
+    extract = extract_text if active_session() is not None else extract_text_isolated
+    if not text_cache.enabled:
+        return extract(upload.source, upload.filename)
+    key = text_cache_key(upload.sha256, upload.filename, extractor_fingerprint())
+    text = text_cache.get(key)
+    sp = current_span()
+    if sp is not None:
+        sp.set(cache_hit=text is not None)
+    if text is None:
+        text = extract(upload.source, upload.filename)
+        if text.strip():
+            text_cache.put(key, text)
+    return text
+
 
+async def _extract_text(upload: Upload) -> str:
+    """Upload → plain text (400 on unreadable or empty documents)."""
+    with stage_timer("extract_text"), span("extract_text", bytes=upload.size) as sp:
+        try:
+            document_text = await extract_text_executor.run(profiled(_cached_extract_text), upload)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to extract text: {e}")
+        sp.set(characters=len(document_text))
+        if not document_text.strip():
+            raise HTTPException(status_code=400, detail="No text content found in uploaded file.")
+        return document_text
+
+
+async def _extract_fields(
+    template_type: str,
+    document_text: str,
+    timings: dict | None = None,
+    **kwargs,
+) -> dict:
+    """
+    Plain text → extracted fields (500 on any AI-layer failure). The model
+    call's queue wait and whether it was coalesced go into `timings`.
+    """
+    stats = track_model_call()
     try:
-        document_text = await run_in_threadpool(extract_text, file_bytes, filename)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to extract text: {e}")
-    if not document_text.strip():
-        raise HTTPException(status_code=400, detail="No text content found in uploaded file.")
+        with stage_timer("extract_fields"), span("extract_fields", characters=len(document_text)) as sp:
+            try:
+                return await extract_fields(template_type, document_text, **kwargs)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+            finally:
+                sp.set(
+                    model=stats.model,
+                    input_tokens=stats.input_tokens,
+                    output_tokens=stats.output_tokens,
+                    queue_wait_ms=stats.queue_wait_ms,
+                    attempts=stats.attempts,
+                    coalesced=stats.coalesced,
+                )
+    finally:
+        if timings is not None:
+            timings["model_queue_wait_ms"] = stats.queue_wait_ms
+            timings["model_coalesced"] = stats.coalesced
+            timings["model_attempts"] = stats.attempts
+            timings["prefilter_saved_tokens"] = stats.prefilter_saved_tokens
+
 
+async def _extract(
+    template_type: str,
+    file: UploadFile,
+    guard: RequestGuard,
+    timings: dict | None = None,
+) -> dict[str, str]:
+    """Shared upload → text → AI-extraction step, abandoned along with the request."""
+    _require_template(template_type)
+    upload = await _read_upload(file)
     try:
-        return await extract_fields(template_type, document_text)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI extraction failed: {e}")
+        document_text = await guard.run("extract_text", _extract_text(upload))
+    finally:
+        upload.close()
+    return await guard.run("extract_fields", _extract_fields(template_type, document_text, timings))
+
+
+def _model_call_headers(timings: dict) -> dict[str, str]:
+    """How the request's model call was scheduled, for /format and /extract callers."""
+    return {
+        "X-Model-Queue-Wait-Ms": str(timings["model_queue_wait_ms"]),
+        "X-Model-Coalesced": "true" if timings["model_coalesced"] else "false",
+    }
+
+
+async def _format_upload(
+    template_info: TemplateInfo,
+    template_type: str,
+    upload: Upload,
+    timings: dict[str, int] | None = None,
+) -> bytes:
+    """
+    Whole pipeline on an already-received upload: text → fields → .docx.
+    Takes ownership of `upload` (closed once its text is extracted).
+    Per-stage milliseconds are recorded into `timings` when it is given.
+    """
+    set_template(template_type)  # jobs and batch files run outside the request's context
+    timings = {} if timings is None else timings
+    # A trace of its own for background jobs; a child span within a batch request.
+    with span("format_pipeline", template=template_type, filename=upload.filename):
+        t0 = time.perf_counter()
+        try:
+            document_text = await _extract_text(upload)
+        finally:
+            upload.close()
+        timings["extract_text_ms"] = _ms_since(t0)
+        t0 = time.perf_counter()
+        fields = await _extract_fields(template_type, document_text, timings)
+        timings["extract_fields_ms"] = _ms_since(t0)
+        t0 = time.perf_counter()
+        output = await _fill(template_info, fields)
+        timings["fill_ms"] = _ms_since(t0)
+        return output
+
+
+def fill_arguments(template_info: TemplateInfo, fields: dict) -> tuple:
+    """fill_template's arguments for `fields` (as returned by extraction)."""
+    if template_info.structured:
+        # Scalars feed the flat placeholder fill; the full structured dict
+        # (with its lists) drives repeatable-block expansion.
+        scalars = {k: str(v) for k, v in fields.items() if isinstance(v, str)}
+        return str(template_info.path), scalars, fields
+    values = {k: "" for k in template_info.placeholders}
+    for key, value in fields.items():
+        if key in values:  # whitelist to the template's own placeholders
+            values[key] = str(value) if value is not None else ""
+    return str(template_info.path), values
 
 
 async def _fill(template_info: TemplateInfo, fields: dict) -> bytes:
     """Shared fill step. Structured templates clone repeatable blocks; flat
     templates fill every placeholder (missing → '')."""
-    try:
-        if template_info.structured:
-            # Scalars feed the flat placeholder fill; the full structured dict
-            # (with its lists) drives repeatable-block expansion.
-            scalars = {k: str(v) for k, v in fields.items() if isinstance(v, str)}
-            return await run_in_threadpool(
-                fill_template, str(template_info.path), scalars, fields
-            )
-        values = {k: "" for k in template_info.placeholders}
-        for key, value in fields.items():
-            if key in values:  # whitelist to the template's own placeholders
-                values[key] = str(value) if value is not None else ""
-        return await run_in_threadpool(fill_template, str(template_info.path), values)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Template fill failed: {e}")
+    with stage_timer("fill_template"), span("fill_template", fields=len(fields)) as sp:
+        args = fill_arguments(template_info, fields)
+        priority = fill_priority(template_info, fields)
+        queued_at = time.perf_counter()
+        async with fill_limiter.slot(priority):
+            sp.set(queue_wait_ms=_ms_since(queued_at))
+            try:
+                return await fill_executor.run(profiled(fill_template), *args)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Template fill failed: {e}")
+
+
+def _output_filename(template_type: str) -> str:
+    return f"{template_type}_formatted.docx"
 
 
 def _docx_response(template_type: str, output_bytes: bytes) -> Response:
+    return _attachment_response(output_bytes, _output_filename(template_type))
+
+
+def _attachment_response(output_bytes: bytes, filename: str) -> Response:
     return Response(
         content=output_bytes,
         media_type=DOCX_MEDIA_TYPE,
-        headers={"Content-Disposition": f'attachment; filename="{template_type}_formatted.docx"'},
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks.
+
+    zipfile can write to a non-seekable stream (using data descriptors), so a
+    batch zip is emitted entry by entry instead of being built in memory.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _sse(event: str, data: dict) -> str:
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _ms_since(start: float) -> int:
+    return round((time.perf_counter() - start) * 1000)
+
+
 @router.get("/templates", response_model=list[TemplateInfoResponse])
 async def list_templates():
     """Return available template types."""
@@ -105,13 +331,389 @@ async def list_templates():
     ]
 
 
+def _guard(request: Request) -> RequestGuard:
+    return RequestGuard(request, settings.request_timeout_seconds or None)
+
+
 @router.post("/format")
 async def format_document(
+    request: Request,
     file: UploadFile = File(...),
     template_type: str = Form(...),
+    idempotency_key: str | None = Header(None),
 ):
-    """One-shot: upload → extract (the intelligence) → fill → return the .docx."""
+    """
+    One-shot: upload → extract (the intelligence) → fill → return the .docx.
+
+    With an `Idempotency-Key` header, a retry of the same upload and template
+    attaches to the run in flight or gets the stored result back
+    (`Idempotent-Replayed: true`) instead of running the pipeline again.
+    X-Model-Queue-Wait-Ms and X-Model-Coalesced report how the model call was
+    scheduled (also on /extract; absent on a replay).
+    """
+    guard = _guard(request)
     template_info = _require_template(template_type)
-    fields = await _extract(template_type, file)
+    if idempotency_key is not None:
+        return await _format_idempotent(guard, template_info, template_type, file, idempotency_key)
+    timings: dict = {}
+    fields = await _extract(template_type, file, guard, timings)
+    output_bytes = await guard.run("fill_template", _fill(template_info, fields))
+    response = _docx_response(template_type, output_bytes)
+    response.headers.update(_model_call_headers(timings))
+    return response
+
+
+async def _format_idempotent(
+    guard: RequestGuard,
+    template_info: TemplateInfo,
+    template_type: str,
+    file: UploadFile,
+    idempotency_key: str,
+) -> Response:
+    if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters.")
+    upload = await _read_upload(file)
+    key = scoped_key(idempotency_key, upload.sha256, template_type)
+    used = False
+    timings: dict[str, int] = {}
+
+    async def run_pipeline():
+        nonlocal used
+        used = True  # the pipeline now owns (and closes) the upload
+        # The run may outlive this request's connection, but not its deadline.
+        timeout = None if guard.deadline is None else guard.deadline - time.monotonic()
+        try:
+            return await asyncio.wait_for(_format_upload(template_info, template_type, upload, timings), timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Request deadline exceeded.")
+
+    try:
+        # The run outlives this request while a retry is attached to it.
+        output_bytes, outcome = await guard.run(
+            "format_pipeline", idempotent_results.run(key, _output_filename(template_type), run_pipeline)
+        )
+    finally:
+        if not used:
+            upload.close()
+    response = _docx_response(template_type, output_bytes)
+    if outcome == NEW:
+        response.headers.update(_model_call_headers(timings))
+    else:
+        # The model call belonged to the original request.
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+@router.post("/extract", response_model=ExtractResponse)
+async def extract_document(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    template_type: str = Form(...),
+):
+    """
+    First half of /format: upload → extracted fields as JSON. Clients can edit
+    or cache the result and render it with /fill without another model call.
+    """
+    template_info = _require_template(template_type)
+    timings: dict = {}
+    fields = await _extract(template_type, file, _guard(request), timings)
+    response.headers.update(_model_call_headers(timings))
+    return ExtractResponse(template_type=template_type, structured=template_info.structured, fields=fields)
+
+
+@router.post("/fill")
+async def fill_document(body: FillRequest):
+    """Second half of /format: fields (as returned by /extract) → .docx."""
+    template_info = _require_template(body.template_type)
+    fields = normalize_fields(template_info, body.fields)
+    _check_field_sizes(fields)
     output_bytes = await _fill(template_info, fields)
-    return _docx_response(template_type, output_bytes)
+    return _docx_response(body.template_type, output_bytes)
+
+
+@router.post("/format/stream")
+async def format_document_stream(
+    file: UploadFile = File(...),
+    template_type: str = Form(...),
+):
+    """
+    Same pipeline as /format, reported as server-sent events.
+
+    Validation problems are still plain 400s. Once the stream is open, each
+    stage emits an event (`stage`, `model`) and the stream ends with either
+    `done` — carrying a download token for GET /format/download/{token} — or
+    `error` with the status code /format would have returned.
+    """
+    template_info = _require_template(template_type)
+    started = time.perf_counter()
+    upload = await _read_upload(file)
+    read_ms = _ms_since(started)
+
+    events: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def run_pipeline() -> None:
+        timings = {"upload_read_ms": read_ms}
+        try:
+            events.put_nowait(_sse("stage", {"stage": "upload_read", "bytes": upload.size, "ms": read_ms}))
+
+            t0 = time.perf_counter()
+            try:
+                document_text = await _extract_text(upload)
+            finally:
+                upload.close()
+            timings["extract_text_ms"] = _ms_since(t0)
+            events.put_nowait(_sse("stage", {
+                "stage": "text_extracted",
+                "characters": len(document_text),
+                "ms": timings["extract_text_ms"],
+            }))
+
+            t0 = time.perf_counter()
+            events.put_nowait(_sse("stage", {"stage": "model_started"}))
+            fields = await _extract_fields(
+                template_type,
+                document_text,
+                timings,
+                on_progress=lambda n: events.put_nowait(_sse("model", {"fields_received": n})),
+            )
+            timings["extract_fields_ms"] = _ms_since(t0)
+            events.put_nowait(_sse("stage", {
+                "stage": "model_finished",
+                "ms": timings["extract_fields_ms"],
+                "queue_wait_ms": timings["model_queue_wait_ms"],
+                "coalesced": timings["model_coalesced"],
+            }))
+
+            t0 = time.perf_counter()
+            events.put_nowait(_sse("stage", {"stage": "fill_started"}))
+            output_bytes = await _fill(template_info, fields)
+            timings["fill_ms"] = _ms_since(t0)
+            events.put_nowait(_sse("stage", {"stage": "fill_finished", "ms": timings["fill_ms"]}))
+
+            token = new_token()
+            await io_executor.run(result_store.put, token, output_bytes, _output_filename(template_type))
+            timings["total_ms"] = _ms_since(started)
+            events.put_nowait(_sse("done", {
+                "token": token,
+                "download_url": f"/api/format/download/{token}",
+                "timings": timings,
+            }))
+        except HTTPException as e:
+            events.put_nowait(_sse("error", {"status_code": e.status_code, "detail": e.detail}))
+        finally:
+            upload.close()  # also when cancelled before text extraction
+            events.put_nowait(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run_pipeline())
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield item
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/format/download/{token}")
+async def download_result(token: str):
+    """Fetch a .docx produced by /format/stream while its token is still valid."""
+    stored = await io_executor.run(result_store.get, token)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired.")
+    return _attachment_response(stored.content, stored.filename)
+
+
+@router.get("/profiles/{request_id}")
+async def download_profile(request_id: str, x_profile_token: str | None = Header(None)):
+    """Operator-only: a stored request profile (.pstats or collapsed stacks)."""
+    # Same 404 for a bad token as for a missing profile: nothing to probe.
+    path = find_artifact(settings.profiling_dir, request_id) if token_matches(x_profile_token, settings.profiling_token) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.rsplit("/", 1)[-1])
+
+
+def _job_status(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job.id,
+        status=job.status,
+        template_type=job.template_type,
+        status_url=f"/api/jobs/{job.id}",
+        result_url=f"/api/jobs/{job.id}/result",
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error_status=job.error_status,
+        error_detail=job.error_detail,
+    )
+
+
+def _require_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+
+@router.post("/jobs", status_code=202, response_model=JobStatusResponse)
+async def create_job(
+    file: UploadFile = File(...),
+    template_type: str = Form(...),
+):
+    """Queue a format job and return immediately; poll the status URL."""
+    template_info = _require_template(template_type)
+    upload = await _read_upload(file)
+    try:
+        job = job_manager.submit(
+            template_type,
+            _output_filename(template_type),
+            lambda: _format_upload(template_info, template_type, upload),
+        )
+    except QueueFullError:
+        upload.close()
+        raise HTTPException(
+            status_code=503,
+            detail="Too many queued jobs. Try again shortly.",
+            headers={"Retry-After": "30"},
+        )
+    return _job_status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    return _job_status(_require_job(job_id))
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """The finished .docx; 409 while the job is still queued or running."""
+    job = _require_job(job_id)
+    if job.status == FAILED:
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error_detail)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    stored = await io_executor.run(job_manager.store.get, job.id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired.")
+    return _attachment_response(stored.content, stored.filename)
+
+
+def _batch_entry_name(index: int, filename: str, template_type: str) -> str:
+    stem = filename.rsplit(".", 1)[0] or "upload"
+    stem = "".join(c if c.isalnum() or c in "-_" else "_" for c in stem)
+    return f"{index + 1:03d}_{stem}_{template_type}.docx"
+
+
+@router.post("/batch")
+async def format_batch(
+    files: list[UploadFile] = File(...),
+    template_types: list[str] = Form(...),
+):
+    """
+    Format many uploads in one request and stream back a .zip.
+
+    Pass one `template_types` value per file, or a single value for all. Files
+    run through the normal pipeline concurrently (BATCH_CONCURRENCY at a time)
+    and each is added to the zip as soon as it finishes. A per-file failure
+    doesn't fail the batch: it is recorded in the zip's manifest.json, which
+    lists every file's status, output name and stage timings.
+    """
+    if len(files) > settings.batch_max_files:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files. Maximum per batch: {settings.batch_max_files}.",
+        )
+    if len(template_types) == 1:
+        template_types = template_types * len(files)
+    if len(template_types) != len(files):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide one template_types value per file, or a single value for all files.",
+        )
+    infos = [_require_template(t) for t in template_types]
+
+    # Read every upload before streaming starts: the request body (and with it
+    # the UploadFile objects) is not usable once the response is under way.
+    # Each file is capped on its own, and together they may hold at most
+    # batch_max_total_bytes until their results are written.
+    manifest: list[dict] = []
+    uploads: list[Upload | None] = []
+    total_bytes = 0
+    try:
+        for index, (file, template_type) in enumerate(zip(files, template_types)):
+            entry = {"index": index, "filename": file.filename or "upload", "template_type": template_type}
+            t0 = time.perf_counter()
+            try:
+                upload = await _read_upload(file)
+            except HTTPException as e:
+                upload = None
+                entry.update(status="error", status_code=e.status_code, detail=e.detail)
+            uploads.append(upload)
+            entry["timings"] = {"upload_read_ms": _ms_since(t0)}
+            manifest.append(entry)
+            total_bytes += upload.size if upload is not None else 0
+            if total_bytes > settings.batch_max_total_bytes:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Batch too large. Maximum total size: {settings.batch_max_total_bytes // (1024 * 1024)} MB.",
+                )
+    except BaseException:
+        for upload in uploads:
+            if upload is not None:
+                upload.close()
+        raise
+
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def run_one(index: int) -> tuple[int, bytes | None]:
+        entry = manifest[index]
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                output = await _format_upload(infos[index], entry["template_type"], uploads[index], entry["timings"])
+                entry.update(status="ok", output=_batch_entry_name(index, entry["filename"], entry["template_type"]))
+                return index, output
+            except HTTPException as e:
+                entry.update(status="error", status_code=e.status_code, detail=e.detail)
+                return index, None
+            finally:
+                uploads[index] = None
+                entry["timings"]["total_ms"] = entry["timings"]["upload_read_ms"] + _ms_since(t0)
+
+    async def zip_stream():
+        sink = _ChunkSink()
+        tasks = [asyncio.create_task(run_one(i)) for i, data in enumerate(uploads) if data is not None]
+        try:
+            with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+                for next_done in asyncio.as_completed(tasks):
+                    index, output = await next_done
+                    if output is not None:
+                        zf.writestr(manifest[index]["output"], output)
+                        yield sink.drain()
+                zf.writestr("manifest.json", json.dumps({"files": manifest}, indent=2))
+            yield sink.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for upload in uploads:  # files whose task never started
+                if upload is not None:
+                    upload.close()
+
+    return StreamingResponse(
+        zip_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="batch_formatted.zip"'},
+    )
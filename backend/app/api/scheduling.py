@@ -0,0 +1,40 @@
+"""
+Shortest-job-first ordering for the template fill stage.
+
+Fills run on settings.fill_threads threads; without ordering, a burst of small deviation
+reports queues behind a 60-page General Document whose repeatable blocks take
+far longer to render. Fills take a slot from `fill_limiter`, where waiters
+are ordered by expected duration and aged (settings.scheduler_aging_per_second)
+so a large fill is delayed, never starved. Model calls are ordered the same
+way by their own limiter (see ai_extractor.model_limiter).
+"""
+
+from app.config import settings
+from app.extraction.concurrency import PriorityLimiter
+from app.models.template_registry import TemplateInfo
+
+# Rough rendering throughput: characters of field content per second, and
+# the extra work of cloning repeatable blocks in structured templates.
+FILL_CHARS_PER_SECOND = 500_000
+STRUCTURED_FILL_FACTOR = 3
+
+# One slot per fill thread, so fills wait here (in order) rather than in the executor.
+fill_limiter = PriorityLimiter(settings.fill_threads, aging=settings.scheduler_aging_per_second)
+
+
+def _content_chars(value) -> int:
+    if isinstance(value, dict):
+        return sum(len(k) + _content_chars(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sum(_content_chars(v) for v in value)
+    return len(str(value)) if value is not None else 0
+
+
+def fill_seconds(template_info: TemplateInfo, fields: dict) -> float:
+    """Expected duration of filling `template_info` with `fields`."""
+    seconds = _content_chars(fields) / FILL_CHARS_PER_SECOND
+    return seconds * STRUCTURED_FILL_FACTOR if template_info.structured else seconds
+
+
+def fill_priority(template_info: TemplateInfo, fields: dict) -> float:
+    return fill_seconds(template_info, fields) if settings.scheduler_sjf else 0.0
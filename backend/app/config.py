@@ -9,6 +9,159 @@ class Settings(BaseSettings):
     # Comma-separated list of allowed frontend origins for CORS. Supports the
     # site's multiple domains (e.g. the custom domain + the default Vercel URL).
     frontend_url: str = "http://localhost:3000"
+    # How long a finished .docx stays downloadable by token or job id.
+    result_ttl_seconds: int = 600
+    # Where finished documents are kept: "memory" or "sqlite" (a local file at
+    # result_store_path, which survives restarts).
+    result_store: str = "memory"
+    result_store_path: str = "results.sqlite3"
+    # Background job API: concurrent pipeline workers and queued-job capacity.
+    job_workers: int = 4
+    job_queue_size: int = 100
+    # Batch endpoint: most files per request, most bytes across all of its
+    # files (every upload is received before the zip starts streaming), and
+    # how many run at once.
+    batch_max_files: int = 50
+    batch_max_total_bytes: int = 100 * 1024 * 1024
+    batch_concurrency: int = 4
+    # Most model calls in flight at once across the process. When saturated,
+    # waiting calls are served by template priority (lower value first;
+    # templates not listed get 1), FIFO within a priority. With scheduler_sjf
+    # the call's expected duration in seconds is added (see below).
+    model_max_concurrency: int = 8
+    model_priorities: dict[str, int] = {"deviation": 0, "capa": 0, "training": 0, "general": 2}
+    # Model-call resilience: retryable failures (timeouts, 429, 5xx, overload)
+    # are retried with jittered exponential backoff. Each attempt has its own
+    # deadline, all attempts share the total budget.
+    model_max_attempts: int = 3
+    model_attempt_timeout_seconds: float = 90.0
+    model_total_timeout_seconds: float = 180.0
+    model_backoff_base_seconds: float = 1.0
+    model_backoff_max_seconds: float = 20.0
+    # Hedging: when an attempt outlasts the template's recent p95 latency (and
+    # at least the minimum delay), fire a duplicate and keep the first success.
+    model_hedging: bool = False
+    model_hedge_min_delay_seconds: float = 10.0
+    # Routing: size the output budget from the estimated answer length
+    # (times the safety factor, floored, never above the template's
+    # max_tokens). A truncated answer is retried once with the full budget.
+    adaptive_max_tokens: bool = True
+    max_tokens_floor: int = 2048
+    max_tokens_safety_factor: float = 1.5
+    # Optional faster model for small flat (non-structured) documents; empty
+    # disables the fast tier.
+    fast_model: str = ""
+    fast_model_max_input_tokens: int = 3000
+    # Ask the model for non-empty fields only; missing keys are back-filled
+    # with "". Should cut output tokens on wide templates, but stays off until
+    # recorded responses (benchmarks/sparse_output.py) confirm the savings
+    # without losing fields.
+    sparse_output: bool = False
+    # Relevance pre-filter for flat templates: documents longer than
+    # prefilter_min_chars are cut to about prefilter_target_chars by dropping
+    # the passages least related to the template. The first
+    # prefilter_head_chars are always kept. Lossy, so off until its effect on
+    # extraction quality has been measured.
+    prefilter_enabled: bool = False
+    prefilter_min_chars: int = 30000
+    prefilter_target_chars: int = 30000
+    prefilter_head_chars: int = 3000
+    # PDF extraction: stop after pdf_max_pages pages or pdf_max_chars
+    # characters (0 = unlimited). Lines repeated at the top/bottom of most
+    # pages (running headers/footers) are dropped when
+    # pdf_strip_repeated_lines. PDFs of at least pdf_parallel_min_pages are
+    # split into pdf_pages_per_shard-page shards across pdf_workers processes
+    # (0 = one per CPU), but only where PDFs are parsed in the API process:
+    # with sandbox_enabled (the default) each PDF is parsed serially inside
+    # one sandbox worker, and the sharding settings have no effect. There,
+    # parallelism comes from sandbox_workers parsing separate uploads.
+    pdf_max_pages: int = 0
+    pdf_max_chars: int = 0
+    pdf_workers: int = 0
+    pdf_pages_per_shard: int = 25
+    pdf_parallel_min_pages: int = 50
+    pdf_strip_repeated_lines: bool = True
+    # Uploads larger than upload_spool_threshold_bytes are spooled to a temp
+    # file (in upload_spool_dir, default the system temp dir) instead of
+    # being held in memory.
+    upload_spool_threshold_bytes: int = 1024 * 1024
+    upload_spool_dir: str = ""
+    # Extracted-text cache keyed by upload hash and extractor version: up to
+    # text_cache_max_chars of text in memory (0 = no memory tier). With
+    # text_cache_path set, entries are also kept in that SQLite file (at most
+    # text_cache_disk_max_entries, least recently used pruned first).
+    text_cache_max_chars: int = 20_000_000
+    text_cache_path: str = ""
+    text_cache_disk_max_entries: int = 10000
+    # .docx uploads: stop inflating once the text parts exceed
+    # docx_max_uncompressed_mb in total, or a part inflates to more than
+    # docx_max_compression_ratio times its compressed size (zip bombs).
+    docx_max_uncompressed_mb: int = 100
+    docx_max_compression_ratio: int = 200
+    # Span export for request traces: "" (off; Server-Timing headers are
+    # still sent), "jsonl" (append to tracing_jsonl_path) or "otlp" (OTLP/HTTP
+    # JSON to tracing_otlp_endpoint).
+    tracing_export: str = ""
+    tracing_jsonl_path: str = "spans.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    # On-demand request profiling for operators: a request sending this token
+    # in the X-Profile-Token header is profiled ("cprofile" or "sample";
+    # cprofile falls back to sampling on Python 3.12+) and the artifact stored
+    # in profiling_dir. Empty disables it.
+    profiling_token: str = ""
+    profiling_mode: str = "cprofile"
+    profiling_dir: str = "profiles"
+    # Upload parsing runs in sandboxed worker processes: at most
+    # sandbox_workers at once, each job limited to sandbox_cpu_seconds of CPU
+    # and sandbox_timeout_seconds of wall time, each worker to
+    # sandbox_memory_mb of address space and recycled after
+    # sandbox_max_jobs_per_worker jobs.
+    sandbox_enabled: bool = True
+    sandbox_workers: int = 4
+    sandbox_cpu_seconds: int = 30
+    sandbox_timeout_seconds: float = 60.0
+    sandbox_memory_mb: int = 1024
+    sandbox_max_jobs_per_worker: int = 50
+    # Admission control for /format, /format/stream, /extract and /fill: refuse with
+    # 429 + Retry-After while admission_max_inflight of them are in flight,
+    # admission_max_threadpool_waiting tasks are queued for a thread, or a new
+    # model call would wait longer than admission_max_model_wait_seconds.
+    admission_enabled: bool = True
+    admission_max_inflight: int = 32
+    admission_max_threadpool_waiting: int = 64
+    admission_max_model_wait_seconds: float = 30.0
+    # Shortest-job-first: queued model calls and template fills are ordered by
+    # their expected duration in seconds (estimated from the document text
+    # and the template's shape), and a waiter's value drops by
+    # scheduler_aging_per_second for every second it waits, so a long job
+    # queues at most about its own expected duration longer than short ones.
+    scheduler_sjf: bool = True
+    scheduler_aging_per_second: float = 1.0
+    # Blocking work runs on per-stage thread budgets, so one stage can't
+    # starve another: extract_text_threads parse uploads (each waits on a
+    # sandbox worker, see above), fill_threads render .docx output (fills
+    # beyond that queue shortest-first), io_threads spool uploads to disk and
+    # write profiles.
+    extract_text_threads: int = 8
+    fill_threads: int = 4
+    io_threads: int = 4
+    # /format and /extract give up (504) after request_timeout_seconds (0 =
+    # no deadline); model retries are cut short to fit. Work for a client
+    # that has disconnected is cancelled between and during stages.
+    request_timeout_seconds: float = 300.0
+    # /format requests sent with an Idempotency-Key: the finished .docx is
+    # kept in memory for idempotency_ttl_seconds (at most
+    # idempotency_max_entries, oldest evicted first) and replayed to retries.
+    # A keyed run keeps going for idempotency_linger_seconds after its client
+    # disconnects (never past request_timeout_seconds), so the retry finds it.
+    idempotency_ttl_seconds: int = 3600
+    idempotency_max_entries: int = 128
+    idempotency_linger_seconds: float = 60.0
+    # Warm-up at start-up (templates, PyMuPDF, sandbox workers, model client,
+    # and with warmup_dry_run_fill an empty fill of every template). /ready
+    # answers 503 until it has finished; with warm-up off it is ready at once.
+    warmup_enabled: bool = True
+    warmup_dry_run_fill: bool = True
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
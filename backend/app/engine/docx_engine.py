@@ -6,13 +6,16 @@ replaces them with provided values, strips template styling,
 repacks, and validates.
 """
 
+import functools
 import io
+import os
 import re
 import zipfile
 from copy import deepcopy
 
 from lxml import etree
 
+from app.observability.tracing import child_span as span
 from .xml_utils import (
     BODY,
     CONTENT_PARTS,
@@ -58,37 +61,66 @@ def fill_template(
     Returns:
         Bytes of the completed .docx file.
     """
-    with open(template_path, "rb") as f:
-        template_bytes = f.read()
-
     # Escape XML entities in all values. Newlines are preserved here (no longer
     # collapsed to spaces) so _split_paragraphs can render them as real
     # paragraph breaks after substitution.
     safe_values = {k: escape_xml(v) for k, v in values.items()}
 
-    parts = _unpack(template_bytes)
+    with span("fill.unpack") as sp:
+        template_bytes, parts = load_template(template_path)
+        sp.set(bytes=len(template_bytes))
     modified_parts: dict[str, bytes] = {}
 
     for part_name in CONTENT_PARTS:
         if part_name not in parts:
             continue
 
-        tree = secure_fromstring(parts[part_name])
-        # Clone repeatable blocks before anything else so the rest of the
-        # pipeline (merge/fill/split/prune) treats them like normal content.
-        if structured is not None and part_name == "word/document.xml":
-            _expand_general(tree, structured)
-        _merge_runs(tree)
-        _fill_placeholders(tree, safe_values)
-        _split_paragraphs(tree)
-        _prune_empty_blocks(tree)
-        modified_parts[part_name] = etree.tostring(tree, xml_declaration=True, encoding="UTF-8", standalone=True)
-
-    output = _repack(template_bytes, modified_parts)
-    _validate(output, safe_values)
+        with span("fill.part", part=part_name):
+            tree = secure_fromstring(parts[part_name])
+            # Clone repeatable blocks before anything else so the rest of the
+            # pipeline (merge/fill/split/prune) treats them like normal content.
+            if structured is not None and part_name == "word/document.xml":
+                _expand_general(tree, structured)
+            _merge_runs(tree)
+            _fill_placeholders(tree, safe_values)
+            _split_paragraphs(tree)
+            _prune_empty_blocks(tree)
+            modified_parts[part_name] = etree.tostring(tree, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    with span("fill.repack"):
+        output = _repack(template_bytes, modified_parts)
+    with span("fill.validate", bytes=len(output)):
+        _validate(output, safe_values)
     return output
 
 
+def load_template(template_path: str) -> tuple[bytes, dict[str, bytes]]:
+    """
+    A template's bytes and unpacked parts, read once and reused until the
+    file changes. Callers must not modify the returned parts.
+    """
+    return _load_template(str(template_path), os.stat(template_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _load_template(template_path: str, mtime_ns: int) -> tuple[bytes, dict[str, bytes]]:
+    with open(template_path, "rb") as f:
+        template_bytes = f.read()
+    return template_bytes, _unpack(template_bytes)
+
+
+def preload_template(template_path: str) -> int:
+    """Load and parse a template ahead of its first fill; returns the placeholders found."""
+    _, parts = load_template(template_path)
+    found = set()
+    for part_name in CONTENT_PARTS:
+        if part_name in parts:
+            tree = secure_fromstring(parts[part_name])
+            for t_elem in tree.iter(T):
+                found.update(PLACEHOLDER_RE.findall(t_elem.text or ""))
+    return len(found)
+
+
 def _unpack(docx_bytes: bytes) -> dict[str, bytes]:
     """Extract all files from a .docx ZIP archive."""
     parts = {}
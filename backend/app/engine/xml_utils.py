@@ -34,6 +34,7 @@ B = tag("b")       # <w:b> — bold
 P = tag("p")          # <w:p> — paragraph
 TBL = tag("tbl")      # <w:tbl> — table
 TR = tag("tr")        # <w:tr> — table row
+TC = tag("tc")        # <w:tc> — table cell
 BODY = tag("body")    # <w:body> — document body
 PPR = tag("pPr")      # <w:pPr> — paragraph properties
 PSTYLE = tag("pStyle")  # <w:pStyle> — paragraph style ref
@@ -41,6 +42,9 @@ NUMPR = tag("numPr")  # <w:numPr> — numbering properties (auto-numbered headin
 VAL = tag("val")      # the w:val attribute
 FLDCHAR = tag("fldChar")      # <w:fldChar> — Word field boundary (begin/separate/end)
 INSTRTEXT = tag("instrText")  # <w:instrText> — Word field instruction (PAGE, NUMPAGES, ...)
+TAB = tag("tab")      # <w:tab> — tab character inside a run
+BR = tag("br")        # <w:br> — line/page break inside a run
+CR = tag("cr")        # <w:cr> — carriage return inside a run
 
 # The xml:space attribute (not in the wordprocessingml namespace)
 XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
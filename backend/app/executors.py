@@ -0,0 +1,65 @@
+"""
+Per-stage executors for blocking work.
+
+With Starlette's run_in_threadpool, every stage shares one limiter, and a
+flood of big PDF extractions can hold every thread while fills queue behind
+them (and vice versa). Instead each blocking stage has its own thread
+budget, sized in settings and reported on /metrics, so parsing and rendering
+capacity can be tuned separately. Threads come from anyio's worker cache;
+the context (spans, profiling session, metric labels) is copied into the
+worker as with run_in_threadpool, and a call still waiting for one of its
+stage's threads is dropped if the caller is cancelled.
+
+The executors sit outside app.api so the extraction, jobs and storage layers
+can use them without depending on the web layer.
+"""
+
+import asyncio
+from typing import Callable, TypeVar
+
+import anyio
+import anyio.to_thread
+
+from app.config import settings
+
+T = TypeVar("T")
+
+
+class StageExecutor:
+    def __init__(self, name: str, threads: int):
+        self.name = name
+        self.threads = threads
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._limiter: anyio.CapacityLimiter | None = None
+
+    def _current_limiter(self) -> anyio.CapacityLimiter:
+        # Limiters belong to one event loop; a new loop (server restart
+        # in-process, a test client) gets a fresh one.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._limiter = anyio.CapacityLimiter(self.threads)
+        return self._limiter
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Call `fn(*args)` on a worker thread once one of this stage's threads is free."""
+        return await anyio.to_thread.run_sync(fn, *args, limiter=self._current_limiter())
+
+    @property
+    def busy(self) -> int:
+        return self._limiter.statistics().borrowed_tokens if self._limiter is not None else 0
+
+    @property
+    def waiting(self) -> int:
+        return self._limiter.statistics().tasks_waiting if self._limiter is not None else 0
+
+    @property
+    def utilization(self) -> float:
+        return self.busy / self.threads
+
+
+extract_text_executor = StageExecutor("extract_text", settings.extract_text_threads)
+fill_executor = StageExecutor("fill_template", settings.fill_threads)
+io_executor = StageExecutor("io", settings.io_threads)
+
+executors = (extract_text_executor, fill_executor, io_executor)
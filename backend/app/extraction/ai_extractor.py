@@ -5,45 +5,243 @@ Sends document text to Claude with a template-specific prompt,
 parses the JSON response, and returns a dict of placeholder values.
 """
 
+import asyncio
+import copy
+import hashlib
 import json
-
-import anthropic
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
 
 from app.config import settings
+from app.executors import extract_text_executor
 from app.models.template_registry import get_template
+from app.observability.metrics import model_calls_coalesced_total, record_usage
+from app.observability.profiling import profiled
+from .concurrency import PriorityLimiter, SingleFlight
+from .resilience import LatencyTracker, RetryPolicy, call_with_retries
+from .routing import estimate_seconds, route
 from .prompts import SYSTEM_PROMPT, build_extraction_prompt
+from .relevance import prefilter
+
+if TYPE_CHECKING:
+    import anthropic
+
+logger = logging.getLogger(__name__)
+
+# A top-level JSON key as it appears in the streamed response, e.g. `"SCOPE":`.
+_KEY_RE = re.compile(r'"([A-Za-z][A-Za-z0-9_]*)"\s*:')
+
+# Bounds concurrent model calls process-wide; waiters are served by template
+# priority (settings.model_priorities, lower first) plus, with
+# settings.scheduler_sjf, the call's expected duration, aged by waiting time.
+model_limiter = PriorityLimiter(settings.model_max_concurrency, aging=settings.scheduler_aging_per_second)
+# Concurrent requests for the same (text, template, model) share one call.
+_inflight = SingleFlight()
+# Recent successful call latency per template, for the hedging delay.
+_latency: dict[str, LatencyTracker] = {}
+# The same across all templates, read by admission control.
+model_latency = LatencyTracker(min_samples=5)
+
+
+_client: "tuple[tuple, anthropic.AsyncAnthropic] | None" = None
+
+
+def get_client() -> "anthropic.AsyncAnthropic":
+    """
+    The model client for the running event loop, built once and reused so
+    calls share its connection pool. The resilience layer owns retries and
+    per-attempt deadlines, so the SDK's own retry loop is disabled.
+    """
+    # The SDK takes longer to import than the rest of the app together, so it
+    # is loaded with the first client rather than at import time.
+    import anthropic
+
+    global _client
+    key = (
+        asyncio.get_running_loop(),  # the client's connections belong to one loop
+        anthropic.AsyncAnthropic,
+        settings.anthropic_api_key,
+        settings.model_attempt_timeout_seconds,
+    )
+    if _client is None or _client[0] != key:
+        client = anthropic.AsyncAnthropic(
+            api_key=settings.anthropic_api_key,
+            timeout=settings.model_attempt_timeout_seconds,
+            max_retries=0,
+        )
+        _client = (key, client)
+    return _client[1]
+
+
+def _retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=settings.model_max_attempts,
+        attempt_timeout=settings.model_attempt_timeout_seconds,
+        total_timeout=settings.model_total_timeout_seconds,
+        backoff_base=settings.model_backoff_base_seconds,
+        backoff_max=settings.model_backoff_max_seconds,
+    )
+
+
+def _hedge_delay(latency: LatencyTracker, streaming: bool) -> float | None:
+    """
+    When to fire a hedged second request, or None for no hedging. Streamed
+    calls are never hedged: two streams would interleave progress reports.
+    """
+    if not settings.model_hedging or streaming:
+        return None
+    p95 = latency.percentile(0.95)
+    if p95 is None:
+        return None  # not enough history yet to know what "slow" means
+    return max(settings.model_hedge_min_delay_seconds, p95)
+
+
+@dataclass
+class ModelCallStats:
+    """How the current request's model call was scheduled."""
+
+    queue_wait_ms: int = 0
+    coalesced: bool = False
+    attempts: int = 0
+    model: str = ""
+    prefilter_saved_tokens: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+_call_stats: ContextVar[ModelCallStats | None] = ContextVar("model_call_stats", default=None)
+
 
+def track_model_call() -> ModelCallStats:
+    """Start recording scheduling stats for the next extract_fields call in this context."""
+    stats = ModelCallStats()
+    _call_stats.set(stats)
+    return stats
 
-async def extract_fields(template_type: str, document_text: str) -> dict[str, str]:
+
+async def extract_fields(
+    template_type: str,
+    document_text: str,
+    on_progress: Callable[[int], None] | None = None,
+) -> dict[str, str]:
     """
     Use Claude to extract structured fields from document text.
 
     Args:
         template_type: One of the registered template types (sop, deviation, etc.)
         document_text: Plain text content of the uploaded document.
+        on_progress: Optional callback. When given, the response is streamed
+            and the callback receives the number of template fields seen so far
+            each time that number grows.
 
     Returns:
         Dict mapping placeholder keys to extracted values.
     """
     template_info = get_template(template_type)
+    stats = _call_stats.get() or ModelCallStats()
+
+    prompt_text = document_text
+    # The General Document re-expresses the whole source, so it is never filtered.
+    # Scoring a long document is CPU-bound, so it runs on a text-stage thread;
+    # shorter ones are returned untouched and skip the hop.
+    if (
+        settings.prefilter_enabled
+        and not template_info.structured
+        and len(document_text) > settings.prefilter_min_chars
+    ):
+        prompt_text, report = await extract_text_executor.run(
+            profiled(prefilter),
+            template_type,
+            document_text,
+            settings.prefilter_min_chars,
+            settings.prefilter_target_chars,
+            settings.prefilter_head_chars,
+        )
+        if report is not None:
+            stats.prefilter_saved_tokens = report.saved_tokens
+            logger.info(
+                "prefilter template=%s kept %d/%d passages, input tokens ~%d -> ~%d (saved ~%d)",
+                template_type, report.passages_kept, report.passages_total,
+                report.original_tokens, report.kept_tokens, report.saved_tokens,
+            )
 
     prompt = build_extraction_prompt(
         template_type=template_type,
         placeholders=template_info.placeholders,
-        document_text=document_text,
+        document_text=prompt_text,
+        sparse=settings.sparse_output,
     )
+    decision = route(template_type, template_info, prompt)
+    stats.model = decision.model
 
-    client = anthropic.AsyncAnthropic(
-        api_key=settings.anthropic_api_key,
-        timeout=120.0,
+    key = (
+        hashlib.sha256(document_text.encode("utf-8")).hexdigest(),
+        template_type,
+        decision.model,
     )
-
-    message = await client.messages.create(
-        model=settings.anthropic_model,
-        max_tokens=template_info.max_tokens,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": prompt}],
+    result, stats.coalesced = await _inflight.do(
+        key, lambda: _extract_once(template_type, template_info, prompt, decision, on_progress, stats)
     )
+    if stats.coalesced:
+        model_calls_coalesced_total.inc(model=decision.model, template=template_type)
+    logger.info(
+        "model call template=%s model=%s queue_wait_ms=%d coalesced=%s attempts=%d",
+        template_type, stats.model, stats.queue_wait_ms, stats.coalesced, stats.attempts,
+    )
+    # Coalesced callers share one result; hand each its own copy.
+    return copy.deepcopy(result) if stats.coalesced else result
+
+
+async def _extract_once(template_type, template_info, prompt, decision, on_progress, stats) -> dict:
+    """One model call (with retries) + parse, run under the global limiter."""
+    client = get_client()
+
+    request = {
+        "model": decision.model,
+        "max_tokens": decision.max_tokens,
+        "system": SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    priority = settings.model_priorities.get(template_type, 1)
+    if settings.scheduler_sjf:
+        priority += estimate_seconds(decision)
+    latency = _latency.setdefault(template_type, LatencyTracker())
+
+    async def attempt():
+        queued_at = time.perf_counter()
+        async with model_limiter.slot(priority):
+            started = time.perf_counter()
+            stats.queue_wait_ms += round((started - queued_at) * 1000)
+            stats.attempts += 1
+            if on_progress is None:
+                message = await client.messages.create(**request)
+            else:
+                message = await _stream_message(client, request, _top_level_keys(template_info), on_progress)
+        latency.record(time.perf_counter() - started)
+        model_latency.record(time.perf_counter() - started)
+        usage = getattr(message, "usage", None)
+        record_usage(request["model"], template_type, usage)
+        if usage is not None:
+            stats.input_tokens += usage.input_tokens or 0
+            stats.output_tokens += usage.output_tokens or 0
+        return message
+
+    hedge_delay = _hedge_delay(latency, streaming=on_progress is not None)
+    message = await call_with_retries(attempt, _retry_policy(), hedge_delay)
+
+    # An adaptive budget can undershoot; retry once with the template's full
+    # budget before reporting truncation.
+    if message.stop_reason == "max_tokens" and request["max_tokens"] < template_info.max_tokens:
+        logger.warning(
+            "adaptive max_tokens=%d truncated template=%s; retrying with %d",
+            request["max_tokens"], template_type, template_info.max_tokens,
+        )
+        request["max_tokens"] = template_info.max_tokens
+        message = await call_with_retries(attempt, _retry_policy(), hedge_delay)
 
     # If the model ran out of output budget the JSON is truncated; fail with a
     # clear message instead of a confusing JSONDecodeError downstream.
@@ -73,10 +271,21 @@ async def extract_fields(template_type: str, document_text: str) -> dict[str, st
     except json.JSONDecodeError as e:
         raise ValueError(f"AI returned invalid JSON: {e}\nResponse: {response_text[:500]}")
 
+    return normalize_fields(template_info, extracted)
+
+
+def normalize_fields(template_info, extracted) -> dict:
+    """
+    Coerce extracted (or client-supplied) fields into the shape the fill step
+    expects: the structured General Document shape, or every flat placeholder
+    present as a string.
+    """
     if template_info.structured:
         return _normalize_general(extracted)
 
     # Flat templates: ensure all expected keys exist, fill missing with ""
+    if not isinstance(extracted, dict):
+        extracted = {}
     result = {}
     for key in template_info.placeholders:
         val = extracted.get(key, "")
@@ -85,6 +294,37 @@ async def extract_fields(template_type: str, document_text: str) -> dict[str, st
     return result
 
 
+def _top_level_keys(template_info) -> set[str]:
+    """Keys whose appearance in the stream counts as one received field."""
+    if template_info.structured:
+        from .prompts import GENERAL_LIST_KEYS, GENERAL_SCALAR_KEYS
+
+        return set(GENERAL_SCALAR_KEYS) | set(GENERAL_LIST_KEYS)
+    return set(template_info.placeholders)
+
+
+async def _stream_message(client, request: dict, keys: set[str], on_progress: Callable[[int], None]):
+    """
+    Stream the response, reporting how many expected keys have appeared.
+
+    Only the tail of the accumulated text is rescanned per chunk (with a small
+    overlap so a key split across two chunks is still found).
+    """
+    seen: set[str] = set()
+    text = ""
+    async with client.messages.stream(**request) as stream:
+        async for chunk in stream.text_stream:
+            scan_from = max(0, len(text) - 64)
+            text += chunk
+            before = len(seen)
+            for m in _KEY_RE.finditer(text, scan_from):
+                if m.group(1) in keys:
+                    seen.add(m.group(1))
+            if len(seen) > before:
+                on_progress(len(seen))
+        return await stream.get_final_message()
+
+
 def _s(value) -> str:
     """Coerce any extracted scalar to a clean string."""
     return str(value) if value not in (None,) else ""
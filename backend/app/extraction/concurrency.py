@@ -0,0 +1,128 @@
+"""
+Concurrency primitives for model calls.
+
+`PriorityLimiter` bounds how many calls are in flight and decides who goes
+next when a slot frees up. `SingleFlight` lets concurrent callers asking for
+the same thing share one in-flight call instead of each making their own.
+"""
+
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class PriorityLimiter:
+    """
+    A semaphore whose waiters are served lowest-priority-value first (FIFO
+    among equals). A released slot is handed directly to the next waiter, so a
+    newcomer can never jump a queue that is already forming.
+
+    With `aging`, a waiter's priority value drops by `aging` for every second
+    it has waited, so a steady stream of small (low-value) work can delay a
+    large job but never starve it.
+    """
+
+    def __init__(self, limit: int, aging: float = 0.0):
+        self.limit = limit
+        self.aging = aging
+        self._active = 0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: float = 0):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: float) -> None:
+        if self._active < self.limit and not self.waiting:
+            self._active += 1
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # Every waiter ages at the same rate, so ordering by the value at
+        # enqueue time plus aging * enqueue time equals ordering by current
+        # aged value, and the heap never needs re-sorting.
+        key = priority + self.aging * loop.time()
+        heapq.heappush(self._waiters, (key, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # If the slot was handed to us just as we were cancelled, pass it on.
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # slot transfers; _active is unchanged
+                return
+        self._active -= 1
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key; all callers get the same outcome."""
+
+    def __init__(self, linger: float = 0.0):
+        # Seconds a call keeps running once its last caller has gone, in case
+        # another caller attaches (0 = cancel it at once).
+        self.linger = linger
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._callers: dict[asyncio.Task, int] = {}
+        self._orphaned: dict[asyncio.Task, asyncio.TimerHandle] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Run `fn` (or join the call already running for `key`).
+
+        Returns the result and whether it was shared from another caller. The
+        call is shielded so one caller going away doesn't fail the others;
+        once every caller has gone away (and nobody attached within `linger`
+        seconds) it is cancelled, since nobody is left to use its result.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def forget(done: asyncio.Task) -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                handle = self._orphaned.pop(done, None)
+                if handle is not None:
+                    handle.cancel()
+
+            task.add_done_callback(forget)
+
+        handle = self._orphaned.pop(task, None)
+        if handle is not None:
+            handle.cancel()
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+                if not task.done():
+                    if self.linger > 0:
+                        self._orphaned[task] = asyncio.get_running_loop().call_later(self.linger, task.cancel)
+                    else:
+                        task.cancel()
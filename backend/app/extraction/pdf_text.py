@@ -0,0 +1,162 @@
+"""
+Page-bounded, optionally parallel PDF text extraction.
+
+Large PDFs are split into page-range shards that worker processes extract
+independently (each opens the PDF from its path, or its own copy of the bytes), so
+extraction time scales with cores rather than page count. Extraction stops
+early once the page cap or character budget is reached, and lines repeated at
+the top or bottom of most pages (running headers, "Page 3 of 300" footers)
+can be dropped before the text reaches the prompt.
+
+Sharding only happens where PDFs are parsed in the API process (sandbox
+disabled, or a profiled request): sandbox workers parse serially (see
+sandbox.py).
+"""
+
+import multiprocessing
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+# Lines within this many non-empty lines of a page's top or bottom are
+# header/footer candidates.
+EDGE_LINES = 2
+# A candidate repeated on at least this share of pages is treated as a
+# running header/footer.
+REPEAT_RATIO = 0.5
+_DIGITS_RE = re.compile(r"\d+")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PdfOptions:
+    max_pages: int = 0  # 0 = no cap
+    max_chars: int = 0  # 0 = no budget
+    workers: int = 1
+    pages_per_shard: int = 25
+    parallel_min_pages: int = 50
+    strip_repeated_lines: bool = True
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process is multi-threaded.
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _open(source: bytes | str):
+    """Open a PDF from its bytes or a file path."""
+    import fitz  # PyMuPDF
+
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def page_count(source: bytes | str) -> int:
+    with _open(source) as doc:
+        return doc.page_count
+
+
+def extract_pages(source: bytes | str, start: int, stop: int, max_chars: int = 0) -> list[str]:
+    """Text of pages [start, stop), stopping once `max_chars` is reached."""
+    pages = []
+    total = 0
+    with _open(source) as doc:
+        for number in range(start, min(stop, doc.page_count)):
+            text = doc[number].get_text()
+            pages.append(text)
+            total += len(text)
+            if max_chars and total >= max_chars:
+                break
+    return pages
+
+
+def _extract_parallel(source: bytes | str, pages: int, options: PdfOptions) -> list[str]:
+    """Extract shards in worker processes, consuming results in page order."""
+    pool = _get_pool(options.workers)
+    futures = [
+        pool.submit(extract_pages, source, start, min(start + options.pages_per_shard, pages), options.max_chars)
+        for start in range(0, pages, options.pages_per_shard)
+    ]
+    out: list[str] = []
+    total = 0
+    try:
+        for future in futures:
+            for text in future.result():
+                out.append(text)
+                total += len(text)
+                if options.max_chars and total >= options.max_chars:
+                    return out
+        return out
+    finally:
+        for future in futures:
+            future.cancel()  # shards past the budget that haven't started
+
+
+def strip_repeated_lines(pages: list[str]) -> list[str]:
+    """Drop running headers/footers: edge lines repeated on most pages."""
+    if len(pages) < 3:
+        return pages
+
+    def edge_size(n: int) -> int:
+        # Short pages: never let the top and bottom edges cover the body.
+        return min(EDGE_LINES, n // 2)
+
+    def edges(lines: list[str]) -> list[str]:
+        k = edge_size(len(lines))
+        return lines[:k] + lines[len(lines) - k:]
+
+    def key(line: str) -> str:
+        return _DIGITS_RE.sub("#", line.strip())
+
+    split = [[line for line in page.splitlines() if line.strip()] for page in pages]
+    counts = Counter(k for lines in split for k in {key(line) for line in edges(lines)})
+    threshold = max(3, REPEAT_RATIO * len(pages))
+    repeated = {k for k, n in counts.items() if n >= threshold}
+    if not repeated:
+        return pages
+
+    cleaned = []
+    for lines in split:
+        n, k = len(lines), edge_size(len(lines))
+        kept = [
+            line for i, line in enumerate(lines)
+            if not ((i < k or i >= n - k) and key(line) in repeated)
+        ]
+        cleaned.append("\n".join(kept))
+    return cleaned
+
+
+def extract_pdf_text(source: bytes | str, options: PdfOptions) -> str:
+    """Text of the PDF's pages (one block per page) within `options`' limits."""
+    pages = page_count(source)
+    if options.max_pages:
+        pages = min(pages, options.max_pages)
+
+    if options.workers > 1 and pages >= options.parallel_min_pages:
+        texts = _extract_parallel(source, pages, options)
+    else:
+        texts = extract_pages(source, 0, pages, options.max_chars)
+
+    if options.strip_repeated_lines:
+        texts = strip_repeated_lines(texts)
+    text = "\n".join(texts)
+    if options.max_chars:
+        text = text[: options.max_chars]
+    return text
@@ -11,22 +11,33 @@ that maps to specific template placeholder fields.
 
 Rules:
 - Extract only what is present or clearly implied in the source document.
-- For fields with no matching content, return an empty string "".
+- For fields with no matching content, follow the prompt: return "" or omit the key.
 - Summarize or infer where the source document is incomplete but context exists.
 - Never fabricate data — especially dates, names, or IDs.
 - Keep values concise and professional.
 - Return ONLY valid JSON. No markdown, no explanation, no code fences."""
 
 
-def build_extraction_prompt(template_type: str, placeholders: list[str], document_text: str) -> str:
-    """Build the user prompt for a given template type."""
+def build_extraction_prompt(
+    template_type: str,
+    placeholders: list[str],
+    document_text: str,
+    sparse: bool = False,
+) -> str:
+    """
+    Build the user prompt for a given template type.
+
+    With `sparse=True` the model is asked to return only the keys it has
+    content for; the extractor back-fills the rest with "". On wide templates
+    most keys are usually empty, so this cuts output tokens substantially.
+    """
     prompt_fn = _TEMPLATE_PROMPTS.get(template_type)
     if prompt_fn is None:
-        return _generic_prompt(placeholders, document_text)
-    return prompt_fn(placeholders, document_text)
+        return _generic_prompt(placeholders, document_text, sparse)
+    return prompt_fn(placeholders, document_text, sparse)
 
 
-def _sop_prompt(placeholders: list[str], text: str) -> str:
+def _sop_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a Standard Operating Procedure (SOP) template.
 
 The SOP template has these sections:
@@ -41,14 +52,13 @@ The SOP template has these sections:
 - Procedure: 5 procedure steps (each with a title and detailed description)
 - Documentation requirements, training requirements, attachments
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
 
 
-def _deviation_prompt(placeholders: list[str], text: str) -> str:
+def _deviation_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a Clinical Trial Deviation Report template.
 
 The template has these sections:
@@ -61,14 +71,13 @@ The template has these sections:
 - Notifications: IRB and sponsor notification status
 - Approval: PI and QA manager names and dates
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
 
 
-def _capa_prompt(placeholders: list[str], text: str) -> str:
+def _capa_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a CAPA (Corrective and Preventive Action) Report template.
 
 The template has these sections:
@@ -81,14 +90,13 @@ The template has these sections:
 - Closure: CAPA status, date closed, closed by
 - Approval: QA manager and department head names and dates
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
 
 
-def _training_prompt(placeholders: list[str], text: str) -> str:
+def _training_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a Training Record template.
 
 The template has these sections:
@@ -98,14 +106,13 @@ The template has these sections:
 - Assessment: method, passing criteria, notes
 - Trainer sign-off: trainer name and date
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
 
 
-def _monitoring_prompt(placeholders: list[str], text: str) -> str:
+def _monitoring_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a Clinical Trial Monitoring Visit Report template.
 
 The template has these sections:
@@ -119,8 +126,7 @@ The template has these sections:
 - Next visit: date, type, focus areas
 - Sign-off: monitor and lead CRA names and dates
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
@@ -135,13 +141,28 @@ GENERAL_SCALAR_KEYS = [
     "APPENDICES",
 ]
 
+# Variable-length list fields of the General Document.
+GENERAL_LIST_KEYS = ["revisions", "abbreviations", "references", "sections"]
 
-def _general_prompt(placeholders: list[str], text: str) -> str:
-    return f"""Extract content from this document to fill a flexible General Document.
 
-Return a JSON object with EXACTLY these keys.
+_GENERAL_DENSE_HEADER = """Return a JSON object with EXACTLY these keys.
+
+Scalar fields (string values; use "" when the source has no matching content):"""
+
+_GENERAL_SPARSE_HEADER = """Return a JSON object using ONLY these keys. Omit any key, and any "title" or
+"content" field inside list items, that has no matching content.
+
+Scalar fields (string values; omit when the source has no matching content):"""
+
+_GENERAL_DENSE_EMPTY = "Use empty arrays [] for parts the source lacks (e.g. no subsections)."
 
-Scalar fields (string values; use "" when the source has no matching content):
+_GENERAL_SPARSE_EMPTY = "Omit list fields (including \"subsections\") the source lacks entirely."
+
+
+def _general_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
+    return f"""Extract content from this document to fill a flexible General Document.
+
+{_GENERAL_SPARSE_HEADER if sparse else _GENERAL_DENSE_HEADER}
   "ORGANIZATION_NAME", "DOCUMENT_TITLE", "DOCUMENT_SUBTITLE", "DOCUMENT_ID",
   "VERSION", "EFFECTIVE_DATE", "AUTHOR", "DEPARTMENT", "STATUS",
   "AUTHOR_DATE", "REVIEWER", "REVIEWER_DATE", "APPROVER", "APPROVER_DATE",
@@ -158,7 +179,7 @@ List fields (arrays — include ONE entry per real item, in source order):
 Rules:
 - Create as MANY sections / subsections / abbreviations / references / revisions
   as the source actually contains. Do not pad to a fixed count and do not drop
-  extras. Use empty arrays [] for parts the source lacks (e.g. no subsections).
+  extras. {_GENERAL_SPARSE_EMPTY if sparse else _GENERAL_DENSE_EMPTY}
 - In the "content" fields you MAY use the newline character "\n" to separate
   paragraphs — each "\n" becomes a new paragraph. Keep titles, dates, ids,
   names, terms, and definitions short and single-line (no "\n").
@@ -168,11 +189,10 @@ SOURCE DOCUMENT:
 {text}"""
 
 
-def _generic_prompt(placeholders: list[str], text: str) -> str:
+def _generic_prompt(placeholders: list[str], text: str, sparse: bool = False) -> str:
     return f"""Extract content from this document to fill a template with specific placeholder fields.
 
-Return a JSON object with these exact keys (use "" for fields with no matching content):
-{_format_keys(placeholders)}
+{_keys_instruction(placeholders, sparse)}
 
 SOURCE DOCUMENT:
 {text}"""
@@ -182,6 +202,19 @@ def _format_keys(keys: list[str]) -> str:
     return "\n".join(f'  "{k}": ""' for k in keys)
 
 
+def _keys_instruction(keys: list[str], sparse: bool) -> str:
+    if not sparse:
+        return (
+            'Return a JSON object with these exact keys (use "" for fields with no matching content):\n'
+            + _format_keys(keys)
+        )
+    return (
+        "Return a JSON object containing ONLY the keys below that have matching content.\n"
+        "Omit every key with no matching content — do not output empty strings.\n"
+        "Allowed keys: " + ", ".join(keys)
+    )
+
+
 _TEMPLATE_PROMPTS = {
     "sop": _sop_prompt,
     "deviation": _deviation_prompt,
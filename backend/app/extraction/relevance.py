@@ -0,0 +1,157 @@
+"""
+Relevance pre-filter for long uploads.
+
+Long, messy uploads are mostly material the template has no field for, yet
+every character is paid for as input tokens. Above a size threshold, the
+document is split into passages, each passage is BM25-scored against the
+template's own vocabulary (the section descriptions in prompts.py and its
+placeholder names), and the lowest-scoring passages are dropped until the
+text fits the target size. The opening of the document (title block, IDs,
+names) is always kept, kept passages stay in source order, and each dropped
+run is replaced by a short marker so the model knows text was omitted.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.models.template_registry import get_template
+from .prompts import build_extraction_prompt
+from .routing import estimate_tokens
+
+_WORD_RE = re.compile(r"[a-z0-9]{2,}")
+_STOPWORDS = frozenset(
+    "to of in on at by an or as is be no up it if "
+    "the and for with from this that are was were has have had not but all any can "
+    "each per its into over under one two use used using via may must will shall "
+    "json return object keys key text source document fields field content empty "
+    "these exact matching extract fill template sections".split()
+)
+# Passages are paragraphs, but text without blank lines (typical for PDFs) is
+# grouped line by line up to roughly this many characters.
+PASSAGE_CHARS = 800
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+@dataclass(frozen=True)
+class PrefilterReport:
+    original_tokens: int
+    kept_tokens: int
+    passages_total: int
+    passages_kept: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.kept_tokens
+
+
+def _terms(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+
+
+@lru_cache(maxsize=None)
+def template_vocabulary(template_type: str) -> frozenset[str]:
+    """Terms describing what the template wants: its prompt and placeholder names."""
+    info = get_template(template_type)
+    prompt = build_extraction_prompt(template_type, info.placeholders, "")
+    names = " ".join(k.replace("_", " ") for k in info.placeholders)
+    return frozenset(_terms(prompt) + _terms(names))
+
+
+def split_passages(text: str) -> list[str]:
+    passages: list[str] = []
+    current: list[str] = []
+    size = 0
+    for line in text.splitlines():
+        if not line.strip() or size >= PASSAGE_CHARS:
+            if current:
+                passages.append("\n".join(current))
+            current, size = [], 0
+            if not line.strip():
+                continue
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def bm25_scores(passages: list[str], query: frozenset[str]) -> list[float]:
+    docs = [Counter(_terms(p)) for p in passages]
+    n = len(docs)
+    avgdl = (sum(sum(d.values()) for d in docs) / n) or 1.0
+    df = Counter(term for d in docs for term in d if term in query)
+    idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+    scores = []
+    for d in docs:
+        dl = sum(d.values())
+        score = 0.0
+        for term, weight in idf.items():
+            tf = d.get(term, 0)
+            if tf:
+                score += weight * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+        scores.append(score)
+    return scores
+
+
+def prefilter(
+    template_type: str,
+    text: str,
+    min_chars: int,
+    target_chars: int,
+    head_chars: int,
+) -> tuple[str, PrefilterReport | None]:
+    """
+    Shrink `text` to about `target_chars` by dropping low-relevance passages.
+    Text at or under `min_chars` (or already within `target_chars`) is
+    returned untouched with no report.
+    """
+    if len(text) <= max(min_chars, target_chars):
+        return text, None
+
+    passages = split_passages(text)
+    keep = [False] * len(passages)
+    budget = target_chars
+    offset = 0
+    for i, passage in enumerate(passages):  # the opening is always kept
+        if offset >= head_chars:
+            break
+        keep[i] = True
+        budget -= len(passage)
+        offset += len(passage)
+
+    # Passages sharing no words with the template (names, dates, IDs) come
+    # last, in source order, but still fill whatever budget is left.
+    scores = bm25_scores(passages, template_vocabulary(template_type))
+    for i in sorted(range(len(passages)), key=lambda i: scores[i], reverse=True):
+        if keep[i]:
+            continue
+        if len(passages[i]) > budget:
+            continue
+        keep[i] = True
+        budget -= len(passages[i])
+
+    out: list[str] = []
+    dropped = 0
+    for passage, kept in zip(passages, keep):
+        if kept:
+            if dropped:
+                out.append(f"[... {dropped} less relevant passage(s) omitted ...]")
+                dropped = 0
+            out.append(passage)
+        else:
+            dropped += 1
+    if dropped:
+        out.append(f"[... {dropped} less relevant passage(s) omitted ...]")
+
+    filtered = "\n\n".join(out)
+    report = PrefilterReport(
+        original_tokens=estimate_tokens(text),
+        kept_tokens=estimate_tokens(filtered),
+        passages_total=len(passages),
+        passages_kept=sum(keep),
+    )
+    return filtered, report
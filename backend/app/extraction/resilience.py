@@ -0,0 +1,153 @@
+"""
+Retry, backoff and hedging for model calls.
+
+A call gets up to `max_attempts` tries within an overall time budget. Each
+try has its own deadline (shorter than the budget, so one stuck request can't
+eat all of it), and retryable failures back off with full jitter. Optionally a
+try is hedged: if it hasn't finished after a delay derived from recent p95
+latency, a second identical request is fired and whichever succeeds first
+wins; the other is cancelled.
+"""
+
+import asyncio
+import math
+import random
+import sys
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Upstream statuses worth another try: timeouts, conflicts, rate limiting,
+# server errors and overload (529).
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    attempt_timeout: float = 90.0
+    total_timeout: float = 180.0
+    backoff_base: float = 1.0
+    backoff_max: float = 20.0
+
+
+# Monotonic time by which the request being served must be answered (None
+# when it has no deadline); calls made on its behalf never outlive it.
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+def set_deadline(at: float | None) -> None:
+    """Set the deadline (time.monotonic() value) for work in the current context."""
+    _deadline.set(at)
+
+
+def time_left() -> float:
+    """Seconds until the current context's deadline (infinite without one)."""
+    at = _deadline.get()
+    return math.inf if at is None else at - time.monotonic()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    # Not imported here: an SDK error can only exist once the SDK is loaded.
+    anthropic = sys.modules.get("anthropic")
+    if anthropic is None:
+        return False
+    if isinstance(exc, anthropic.APIConnectionError):
+        return True  # APITimeoutError is a subclass of APIConnectionError
+    if isinstance(exc, anthropic.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUSES
+    return False
+
+
+def _retry_after(exc: BaseException) -> float:
+    """Seconds the server asked us to wait (0 when it didn't say)."""
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int) -> float:
+    """Full-jitter exponential backoff before try number `attempt + 1`."""
+    return random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** (attempt - 1)))
+
+
+class LatencyTracker:
+    """Recent successful call latencies, used to pick a hedging delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged(fn: Callable[[], Awaitable[T]], delay: float) -> T:
+    """
+    Run `fn`; if it hasn't finished after `delay` seconds, start a second copy.
+    Returns the first success (cancelling the other) or raises the last error.
+    """
+    # Every copy is cancelled on the way out, including when hedged() itself
+    # is cancelled (an attempt timeout or the request going away).
+    tasks = [asyncio.ensure_future(fn())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+
+        tasks.append(asyncio.ensure_future(fn()))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_retries(
+    fn: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    hedge_delay: float | None = None,
+) -> T:
+    """
+    Call `fn` under `policy`, hedging each try when `hedge_delay` is set. The
+    budget is cut short by the request's deadline (set_deadline), if earlier.
+    """
+    deadline = time.monotonic() + min(policy.total_timeout, time_left())
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("request deadline exceeded")
+        timeout = min(policy.attempt_timeout, remaining)
+        try:
+            call = hedged(fn, hedge_delay) if hedge_delay is not None else fn()
+            return await asyncio.wait_for(call, timeout)
+        except Exception as e:
+            if not is_retryable(e) or attempt >= policy.max_attempts:
+                raise
+            delay = max(backoff_delay(policy, attempt), _retry_after(e))
+            if time.monotonic() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
@@ -0,0 +1,90 @@
+"""
+Per-request choice of model and output budget.
+
+A short deviation report doesn't need the same model or the same reserved
+output budget as a 60-page General Document. The policy estimates input and
+output size from the document text and the template's shape, then picks an
+output budget (never above the template's own `max_tokens`) and, when a fast
+tier is configured, a faster model for small flat documents.
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+
+from app.config import settings
+from app.models.template_registry import TemplateInfo
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token for English prose; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+# Fixed output overhead of the structured (General Document) JSON skeleton.
+STRUCTURED_OVERHEAD_TOKENS = 300
+# Upper bound on what one flat field's value realistically costs.
+FLAT_VALUE_TOKENS = 200
+# Rough model throughput, for ordering queued calls by expected duration:
+# reading the prompt is cheap, generating the answer dominates.
+INPUT_TOKENS_PER_SECOND = 5000
+OUTPUT_TOKENS_PER_SECOND = 60
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    model: str
+    max_tokens: int
+    input_tokens: int
+    expected_output_tokens: int
+    reason: str
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_output_tokens(template_info: TemplateInfo, input_tokens: int) -> int:
+    """
+    Expected size of the JSON answer. Flat templates pay for every key plus
+    values that can't exceed the source; the General Document re-expresses
+    most of the source as section content, so it scales with the input.
+    """
+    if template_info.structured:
+        return STRUCTURED_OVERHEAD_TOKENS + math.ceil(input_tokens * 1.2)
+    key_tokens = sum(len(k) // CHARS_PER_TOKEN + 4 for k in template_info.placeholders)
+    value_tokens = min(input_tokens, len(template_info.placeholders) * FLAT_VALUE_TOKENS)
+    return key_tokens + value_tokens
+
+
+def estimate_seconds(decision: RouteDecision) -> float:
+    """Expected duration of the call, used to schedule short calls first."""
+    output_tokens = min(decision.expected_output_tokens, decision.max_tokens)
+    return decision.input_tokens / INPUT_TOKENS_PER_SECOND + output_tokens / OUTPUT_TOKENS_PER_SECOND
+
+
+def route(template_type: str, template_info: TemplateInfo, prompt: str) -> RouteDecision:
+    """Pick the model and max_tokens for one extraction call."""
+    input_tokens = estimate_tokens(prompt)
+    expected = estimate_output_tokens(template_info, input_tokens)
+
+    if settings.adaptive_max_tokens:
+        budget = math.ceil(expected * settings.max_tokens_safety_factor)
+        max_tokens = max(settings.max_tokens_floor, min(budget, template_info.max_tokens))
+    else:
+        max_tokens = template_info.max_tokens
+
+    model = settings.anthropic_model
+    reason = "default"
+    if (
+        settings.fast_model
+        and not template_info.structured
+        and input_tokens <= settings.fast_model_max_input_tokens
+    ):
+        model = settings.fast_model
+        reason = "fast tier: small flat document"
+
+    decision = RouteDecision(model, max_tokens, input_tokens, expected, reason)
+    logger.info(
+        "route template=%s model=%s max_tokens=%d input_tokens~%d expected_output~%d (%s)",
+        template_type, model, max_tokens, input_tokens, expected, reason,
+    )
+    return decision
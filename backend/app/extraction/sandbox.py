@@ -0,0 +1,235 @@
+"""
+Isolated worker processes for parsing untrusted uploads.
+
+PyMuPDF and lxml run on user-supplied files. In the API process a
+pathological upload can pin a CPU or balloon memory for every other request,
+so parsing runs in a small pool of long-lived worker processes instead. Each
+worker has an address-space limit, a per-job CPU-time limit and a hard
+wall-clock timeout enforced by the parent; a worker that breaches a limit is
+killed and replaced, and every worker is recycled after a fixed number of
+jobs. Failures surface as ValueError so callers treat them like any other
+unreadable upload.
+
+Workers extract PDFs serially: shards farmed out to grandchild processes
+would escape the worker's CPU limit and outlive a killed worker. So with the
+sandbox on, pdf_workers and pdf_pages_per_shard do not apply; uploads run in
+parallel across workers, the pages of one PDF do not.
+"""
+
+import multiprocessing
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from app.config import settings
+from .text_extractor import extract_text
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are skipped there
+    resource = None
+
+
+class SandboxError(ValueError):
+    """Extraction was aborted by the sandbox (timeout or resource limit)."""
+
+
+@dataclass(frozen=True)
+class SandboxLimits:
+    cpu_seconds: int
+    memory_bytes: int
+
+
+def _apply_memory_limit(memory_bytes: int) -> None:
+    if resource is not None and memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _arm_cpu_limit(cpu_seconds: int) -> None:
+    """Allow `cpu_seconds` more CPU time from now (the rlimit is cumulative)."""
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, resource.RLIM_INFINITY))
+
+
+def _worker_main(conn, limits: SandboxLimits, target: Callable[[bytes | str, str], str]) -> None:
+    settings.pdf_workers = 1  # this process only; see the module docstring
+    _apply_memory_limit(limits.memory_bytes)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        _arm_cpu_limit(limits.cpu_seconds)
+        try:
+            conn.send(("ok", target(*job), True))
+        except MemoryError:
+            # The heap may be fragmented or half-freed; report and retire.
+            conn.send(("error", "file exceeds the extraction memory limit", False))
+            return
+        except Exception as e:
+            conn.send(("error", str(e), True))
+
+
+class _Worker:
+    def __init__(self, ctx, limits: SandboxLimits, target):
+        self.conn, child_conn = ctx.Pipe()
+        # A daemon, so an interpreter that never calls shutdown_pool() still
+        # exits (multiprocessing terminates daemons at exit).
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, limits, target), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def retire(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        self.conn.close()
+
+
+class SandboxPool:
+    """At most `workers` extractions at once, each in its own worker process."""
+
+    def __init__(
+        self,
+        workers: int,
+        max_jobs_per_worker: int,
+        timeout: float,
+        limits: SandboxLimits,
+        target: Callable[[bytes | str, str], str] = extract_text,
+    ):
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self.limits = limits
+        self.target = target
+        self._ctx = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle: queue.SimpleQueue[_Worker] = queue.SimpleQueue()
+        self._live: set[_Worker] = set()  # idle and checked-out workers
+        self._lock = threading.Lock()
+
+    def run(self, source: bytes | str, filename: str) -> str:
+        """
+        Run the target on one upload in a worker; blocks the calling thread.
+        A path `source` (a spooled upload) is opened by the worker itself.
+        """
+        with self._slots:
+            worker = self._checkout()
+            reusable = False
+            try:
+                worker.conn.send((source, filename))
+                if not worker.conn.poll(self.timeout):
+                    self._kill(worker)
+                    worker = None
+                    raise SandboxError(f"text extraction timed out after {self.timeout:g}s")
+                status, payload, reusable = worker.conn.recv()
+            except (EOFError, OSError):
+                self._kill(worker)
+                worker = None
+                raise SandboxError("text extraction was aborted (file exceeds the CPU or memory limit)")
+            finally:
+                if worker is not None:
+                    self._checkin(worker, reusable)
+        if status == "error":
+            raise ValueError(payload)
+        return payload
+
+    def prestart(self, count: int) -> None:
+        """Start up to `count` idle workers ahead of the first jobs."""
+        for _ in range(count):
+            worker = _Worker(self._ctx, self.limits, self.target)
+            with self._lock:
+                self._live.add(worker)
+            self._idle.put(worker)
+
+    def shutdown(self) -> None:
+        """Stop every worker, including ones busy with a job (their callers get SandboxError)."""
+        with self._lock:
+            workers, self._live = self._live, set()
+        for worker in workers:
+            worker.kill()
+
+    def _checkout(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = _Worker(self._ctx, self.limits, self.target)
+                with self._lock:
+                    self._live.add(worker)
+                return worker
+            if worker.process.is_alive():
+                return worker
+            self._kill(worker)
+
+    def _checkin(self, worker: _Worker, reusable: bool) -> None:
+        worker.jobs += 1
+        with self._lock:
+            keep = (
+                reusable
+                and worker in self._live  # not stopped by shutdown() meanwhile
+                and worker.jobs < self.max_jobs_per_worker
+                and worker.process.is_alive()
+            )
+            if not keep:
+                self._live.discard(worker)
+        if keep:
+            self._idle.put(worker)
+        else:
+            worker.retire()
+
+    def _kill(self, worker: _Worker) -> None:
+        with self._lock:
+            self._live.discard(worker)
+        worker.kill()
+
+
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                workers=settings.sandbox_workers,
+                max_jobs_per_worker=settings.sandbox_max_jobs_per_worker,
+                timeout=settings.sandbox_timeout_seconds,
+                limits=SandboxLimits(
+                    cpu_seconds=settings.sandbox_cpu_seconds,
+                    memory_bytes=settings.sandbox_memory_mb * 1024 * 1024,
+                ),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def extract_text_isolated(source: bytes | str, filename: str) -> str:
+    """extract_text, in a sandboxed worker unless the sandbox is disabled."""
+    if not settings.sandbox_enabled:
+        return extract_text(source, filename)
+    return get_pool().run(source, filename)
@@ -3,17 +3,32 @@ Extract plain text from uploaded documents (.docx, .pdf, .txt).
 """
 
 import io
+import os
+import re
 import zipfile
 
-from app.engine.xml_utils import T, secure_fromstring
+from lxml import etree
 
+from app.config import settings
+from app.engine.xml_utils import BR, CR, P, T, TAB, TBL, TC, TR
+from .pdf_text import PdfOptions, extract_pdf_text
 
-def extract_text(file_bytes: bytes, filename: str) -> str:
+_HEADER_RE = re.compile(r"word/header\d*\.xml")
+_FOOTER_RE = re.compile(r"word/footer\d*\.xml")
+# Bump when a change alters the text produced for the same upload, so cached
+# texts from the previous extractor are not served (see extractor_fingerprint).
+EXTRACTOR_VERSION = 1
+# The compression-ratio check only applies once a part has inflated past
+# this size, so small, highly repetitive parts are never rejected.
+_RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+
+def extract_text(source: bytes | str, filename: str) -> str:
     """
     Extract plain text from a document based on its file extension.
 
     Args:
-        file_bytes: Raw bytes of the uploaded file.
+        source: Raw bytes of the uploaded file, or the path of a spooled copy.
         filename: Original filename (used to determine type).
 
     Returns:
@@ -22,15 +37,30 @@ def extract_text(file_bytes: bytes, filename: str) -> str:
     ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
 
     if ext == "txt":
-        return _extract_txt(file_bytes)
+        return _extract_txt(_read_source(source))
     elif ext == "docx":
-        return _extract_docx(file_bytes)
+        return _extract_docx(source)
     elif ext == "pdf":
-        return _extract_pdf(file_bytes)
+        return _extract_pdf(source)
     else:
         raise ValueError(f"Unsupported file type: .{ext}. Supported: .docx, .pdf, .txt")
 
 
+def extractor_fingerprint() -> str:
+    """The extractor version plus every setting that changes its output."""
+    return (
+        f"v{EXTRACTOR_VERSION}-p{settings.pdf_max_pages}-c{settings.pdf_max_chars}"
+        f"-s{int(settings.pdf_strip_repeated_lines)}"
+    )
+
+
+def _read_source(source: bytes | str) -> bytes:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    return source
+
+
 def _extract_txt(file_bytes: bytes) -> str:
     """Decode and return text content."""
     for encoding in ("utf-8", "utf-8-sig", "latin-1"):
@@ -41,26 +71,177 @@ def _extract_txt(file_bytes: bytes) -> str:
     return file_bytes.decode("utf-8", errors="replace")
 
 
-def _extract_docx(file_bytes: bytes) -> str:
-    """Extract text from .docx by reading <w:t> elements from document.xml."""
-    texts = []
-    with zipfile.ZipFile(io.BytesIO(file_bytes), "r") as zf:
-        if "word/document.xml" not in zf.namelist():
+def _docx_text_parts(names: list[str]) -> list[str]:
+    """The text-bearing parts of a .docx in reading order: headers, body, footers."""
+    headers = sorted(n for n in names if _HEADER_RE.fullmatch(n))
+    footers = sorted(n for n in names if _FOOTER_RE.fullmatch(n))
+    return headers + ["word/document.xml"] + footers
+
+
+def _extract_docx(source: bytes | str) -> str:
+    """
+    Extract text from .docx: one line per paragraph (runs joined), one
+    " | "-delimited line per table row, with header and footer text included.
+    Header/footer lines already seen (e.g. identical first/default headers)
+    are not repeated. Parts are inflated incrementally into the parser and
+    rejected as soon as they cross the configured size or ratio limits.
+    """
+    lines: list[str] = []
+    archive = source if isinstance(source, str) else io.BytesIO(source)
+    with zipfile.ZipFile(archive, "r") as zf:
+        names = zf.namelist()
+        if "word/document.xml" not in names:
             raise ValueError("Invalid .docx: missing word/document.xml")
-        tree = secure_fromstring(zf.read("word/document.xml"))
-        for t_elem in tree.iter(T):
-            if t_elem.text:
-                texts.append(t_elem.text)
-    return "\n".join(texts)
-
-
-def _extract_pdf(file_bytes: bytes) -> str:
-    """Extract text from .pdf using PyMuPDF."""
-    import fitz  # PyMuPDF
-
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    texts = []
-    for page in doc:
-        texts.append(page.get_text())
-    doc.close()
-    return "\n".join(texts)
+        seen: set[str] = set()
+        budget = _InflateBudget(
+            max_bytes=settings.docx_max_uncompressed_mb * 1024 * 1024,
+            max_ratio=settings.docx_max_compression_ratio,
+        )
+        for part in _docx_text_parts(names):
+            with zf.open(part) as stream:
+                part_lines = _iter_docx_lines(budget.guard(zf.getinfo(part), stream))
+                if part == "word/document.xml":
+                    lines.extend(part_lines)
+                    continue
+                for line in part_lines:
+                    if line not in seen:
+                        seen.add(line)
+                        lines.append(line)
+    return "\n".join(lines)
+
+
+class _InflateBudget:
+    """
+    Decompressed-size limits shared by all parts of one .docx. Declared sizes
+    are checked up front, but the zip headers can lie, so the bytes actually
+    inflated are counted as the parser reads them.
+    """
+
+    def __init__(self, max_bytes: int, max_ratio: int):
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.used = 0
+
+    def guard(self, info: zipfile.ZipInfo, stream) -> "_GuardedStream":
+        if self.used + info.file_size > self.max_bytes:
+            raise ValueError(self.size_error())
+        return _GuardedStream(self, info, stream)
+
+    def size_error(self) -> str:
+        return f"Invalid .docx: text exceeds {self.max_bytes // (1024 * 1024)} MB uncompressed"
+
+
+class _GuardedStream:
+    """Read-only view of a zip member that aborts once a limit is crossed."""
+
+    def __init__(self, budget: _InflateBudget, info: zipfile.ZipInfo, stream):
+        self._budget = budget
+        self._name = info.filename
+        self._compressed = max(info.compress_size, 1)
+        self._stream = stream
+        self._read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._read += len(data)
+        self._budget.used += len(data)
+        if self._budget.used > self._budget.max_bytes:
+            raise ValueError(self._budget.size_error())
+        if self._read > _RATIO_CHECK_MIN_BYTES and self._read > self._budget.max_ratio * self._compressed:
+            raise ValueError(
+                f"Invalid .docx: {self._name} exceeds the {self._budget.max_ratio}:1 compression ratio limit"
+            )
+        return data
+
+
+def _iter_docx_lines(stream) -> list[str]:
+    """
+    Stream-parse one WordprocessingML part into text lines.
+
+    Uses iterparse with the same hardening as secure_fromstring. Events fire
+    only at paragraph/table boundaries; each outermost paragraph or table is
+    rendered with lxml's own iteration once complete and then cleared, so
+    memory stays flat however long the document is. Paragraphs nested in a
+    table or a text box are rendered as part of their outermost block.
+    """
+    lines: list[str] = []
+    para_depth = 0
+    table_depth = 0
+    for event, elem in etree.iterparse(
+        stream,
+        events=("start", "end"),
+        tag=(P, TBL),
+        resolve_entities=False,
+        no_network=True,
+        load_dtd=False,
+        huge_tree=False,
+    ):
+        is_para = elem.tag == P
+        if event == "start":
+            if is_para:
+                para_depth += 1
+            else:
+                table_depth += 1
+            continue
+
+        if is_para:
+            para_depth -= 1
+        else:
+            table_depth -= 1
+        if para_depth or table_depth:
+            continue  # an inner block; its outermost block renders it
+
+        if is_para:
+            text = _paragraph_text(elem)
+            if text:
+                lines.append(text)
+        else:
+            lines.extend(_table_rows(elem))
+
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+    return lines
+
+
+def _paragraph_text(para: etree._Element) -> str:
+    """Runs joined into one line; tabs and breaks kept as whitespace."""
+    parts = []
+    for node in para.iter(T, TAB, BR, CR):
+        if node.tag == T:
+            parts.append(node.text or "")
+        elif node.tag == TAB:
+            parts.append("\t")
+        else:
+            parts.append("\n")
+    return "".join(parts).strip()
+
+
+def _table_rows(table: etree._Element) -> list[str]:
+    """One " | "-delimited line per non-empty row; cell paragraphs space-joined."""
+    rows = []
+    for tr in table.iter(TR):
+        if tr.getparent() is not table:
+            continue  # nested table: rendered inside its cell's text
+        cells = []
+        for tc in tr.iterchildren(TC):
+            texts = (_paragraph_text(p) for p in tc.iter(P))
+            cells.append(" ".join(t for t in texts if t))
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return rows
+
+
+def _extract_pdf(source: bytes | str) -> str:
+    """Extract text from .pdf using PyMuPDF, within the configured page/char limits."""
+    options = PdfOptions(
+        max_pages=settings.pdf_max_pages,
+        max_chars=settings.pdf_max_chars,
+        workers=settings.pdf_workers or os.cpu_count() or 1,
+        pages_per_shard=settings.pdf_pages_per_shard,
+        parallel_min_pages=settings.pdf_parallel_min_pages,
+        strip_repeated_lines=settings.pdf_strip_repeated_lines,
+    )
+    return extract_pdf_text(source, options)
@@ -0,0 +1,141 @@
+"""
+In-process background jobs for the formatting pipeline.
+
+A job is submitted with a coroutine factory that produces the finished .docx.
+A fixed pool of worker tasks drains a bounded queue, so at most `workers`
+pipelines run at once and a burst beyond `queue_size` is refused instead of
+piling up. Finished outputs go to the result store under the job id; the job
+record itself keeps only status, timings and any error.
+"""
+
+import asyncio
+import contextvars
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.executors import io_executor
+from app.storage.results import result_store
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the job queue is at capacity."""
+
+
+@dataclass
+class Job:
+    id: str
+    template_type: str
+    filename: str
+    run: Callable[[], Awaitable[bytes]] | None
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error_status: int | None = None
+    error_detail: str | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+
+class JobManager:
+    def __init__(self, store, workers: int, queue_size: int, ttl_seconds: float):
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl_seconds = ttl_seconds
+        self._jobs: dict[str, Job] = {}
+        self._queue: asyncio.Queue[Job] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_workers(self) -> None:
+        """Start the worker pool on the running loop (lazily, on first use)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # A new event loop (server restart in-process, or a test client) means
+        # any previous queue and workers are dead; start fresh on this one.
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        # Workers start inside the first submitting request, but must not
+        # inherit its context (trace span, profiling session, metric labels,
+        # deadline): each job sets up its own.
+        self._tasks = [
+            asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+        ]
+
+    def submit(self, template_type: str, filename: str, run: Callable[[], Awaitable[bytes]]) -> Job:
+        self._ensure_workers()
+        self._evict_expired()
+        job = Job(id=uuid.uuid4().hex, template_type=template_type, filename=filename, run=run)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Job queue is full")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._evict_expired()
+        return self._jobs.get(job_id)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            output = await job.run()
+            # With RESULT_STORE=sqlite this writes a multi-MB blob: keep it off the loop.
+            await io_executor.run(self.store.put, job.id, output, job.filename)
+            job.status = SUCCEEDED
+        except HTTPException as e:
+            job.status, job.error_status, job.error_detail = FAILED, e.status_code, str(e.detail)
+        except Exception as e:
+            job.status, job.error_status, job.error_detail = FAILED, 500, f"Job failed: {e}"
+        finally:
+            job.finished_at = time.time()
+            job.run = None  # drop the closure (and the upload bytes it holds)
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager(
+    result_store,
+    workers=settings.job_workers,
+    queue_size=settings.job_queue_size,
+    ttl_seconds=settings.result_ttl_seconds,
+)
@@ -1,16 +1,64 @@
 """FastAPI application entry point."""
 
+import asyncio
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from app.config import settings
-from app.api.routes import router
+from app.api.admission import admission
+from app.api.middleware import (
+    AdmissionMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    TracingMiddleware,
+    UploadSizeLimitMiddleware,
+)
+from app.api.routes import router, upload_body_limits
+from app.executors import executors
+from app.extraction import pdf_text, sandbox
+from app.extraction.ai_extractor import model_limiter
+from app.jobs.manager import job_manager
+from app.observability import tracing
+from app.observability.metrics import Gauge, registry
+from app.warmup import readiness, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In the background: /health must answer while /ready still says 503.
+    warmup = asyncio.create_task(warm_up()) if settings.warmup_enabled else None
+    if warmup is None:
+        readiness.ready = True
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await job_manager.shutdown()
+    sandbox.shutdown_pool()
+    pdf_text.shutdown_pool()
+    tracing.exporter.flush()
+
 
 app = FastAPI(
     title="TraceScribe Document Formatter",
     description="Upload a messy document, get back a clean formatted .docx",
     version="1.0.0",
+    lifespan=lifespan,
+)
+
+# Added before CORS so CORS wraps them and their responses still carry CORS headers.
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    paths=("/api/format", "/api/format/stream", "/api/extract", "/api/fill"),
 )
+app.add_middleware(UploadSizeLimitMiddleware, limits=upload_body_limits("/api"))
+app.add_middleware(ProfilingMiddleware)  # inside tracing: keyed by the trace id
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # CORS
 app.add_middleware(
@@ -19,6 +67,15 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Server-Timing",
+        "X-Request-Id",
+        "X-Profile-Id",
+        "Retry-After",
+        "Idempotent-Replayed",
+        "X-Model-Queue-Wait-Ms",
+        "X-Model-Coalesced",
+    ],
 )
 
 app.include_router(router, prefix="/api")
@@ -27,3 +84,60 @@ app.include_router(router, prefix="/api")
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until start-up warm-up has finished, with its step timings."""
+    return JSONResponse(readiness.report(), status_code=200 if readiness.ready else 503)
+
+
+def _threadpool_stats() -> dict[tuple[str, ...], float]:
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {("busy",): stats.borrowed_tokens, ("waiting",): stats.tasks_waiting}
+
+
+registry.register(Gauge(
+    "tracescribe_threadpool_tasks",
+    "Shared thread pool (sync endpoints, file responses): tasks running (busy) and queued (waiting).",
+    _threadpool_stats,
+    ("state",),
+))
+registry.register(Gauge(
+    "tracescribe_executor_tasks",
+    "Per-stage executors: tasks running on a thread (busy) and queued for one (waiting).",
+    lambda: {
+        (e.name, state): value
+        for e in executors
+        for state, value in (("busy", e.busy), ("waiting", e.waiting))
+    },
+    ("executor", "state"),
+))
+registry.register(Gauge(
+    "tracescribe_executor_utilization",
+    "Per-stage executors: fraction of the stage's threads in use.",
+    lambda: {(e.name,): e.utilization for e in executors},
+    ("executor",),
+))
+registry.register(Gauge(
+    "tracescribe_model_calls",
+    "Model calls holding a concurrency slot (active) and queued for one (waiting).",
+    lambda: {("active",): model_limiter.active, ("waiting",): model_limiter.waiting},
+    ("state",),
+))
+registry.register(Gauge(
+    "tracescribe_admitted_requests",
+    "Requests admitted by admission control and still in flight.",
+    lambda: {(): admission.inflight},
+))
+registry.register(Gauge(
+    "tracescribe_job_queue_depth",
+    "Background jobs queued and not yet started.",
+    lambda: {(): job_manager.queue_depth},
+))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,7 @@
 """Pydantic models for API request/response validation."""
 
+from typing import Any
+
 from pydantic import BaseModel
 
 
@@ -10,5 +12,29 @@ class TemplateInfoResponse(BaseModel):
     placeholder_count: int
 
 
+class ExtractResponse(BaseModel):
+    template_type: str
+    structured: bool
+    fields: dict[str, Any]
+
+
+class FillRequest(BaseModel):
+    template_type: str
+    fields: dict[str, Any]
+
+
 class ErrorResponse(BaseModel):
     detail: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    template_type: str
+    status_url: str
+    result_url: str
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    error_status: int | None = None
+    error_detail: str | None = None
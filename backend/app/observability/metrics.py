@@ -0,0 +1,255 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A small registry of counters, histograms and callback gauges, rendered by
+GET /metrics for scraping. Everything lives in process memory: no client
+library, no push gateway. Metric values are updated from the event loop and
+from worker threads, so each metric guards its samples with a lock.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+# Seconds; spans a fast template fill up to a long model call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: per-bucket (non-cumulative) counts, sum, count.
+        self._values: dict[LabelValues, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A gauge whose samples are read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], dict[LabelValues, float]],
+        labels: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in sorted(self.collect().items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics.values() for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "tracescribe_http_requests_total",
+    "HTTP requests by route, method, status and template type.",
+    ("route", "method", "status", "template"),
+))
+request_seconds = registry.register(Histogram(
+    "tracescribe_http_request_duration_seconds",
+    "HTTP request latency (until the last body byte) by route and template type.",
+    ("route", "template"),
+))
+stage_seconds = registry.register(Histogram(
+    "tracescribe_stage_duration_seconds",
+    "Pipeline stage latency: upload_read, extract_text, extract_fields, fill_template.",
+    ("stage", "template"),
+))
+stage_errors_total = registry.register(Counter(
+    "tracescribe_stage_errors_total",
+    "Pipeline stage failures by stage and HTTP status returned.",
+    ("stage", "status"),
+))
+model_input_tokens_total = registry.register(Counter(
+    "tracescribe_model_input_tokens_total",
+    "Model input tokens (message.usage) by model and template type.",
+    ("model", "template"),
+))
+model_output_tokens_total = registry.register(Counter(
+    "tracescribe_model_output_tokens_total",
+    "Model output tokens (message.usage) by model and template type.",
+    ("model", "template"),
+))
+model_calls_coalesced_total = registry.register(Counter(
+    "tracescribe_model_calls_coalesced_total",
+    "Extractions served by an identical model call already in flight, by model and template type.",
+    ("model", "template"),
+))
+requests_cancelled_total = registry.register(Counter(
+    "tracescribe_requests_cancelled_total",
+    "Requests abandoned mid-pipeline, by reason (disconnect, deadline) and the stage cut short.",
+    ("reason", "stage"),
+))
+idempotent_requests_total = registry.register(Counter(
+    "tracescribe_idempotent_requests_total",
+    "Requests with an Idempotency-Key: new runs, attached to a run in flight, or replayed.",
+    ("outcome",),
+))
+admission_rejections_total = registry.register(Counter(
+    "tracescribe_admission_rejections_total",
+    "Requests refused with 429 by admission control, by the limit that was hit.",
+    ("reason",),
+))
+
+
+# Labels the request middleware reads back once the response is sent; the
+# endpoint fills in the template type.
+_request_labels: ContextVar[dict[str, str] | None] = ContextVar("request_labels", default=None)
+# Template type for stage metrics recorded in the current context.
+_template: ContextVar[str] = ContextVar("metrics_template", default="")
+
+
+def track_request() -> dict[str, str]:
+    """Start collecting labels for the request handled in this context."""
+    labels: dict[str, str] = {}
+    _request_labels.set(labels)
+    return labels
+
+
+def set_template(template_type: str) -> None:
+    """Label this context's stage metrics (and its request) with the template type."""
+    _template.set(template_type)
+    labels = _request_labels.get()
+    if labels is not None:
+        # A batch may mix template types.
+        labels["template"] = template_type if labels.get("template", template_type) == template_type else "mixed"
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time one pipeline stage; failures also count towards stage_errors_total."""
+    template = _template.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        stage_errors_total.inc(stage=stage, status=str(getattr(e, "status_code", 500)))
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, template=template)
+        raise
+    stage_seconds.observe(time.perf_counter() - start, stage=stage, template=template)
+
+
+def record_usage(model: str, template_type: str, usage) -> None:
+    """Count a model response's input/output tokens (no-op without usage)."""
+    if usage is None:
+        return
+    model_input_tokens_total.inc(getattr(usage, "input_tokens", 0) or 0, model=model, template=template_type)
+    model_output_tokens_total.inc(getattr(usage, "output_tokens", 0) or 0, model=model, template=template_type)
@@ -0,0 +1,172 @@
+"""
+On-demand profiling of individual requests.
+
+Slow requests usually depend on one specific upload, so they are profiled
+where they happen. A request carrying the operator token (the X-Profile-Token
+header equal to settings.profiling_token; never a query parameter, which would
+end up in access logs) runs with a profile session attached to its context.
+Blocking work the request hands to the thread pool (text extraction, template
+fill) runs through profiled(), which records it in one of two modes:
+
+- "cprofile": a deterministic cProfile per call, merged into one .pstats file;
+- "sample": a sampler thread snapshots the request's worker threads every few
+  milliseconds and writes collapsed stacks (flamegraph.pl / speedscope input).
+
+From Python 3.12 cProfile is built on sys.monitoring, which is
+interpreter-wide: only one profiler may be active at a time, and it records
+every thread, i.e. other requests' work too. There "cprofile" sessions fall
+back to sampling, which only ever looks at the request's own threads.
+
+The artifact is stored under settings.profiling_dir, named by the request id
+(the trace id, also returned as X-Request-Id and X-Profile-Id). The event
+loop thread is not profiled: it is shared by every in-flight request.
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL_SECONDS = 0.005
+# Whether a cProfile.Profile only sees the thread it runs on (see above).
+CPROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+logger = logging.getLogger(__name__)
+
+
+def token_matches(supplied: str | None, expected: str) -> bool:
+    """Constant-time token check; an empty configured token disables profiling."""
+    return bool(expected) and supplied is not None and hmac.compare_digest(supplied, expected)
+
+
+def artifact_name(request_id: str, mode: str) -> str:
+    return f"{request_id}.{'pstats' if mode == 'cprofile' else 'collapsed'}"
+
+
+class ProfileSession:
+    """Profiles collected for one request."""
+
+    def __init__(self, request_id: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}'. Valid: {', '.join(MODES)}")
+        if mode == "cprofile" and not CPROFILE_PER_THREAD:
+            logger.info("cprofile is interpreter-wide on this Python; profiling request %s by sampling", request_id)
+            mode = "sample"
+        self.request_id = request_id
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._profiles: list[cProfile.Profile] = []
+        self._threads: set[int] = set()
+        self._stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call `fn` on this (worker) thread, recording it into the session."""
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._profiles.append(profile)
+
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.add(ident)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+                self._sampler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._threads.discard(ident)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+            with self._lock:
+                threads = set(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self._stacks[";".join(reversed(stack))] += 1
+
+    def save(self, directory: str) -> str | None:
+        """Write the artifact; returns its path, or None when nothing was profiled."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(1.0)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, artifact_name(self.request_id, self.mode))
+        with self._lock:
+            if self.mode == "cprofile":
+                if not self._profiles:
+                    return None
+                stats = pstats.Stats(self._profiles[0])
+                for profile in self._profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(path)
+            else:
+                if not self._stacks:
+                    return None
+                with open(path, "w", encoding="utf-8") as f:
+                    for stack, count in sorted(self._stacks.items()):
+                        f.write(f"{stack} {count}\n")
+        return path
+
+
+_session: ContextVar[ProfileSession | None] = ContextVar("profile_session", default=None)
+
+
+def start_session(request_id: str, mode: str) -> ProfileSession:
+    session = ProfileSession(request_id, mode)
+    _session.set(session)
+    return session
+
+
+def active_session() -> ProfileSession | None:
+    return _session.get()
+
+
+def profiled(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap blocking work so it is recorded when the calling request is profiled."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _session.get()  # the context is copied into the worker thread
+        if session is None:
+            return fn(*args, **kwargs)
+        return session.run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def find_artifact(directory: str, request_id: str) -> str | None:
+    """Path of a stored profile for `request_id`, if any (ids are hex only)."""
+    if not request_id.isalnum():
+        return None
+    for mode in MODES:
+        path = os.path.join(directory, artifact_name(request_id, mode))
+        if os.path.exists(path):
+            return path
+    return None
@@ -0,0 +1,265 @@
+"""
+Lightweight per-request tracing.
+
+Each HTTP request (and each background job) gets a trace: a root span plus
+one child span per pipeline stage and engine sub-stage, with attributes such
+as template type, bytes, characters and tokens. The request's completed stage
+spans are summarised in a `Server-Timing` response header, so a slow request
+can be broken down straight from the browser's network panel. Finished traces
+can also be exported to a local JSON-lines file or, in OTLP/HTTP JSON form,
+to a collector; export happens on a background thread so it never delays a
+response.
+
+The current span lives in a ContextVar, which Starlette copies into the
+thread pool, so engine code running in a worker thread attaches its spans to
+the request that scheduled it.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int | None = None
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+    # Shared by every span of one trace; finished spans are appended here.
+    _trace: "_Trace | None" = field(default=None, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _Trace:
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.lock = threading.Lock()
+
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record `name` as a child of the current span, or as the root of a new
+    trace when there is none. A root span's trace is exported when it ends.
+    """
+    parent = _current.get()
+    if parent is None:
+        trace = _Trace()
+        s = Span(name, os.urandom(16).hex(), os.urandom(8).hex(), None, attributes=attributes, _trace=trace)
+    else:
+        trace = parent._trace
+        s = Span(name, parent.trace_id, os.urandom(8).hex(), parent.span_id, attributes=attributes, _trace=trace)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end_ns = time.time_ns()
+        with trace.lock:
+            trace.spans.append(s)
+        if parent is None:
+            exporter.submit(list(trace.spans))
+
+
+@contextmanager
+def child_span(name: str, **attributes):
+    """Like span(), but records nothing outside an active trace (for library code)."""
+    if _current.get() is None:
+        yield Span(name, "", "", None, attributes=attributes)
+        return
+    with span(name, **attributes) as s:
+        yield s
+
+
+def server_timing(root: Span) -> str:
+    """`Server-Timing` value: total time per name of the root's finished direct children."""
+    with root._trace.lock:
+        children = [s for s in root._trace.spans if s.parent_id == root.span_id]
+    totals: dict[str, float] = {}
+    for s in children:
+        totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in totals.items())
+
+
+# --- export -----------------------------------------------------------------
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per span to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: list[Span], service_name: str = "tracescribe-backend") -> dict:
+    """Spans in the OTLP/HTTP JSON encoding (ExportTraceServiceRequest)."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.observability.tracing"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                        "name": s.name,
+                        "kind": 2 if s.parent_id is None else 1,  # SERVER root, INTERNAL children
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                    }
+                    for s in spans
+                ],
+            }],
+        }],
+    }
+
+
+class OtlpHttpExporter:
+    """POSTs spans as OTLP/HTTP JSON to a collector endpoint (e.g. .../v1/traces)."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: list[Span]) -> None:
+        import httpx
+
+        httpx.post(self.endpoint, json=otlp_payload(spans), timeout=self.timeout).raise_for_status()
+
+
+class BackgroundExporter:
+    """
+    Hands finished traces to the target exporter on a daemon thread. The
+    queue is bounded: when the exporter falls behind, new traces are dropped
+    rather than growing memory or blocking requests. The target is built from
+    settings on first use unless one is given.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, target=_UNSET, max_queued: int = 1000):
+        self._target = target
+        self._queue: queue.Queue[list[Span] | None] = queue.Queue(max_queued)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    @property
+    def target(self):
+        if self._target is self._UNSET:
+            from app.config import settings
+
+            self._target = build_exporter(
+                settings.tracing_export, settings.tracing_jsonl_path, settings.tracing_otlp_endpoint
+            )
+        return self._target
+
+    @target.setter
+    def target(self, value) -> None:
+        self._target = value
+
+    def submit(self, spans: list[Span]) -> None:
+        if self.target is None:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait (up to `timeout`) until everything submitted so far is exported."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            try:
+                self.target.export(spans)
+            except Exception:
+                logger.warning("span export failed", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+
+def build_exporter(kind: str, jsonl_path: str = "", otlp_endpoint: str = ""):
+    """The span exporter named by `kind`: "" (none), "jsonl" or "otlp"."""
+    if not kind:
+        return None
+    if kind == "jsonl":
+        return JsonLinesExporter(jsonl_path)
+    if kind == "otlp":
+        return OtlpHttpExporter(otlp_endpoint)
+    raise ValueError(f"Unknown tracing exporter '{kind}'. Valid: jsonl, otlp")
+
+
+exporter = BackgroundExporter()
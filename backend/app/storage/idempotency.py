@@ -0,0 +1,70 @@
+"""
+Idempotency keys for /format.
+
+A client that retries after a network error sends the same `Idempotency-Key`
+again. The first request with a key runs the pipeline; a duplicate arriving
+while it runs attaches to that run instead of starting its own, and one
+arriving after it finished is answered from the stored .docx (until the TTL
+expires), so a flaky network costs neither a second model call nor a second
+wait. Only successful runs are stored: a retry after a failure runs again.
+
+Keys are scoped to the request's content: the same key sent with a different
+upload or template is a different request, never a replay of the first.
+
+A run outlives a client that disconnects for up to idempotency_linger_seconds
+(the request's deadline still applies): a dropped connection is exactly when
+the client retries, and the retry has to upload the file again before it can
+attach to the run or pick up its stored result.
+"""
+
+import hashlib
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.extraction.concurrency import SingleFlight
+from app.observability.metrics import idempotent_requests_total
+from app.storage.results import MemoryResultStore
+
+MAX_KEY_LENGTH = 255
+
+NEW = "new"
+ATTACHED = "attached"
+REPLAYED = "replayed"
+
+
+def scoped_key(idempotency_key: str, upload_sha256: str, template_type: str) -> str:
+    return hashlib.sha256(f"{idempotency_key}\0{upload_sha256}\0{template_type}".encode()).hexdigest()
+
+
+class IdempotentResults:
+    def __init__(self, store, linger: float = 0.0):
+        self.store = store
+        self._flight = SingleFlight(linger)
+
+    async def run(self, key: str, filename: str, fn: Callable[[], Awaitable[bytes]]) -> tuple[bytes, str]:
+        """
+        The output for `key`: stored, shared with the run in flight, or from a
+        new run of `fn`. Returns it with how it was obtained (NEW, ATTACHED or
+        REPLAYED). The run is cancelled once every caller has gone away and
+        none has attached within the linger period.
+        """
+        stored = self.store.get(key)
+        if stored is not None:
+            idempotent_requests_total.inc(outcome=REPLAYED)
+            return stored.content, REPLAYED
+
+        async def run_and_store() -> bytes:
+            output = await fn()
+            self.store.put(key, output, filename)
+            return output
+
+        output, shared = await self._flight.do(key, run_and_store)
+        outcome = ATTACHED if shared else NEW
+        idempotent_requests_total.inc(outcome=outcome)
+        return output, outcome
+
+
+idempotent_results = IdempotentResults(
+    MemoryResultStore(settings.idempotency_ttl_seconds, max_entries=settings.idempotency_max_entries),
+    linger=settings.idempotency_linger_seconds,
+)
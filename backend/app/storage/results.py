@@ -0,0 +1,125 @@
+"""
+Short-lived storage for finished .docx outputs.
+
+Results are written once by the pipeline and fetched later by the client via
+an opaque token. Entries expire after a TTL and the store is size-bounded so a
+burst of abandoned downloads cannot grow memory without limit.
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    content: bytes
+    filename: str
+    expires_at: float
+
+
+def new_token() -> str:
+    """Return an unguessable, URL-safe token for a stored result."""
+    return secrets.token_urlsafe(24)
+
+
+class MemoryResultStore:
+    """In-process TTL store. Oldest entries are evicted first when full."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, StoredResult] = OrderedDict()
+        # Used from the event loop (idempotency) and from io executor threads.
+        self._lock = threading.Lock()
+
+    def put(self, key: str, content: bytes, filename: str) -> None:
+        entry = StoredResult(content, filename, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._evict_expired()
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> StoredResult | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+
+class SqliteResultStore:
+    """
+    Results persisted in a local SQLite file, so they survive a restart and
+    don't count against process memory. Expired rows are swept on write.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, content BLOB NOT NULL, "
+                "filename TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per call: sqlite3 connections are not shareable across
+        # the event loop and worker threads without extra locking.
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def put(self, key: str, content: bytes, filename: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, content, filename, now + self.ttl_seconds),
+            )
+
+    def get(self, key: str) -> StoredResult | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content, filename, expires_at FROM results WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return StoredResult(*row) if row else None
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+
+def build_result_store(backend: str, ttl_seconds: float, path: str = ""):
+    """Create the result store named by `backend` ("memory" or "sqlite")."""
+    if backend == "memory":
+        return MemoryResultStore(ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SqliteResultStore(path, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown result store backend '{backend}'. Valid: memory, sqlite")
+
+
+result_store = build_result_store(
+    settings.result_store, settings.result_ttl_seconds, settings.result_store_path
+)
@@ -0,0 +1,128 @@
+"""
+Cache of extracted document text, keyed by upload content.
+
+Users re-upload the same file while trying different templates; each repeat
+would otherwise re-parse the PDF/DOCX. Keys combine the upload's SHA-256, its
+file type and the extractor fingerprint (version plus the settings that shape
+the text), so a change to the extractor never serves stale text. Entries live
+in a size-bounded in-memory LRU and, optionally, a local SQLite file that
+survives restarts.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+def text_cache_key(sha256: str, filename: str, fingerprint: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return f"{sha256}:{ext}:{fingerprint}"
+
+
+class MemoryTextCache:
+    """LRU of extracted texts bounded by their total length in characters."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._chars -= len(old)
+            self._entries[key] = text
+            self._chars += len(text)
+            while self._chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+
+
+class SqliteTextCache:
+    """Extracted texts in a local SQLite file; least recently used rows pruned past max_entries."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, used_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def get(self, key: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT text FROM texts WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE texts SET used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    def put(self, key: str, text: str) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO texts VALUES (?, ?, ?)", (key, text, time.time()))
+            conn.execute(
+                "DELETE FROM texts WHERE key NOT IN "
+                "(SELECT key FROM texts ORDER BY used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+
+class TextCache:
+    """Memory tier in front of an optional disk tier. Blocking; call from a worker thread."""
+
+    def __init__(self, memory: MemoryTextCache | None, disk: SqliteTextCache | None = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory is not None or self.disk is not None
+
+    def get(self, key: str) -> str | None:
+        text = self.memory.get(key) if self.memory is not None else None
+        if text is None and self.disk is not None:
+            text = self.disk.get(key)
+            if text is not None and self.memory is not None:
+                self.memory.put(key, text)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        if self.memory is not None:
+            self.memory.put(key, text)
+        if self.disk is not None:
+            self.disk.put(key, text)
+
+
+def build_text_cache(max_chars: int, path: str = "", disk_max_entries: int = 10000) -> TextCache:
+    """Memory tier unless max_chars is 0; disk tier when a path is given."""
+    memory = MemoryTextCache(max_chars) if max_chars else None
+    disk = SqliteTextCache(path, disk_max_entries) if path else None
+    return TextCache(memory, disk)
+
+
+text_cache = build_text_cache(
+    settings.text_cache_max_chars, settings.text_cache_path, settings.text_cache_disk_max_entries
+)
@@ -0,0 +1,106 @@
+"""
+Uploaded files, held in memory when small and spooled to disk otherwise.
+
+Under concurrency every buffered upload is resident memory, and a bytes copy
+per parsing stage multiplies it. Uploads over a threshold are written to a
+temporary file as they are received; the extractors (PyMuPDF, zipfile, the
+sandbox workers) then open that path themselves instead of being handed the
+bytes.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import weakref
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class Upload:
+    """
+    One received file. `source` is what the extractors take: the bytes for an
+    in-memory upload, or the path of the spooled file. Call close() once the
+    file is no longer needed; a spooled file is also removed if the Upload is
+    garbage-collected without being closed.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        size: int,
+        sha256: str,
+        data: bytes | None = None,
+        path: str | None = None,
+    ):
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256  # of the content; a stable key for caching
+        self.data = data
+        self.path = path
+        self._cleanup = weakref.finalize(self, _unlink, path) if path else None
+
+    @property
+    def spooled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def source(self) -> bytes | str:
+        return self.data if self.path is None else self.path
+
+    def close(self) -> None:
+        if self._cleanup is not None:
+            self._cleanup()
+
+
+class UploadSpool:
+    """Accumulates an upload in memory, moving it to a temp file past `threshold` bytes."""
+
+    def __init__(self, filename: str, threshold: int, directory: str | None = None):
+        self.filename = filename
+        self.threshold = threshold
+        self.directory = directory
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer: io.BytesIO | None = io.BytesIO()
+        self._file = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def will_spill(self, chunk_size: int) -> bool:
+        """Whether writing `chunk_size` more bytes touches the disk."""
+        return self.on_disk or self.size + chunk_size > self.threshold
+
+    def write(self, chunk: bytes) -> None:
+        if self._file is None and self.size + len(chunk) > self.threshold:
+            ext = os.path.splitext(self.filename)[1]
+            self._file = tempfile.NamedTemporaryFile(
+                prefix="upload-", suffix=ext, dir=self.directory, delete=False
+            )
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def finish(self) -> Upload:
+        if self._file is None:
+            return Upload(self.filename, self.size, self._hash.hexdigest(), data=self._buffer.getvalue())
+        self._file.close()
+        return Upload(self.filename, self.size, self._hash.hexdigest(), path=self._file.name)
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            _unlink(self._file.name)
+        self._buffer = None
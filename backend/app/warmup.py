@@ -0,0 +1,94 @@
+"""
+Start-up warm-up and readiness.
+
+Without a warm-up, the first requests after a deploy pay for reading the
+templates, importing PyMuPDF, spawning sandbox workers and building the model
+client. The lifespan starts warm_up() in the background; /health answers
+straight away (the process is alive) while /ready answers 503 until every
+step has finished, so a load balancer only routes traffic to warm instances.
+Each step's duration is reported by /ready.
+"""
+
+import importlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from app.api.routes import fill_arguments
+from app.config import settings
+from app.engine.docx_engine import fill_template, preload_template
+from app.executors import fill_executor, io_executor
+from app.extraction import sandbox
+from app.extraction.ai_extractor import get_client, normalize_fields
+from app.models.template_registry import TEMPLATES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Readiness:
+    ready: bool = False
+    error: str | None = None
+    steps_ms: dict[str, int] = field(default_factory=dict)
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "error": self.error, "warmup_ms": self.steps_ms}
+
+
+readiness = Readiness()
+
+
+async def _load_templates() -> None:
+    for template_type, info in TEMPLATES.items():
+        if not await io_executor.run(preload_template, str(info.path)):
+            raise ValueError(f"template '{template_type}' has no placeholders")
+
+
+async def _import_extractors() -> None:
+    await io_executor.run(importlib.import_module, "fitz")
+
+
+async def _start_sandbox() -> None:
+    if not settings.sandbox_enabled:
+        return
+    pool = sandbox.get_pool()
+    pool.prestart(settings.sandbox_workers)
+    # One round trip, so at least one worker has finished booting.
+    await io_executor.run(pool.run, b"warm-up", "warmup.txt")
+
+
+async def _init_model_client() -> None:
+    get_client()
+
+
+async def _dry_run_fills() -> None:
+    for info in TEMPLATES.values():
+        await fill_executor.run(fill_template, *fill_arguments(info, normalize_fields(info, {})))
+
+
+def _steps() -> list[tuple[str, Callable[[], Awaitable[None]]]]:
+    steps = [
+        ("templates", _load_templates),
+        ("extractors", _import_extractors),
+        ("sandbox", _start_sandbox),
+        ("model_client", _init_model_client),
+    ]
+    if settings.warmup_dry_run_fill:
+        steps.append(("dry_run_fill", _dry_run_fills))
+    return steps
+
+
+async def warm_up(state: Readiness = readiness) -> None:
+    """Run every warm-up step, then mark `state` ready (or record the failure)."""
+    for name, step in _steps():
+        started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            state.error = f"{name}: {e}"
+            logger.exception("warm-up step %s failed", name)
+            return
+        state.steps_ms[name] = round((time.perf_counter() - started) * 1000)
+    state.ready = True
+    logger.info("warm-up finished: %s", state.steps_ms)
@@ -0,0 +1,97 @@
+"""
+Text extraction from large .docx uploads: legacy vs current extractor.
+
+The legacy extractor (one line per <w:t>, whole part parsed in memory) is kept
+here as the baseline. Synthetic documents mimic Word output: every sentence
+split across several formatted runs, plus tables and a header/footer.
+
+    python -m benchmarks.docx_extraction [--paragraphs 20000]
+
+Reports wall time, peak Python heap (tracemalloc), output lines, characters
+and estimated tokens for each extractor. The token estimate is character
+based, so it understates the saving from no longer emitting a newline per run.
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+import zipfile
+
+from app.engine.xml_utils import NS, T, secure_fromstring
+from app.extraction.routing import estimate_tokens
+from app.extraction.text_extractor import extract_text
+
+RUN = '<w:r><w:rPr><w:b w:val="{b}"/><w:sz w:val="22"/></w:rPr><w:t xml:space="preserve">{text}</w:t></w:r>'
+WORDS = "The monitor reviewed informed consent forms and source documents at the site".split()
+
+
+def _paragraph(i: int, runs: int = 5) -> str:
+    words = WORDS[i % 4:] + [str(i)]
+    chunk = max(1, len(words) // runs)
+    pieces = [" ".join(words[j:j + chunk]) + " " for j in range(0, len(words), chunk)]
+    return "<w:p>" + "".join(RUN.format(b=k % 2, text=p) for k, p in enumerate(pieces)) + "</w:p>"
+
+
+def _table(i: int) -> str:
+    rows = "".join(
+        f"<w:tr><w:tc>{_paragraph(i + r, 2)}</w:tc><w:tc>{_paragraph(i + r + 1, 2)}</w:tc></w:tr>"
+        for r in range(5)
+    )
+    return f"<w:tbl>{rows}</w:tbl>"
+
+
+def make_docx(paragraphs: int) -> bytes:
+    body = "".join(_table(i) if i % 50 == 0 else _paragraph(i) for i in range(paragraphs))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", f'<w:document xmlns:w="{NS}"><w:body>{body}</w:body></w:document>')
+        zf.writestr("word/header1.xml", f'<w:hdr xmlns:w="{NS}">{_paragraph(1)}</w:hdr>')
+        zf.writestr("word/footer1.xml", f'<w:ftr xmlns:w="{NS}">{_paragraph(2)}</w:ftr>')
+    return buf.getvalue()
+
+
+def legacy_extract_docx(file_bytes: bytes) -> str:
+    """The extractor before paragraph-aware streaming (baseline)."""
+    texts = []
+    with zipfile.ZipFile(io.BytesIO(file_bytes), "r") as zf:
+        tree = secure_fromstring(zf.read("word/document.xml"))
+        for t_elem in tree.iter(T):
+            if t_elem.text:
+                texts.append(t_elem.text)
+    return "\n".join(texts)
+
+
+def _measure(fn, data: bytes) -> tuple[float, int, str]:
+    """Wall time (untraced run) and peak traced heap (separate run)."""
+    started = time.perf_counter()
+    text = fn(data)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[2000, 20000])
+    args = parser.parse_args()
+
+    print(
+        f"{'paragraphs':>10} {'docx KB':>8} {'extractor':<9} {'ms':>7} {'peak MB':>8} "
+        f"{'lines':>7} {'chars':>9} {'~tokens':>8}"
+    )
+    for n in args.paragraphs:
+        data = make_docx(n)
+        for name, fn in (("legacy", legacy_extract_docx), ("current", lambda d: extract_text(d, "x.docx"))):
+            elapsed, peak, text = _measure(fn, data)
+            print(
+                f"{n:>10} {len(data) // 1024:>8} {name:<9} {elapsed * 1000:>7.0f} "
+                f"{peak / 2**20:>8.1f} {text.count(chr(10)) + 1:>7} {len(text):>9} {estimate_tokens(text):>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
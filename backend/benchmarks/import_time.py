@@ -0,0 +1,81 @@
+"""
+Cold import time of the application and of the engine alone.
+
+Each measurement is a fresh interpreter running `python -c "import <module>"`,
+so nothing is cached in-process; the best of several runs is reported to
+filter out scheduler noise. With --top, also lists the slowest imports
+(cumulative, from `python -X importtime`) so a regression can be traced to
+the module that caused it.
+
+    python -m benchmarks.import_time [--runs 5] [--top 15] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ("app.main", "app.engine")
+
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+
+
+def import_seconds(module: str, runs: int = 5) -> list[float]:
+    """Wall time of `runs` cold imports of `module`, each in a new interpreter."""
+    baseline = _timed("pass")
+    return [max(0.0, _timed(f"import {module}") - baseline) for _ in range(runs)]
+
+
+def _timed(code: str) -> float:
+    started = time.perf_counter()
+    _python("-c", code)
+    return time.perf_counter() - started
+
+
+def loaded_modules(module: str) -> set[str]:
+    """Names in sys.modules after importing `module` in a fresh interpreter."""
+    out = _python("-c", f"import sys, {module}; print('\\n'.join(sys.modules))").stdout
+    return set(out.split())
+
+
+def _importtime(code: str) -> list[tuple[int, str]]:
+    rows = []
+    for line in _python("-X", "importtime", "-c", code).stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return rows
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    """The `top` imports caused by `module` with the largest cumulative time (microseconds)."""
+    startup = {name for _, name in _importtime("pass")}
+    rows = [(t, name) for t, name in _importtime(f"import {module}") if name not in startup]
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports")
+    args = parser.parse_args()
+
+    print(f"{'module':<16} {'best ms':>8} {'median ms':>10}  (interpreter start-up subtracted)")
+    for module in args.modules:
+        times = import_seconds(module, args.runs)
+        print(f"{module:<16} {min(times) * 1000:>8.0f} {statistics.median(times) * 1000:>10.0f}")
+        for cumulative, name in slowest_imports(module, args.top):
+            print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
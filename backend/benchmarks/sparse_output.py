@@ -0,0 +1,122 @@
+"""
+Output tokens and latency of the dense vs sparse extraction contract.
+
+Record real responses once (needs ANTHROPIC_API_KEY), then report from the
+recordings as often as needed:
+
+    python -m benchmarks.sparse_output --record path/to/samples/
+    python -m benchmarks.sparse_output
+
+Sample files are named `<template>_<anything>.{txt,pdf,docx}`, e.g.
+`monitoring_site12.pdf`. Each is sent once per mode with the template's full
+max_tokens, and the response, usage and wall time are saved under
+benchmarks/recorded/. Without recordings the report still shows the offline
+estimate of what the dense contract spends echoing every key.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.extraction.ai_extractor import normalize_fields
+from app.extraction.prompts import SYSTEM_PROMPT, build_extraction_prompt
+from app.extraction.routing import estimate_tokens
+from app.extraction.text_extractor import extract_text
+from app.models.template_registry import TEMPLATES, get_template
+
+RECORDED_DIR = Path(__file__).resolve().parent / "recorded"
+MODES = ("dense", "sparse")
+
+
+async def record(samples_dir: Path) -> None:
+    import anthropic
+
+    client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key, timeout=300.0)
+    RECORDED_DIR.mkdir(exist_ok=True)
+    for path in sorted(samples_dir.iterdir()):
+        template_type = path.name.split("_", 1)[0]
+        if template_type not in TEMPLATES:
+            continue
+        info = get_template(template_type)
+        text = extract_text(path.read_bytes(), path.name)
+        for mode in MODES:
+            prompt = build_extraction_prompt(template_type, info.placeholders, text, sparse=mode == "sparse")
+            started = time.perf_counter()
+            message = await client.messages.create(
+                model=settings.anthropic_model,
+                max_tokens=info.max_tokens,
+                system=SYSTEM_PROMPT,
+                messages=[{"role": "user", "content": prompt}],
+            )
+            latency_ms = round((time.perf_counter() - started) * 1000)
+            response_text = next((b.text for b in message.content if b.type == "text"), "")
+            out = RECORDED_DIR / f"{path.stem}.{mode}.json"
+            out.write_text(json.dumps({
+                "template_type": template_type,
+                "mode": mode,
+                "source": path.name,
+                "model": settings.anthropic_model,
+                "input_tokens": message.usage.input_tokens,
+                "output_tokens": message.usage.output_tokens,
+                "latency_ms": latency_ms,
+                "response": response_text,
+            }, indent=2))
+            print(f"recorded {out.name}: {message.usage.output_tokens} output tokens, {latency_ms} ms")
+
+
+def _dense_skeleton(keys: list[str]) -> str:
+    """What a dense answer with no content looks like: every key echoed empty."""
+    return json.dumps(dict.fromkeys(keys, ""), indent=2)
+
+
+def _non_empty_fields(template_type: str, response: str) -> int:
+    """How many fields survive normalisation with content (a quality check)."""
+    try:
+        fields = normalize_fields(get_template(template_type), json.loads(response))
+    except json.JSONDecodeError:
+        return -1
+    return sum(1 for v in fields.values() if v not in ("", []))
+
+
+def report() -> None:
+    print("Offline estimate: output tokens the dense contract spends on the key skeleton")
+    for template_type, info in TEMPLATES.items():
+        if info.structured:
+            continue
+        print(f"  {template_type:<11} {len(info.placeholders):>3} keys ~{estimate_tokens(_dense_skeleton(info.placeholders)):>5} tokens")
+
+    runs = [json.loads(p.read_text()) for p in sorted(RECORDED_DIR.glob("*.json"))] if RECORDED_DIR.exists() else []
+    if not runs:
+        print("\nNo recorded responses. Run with --record <samples dir> first.")
+        return
+
+    print(f"\n{'template':<11} {'mode':<7} {'n':>3} {'out tok':>8} {'latency ms':>11} {'filled':>7}")
+    for template_type in TEMPLATES:
+        by_mode = {m: [r for r in runs if r["template_type"] == template_type and r["mode"] == m] for m in MODES}
+        if not by_mode["dense"] or not by_mode["sparse"]:
+            continue
+        means = {}
+        for mode, rs in by_mode.items():
+            means[mode] = statistics.mean(r["output_tokens"] for r in rs)
+            latency = statistics.mean(r["latency_ms"] for r in rs)
+            filled = statistics.mean(_non_empty_fields(template_type, r["response"]) for r in rs)
+            print(f"{template_type:<11} {mode:<7} {len(rs):>3} {means[mode]:>8.0f} {latency:>11.0f} {filled:>7.1f}")
+        saved = 1 - means["sparse"] / means["dense"] if means["dense"] else 0
+        print(f"{'':<11} output tokens saved: {saved:.0%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", type=Path, metavar="SAMPLES_DIR", help="call the API and save responses")
+    args = parser.parse_args()
+    if args.record:
+        asyncio.run(record(args.record))
+    report()
+
+
+if __name__ == "__main__":
+    main()
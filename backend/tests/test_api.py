@@ -1,15 +1,20 @@
 """Tests for FastAPI endpoints (mocking the AI layer)."""
 
+import asyncio
 import io
 import json
+import time
 import zipfile
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from httpx import ASGITransport, AsyncClient
 
+from app.api import routes
+from app.extraction import sandbox
 from app.main import app
 from app.models.template_registry import get_template
+from app.storage.text_cache import build_text_cache
 
 
 @pytest.fixture
@@ -116,6 +121,27 @@ async def test_format_all_template_types(mock_extract, client):
         assert resp.status_code == 200, f"Failed for {template_type}: {resp.text}"
 
 
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_model_call_scheduling_is_reported_in_headers(mock_extract, client):
+    from app.extraction.ai_extractor import _call_stats
+
+    values = _mock_extract_fields("capa")
+
+    async def mock_fn(t_type, doc_text):
+        stats = _call_stats.get()
+        stats.queue_wait_ms, stats.coalesced = 42, True
+        return await values(t_type, doc_text)
+    mock_extract.side_effect = mock_fn
+
+    for path in ("/api/format", "/api/extract"):
+        files = {"file": ("capa.txt", io.BytesIO(b"CAPA notes."), "text/plain")}
+        resp = await client.post(path, files=files, data={"template_type": "capa"})
+        assert resp.status_code == 200
+        assert resp.headers["x-model-queue-wait-ms"] == "42"
+        assert resp.headers["x-model-coalesced"] == "true"
+
+
 class TestFrontendOrigins:
     """CORS origin parsing from the FRONTEND_URL setting."""
 
@@ -155,3 +181,775 @@ async def test_format_general_structured(mock_extract, client):
     assert 'filename="general_formatted.docx"' in resp.headers["content-disposition"]
     with zipfile.ZipFile(io.BytesIO(resp.content), "r") as zf:
         assert zf.testzip() is None
+
+
+def _parse_sse(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_format_stream_reports_stages_and_download(mock_extract, client):
+    values = _mock_extract_fields("deviation")
+
+    async def mock_fn(t_type, doc_text, on_progress=None):
+        on_progress(1)
+        on_progress(2)
+        return await values(t_type, doc_text)
+    mock_extract.side_effect = mock_fn
+
+    files = {"file": ("notes.txt", io.BytesIO(b"Deviation notes."), "text/plain")}
+    resp = await client.post("/api/format/stream", files=files, data={"template_type": "deviation"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+    events = _parse_sse(resp.text)
+    stages = [d["stage"] for e, d in events if e == "stage"]
+    assert stages == [
+        "upload_read", "text_extracted", "model_started",
+        "model_finished", "fill_started", "fill_finished",
+    ]
+    assert events[1][1]["characters"] == len("Deviation notes.")
+    assert [d["fields_received"] for e, d in events if e == "model"] == [1, 2]
+
+    event, done = events[-1]
+    assert event == "done"
+    assert {"extract_text_ms", "extract_fields_ms", "fill_ms", "total_ms"} <= done["timings"].keys()
+
+    download = await client.get(done["download_url"])
+    assert download.status_code == 200
+    assert 'filename="deviation_formatted.docx"' in download.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(download.content), "r") as zf:
+        assert zf.testzip() is None
+
+
+@pytest.mark.anyio
+async def test_format_stream_reports_errors_as_events(client):
+    files = {"file": ("blank.txt", io.BytesIO(b"   \n"), "text/plain")}
+    resp = await client.post("/api/format/stream", files=files, data={"template_type": "sop"})
+    assert resp.status_code == 200
+    event, data = _parse_sse(resp.text)[-1]
+    assert event == "error"
+    assert data["status_code"] == 400
+    assert "No text content" in data["detail"]
+
+
+@pytest.mark.anyio
+async def test_format_stream_validates_before_streaming(client):
+    files = {"file": ("test.txt", io.BytesIO(b"text"), "text/plain")}
+    resp = await client.post("/api/format/stream", files=files, data={"template_type": "invalid"})
+    assert resp.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_download_unknown_token(client):
+    resp = await client.get("/api/format/download/does-not-exist")
+    assert resp.status_code == 404
+
+
+async def _wait_for_job(client, status_url: str) -> dict:
+    for _ in range(200):
+        status = (await client.get(status_url)).json()
+        if status["status"] in ("succeeded", "failed"):
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job did not finish: {status}")
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_job_lifecycle(mock_extract, client):
+    mock_extract.side_effect = _mock_extract_fields("capa")
+
+    files = {"file": ("capa.txt", io.BytesIO(b"CAPA notes."), "text/plain")}
+    resp = await client.post("/api/jobs", files=files, data={"template_type": "capa"})
+    assert resp.status_code == 202
+    job = resp.json()
+    assert job["status"] in ("queued", "running", "succeeded")
+
+    status = await _wait_for_job(client, job["status_url"])
+    assert status["status"] == "succeeded"
+
+    result = await client.get(job["result_url"])
+    assert result.status_code == 200
+    assert 'filename="capa_formatted.docx"' in result.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(result.content), "r") as zf:
+        assert zf.testzip() is None
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_job_result_store_io_runs_off_the_event_loop(mock_extract, client, tmp_path, monkeypatch):
+    import threading
+
+    from app.jobs.manager import job_manager
+    from app.storage.results import SqliteResultStore
+
+    threads = []
+
+    class RecordingStore(SqliteResultStore):
+        def put(self, *args):
+            threads.append(threading.get_ident())
+            return super().put(*args)
+
+        def get(self, *args):
+            threads.append(threading.get_ident())
+            return super().get(*args)
+
+    monkeypatch.setattr(job_manager, "store", RecordingStore(str(tmp_path / "results.sqlite3"), ttl_seconds=60))
+    mock_extract.side_effect = _mock_extract_fields("capa")
+    files = {"file": ("capa.txt", io.BytesIO(b"CAPA notes."), "text/plain")}
+    job = (await client.post("/api/jobs", files=files, data={"template_type": "capa"})).json()
+    assert (await _wait_for_job(client, job["status_url"]))["status"] == "succeeded"
+    assert (await client.get(job["result_url"])).status_code == 200
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.anyio
+async def test_job_failure_surfaces_pipeline_error(client):
+    files = {"file": ("blank.txt", io.BytesIO(b"  "), "text/plain")}
+    resp = await client.post("/api/jobs", files=files, data={"template_type": "sop"})
+    status = await _wait_for_job(client, resp.json()["status_url"])
+    assert status["status"] == "failed"
+    assert status["error_status"] == 400
+
+    result = await client.get(status["result_url"])
+    assert result.status_code == 400
+    assert "No text content" in result.json()["detail"]
+
+
+@pytest.mark.anyio
+async def test_unknown_job(client):
+    assert (await client.get("/api/jobs/nope")).status_code == 404
+    assert (await client.get("/api/jobs/nope/result")).status_code == 404
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_batch_returns_zip_with_manifest(mock_extract, client):
+    async def mock_fn(t_type, doc_text):
+        return await _mock_extract_fields(t_type)(t_type, doc_text)
+    mock_extract.side_effect = mock_fn
+
+    files = [
+        ("files", ("visit 1.txt", io.BytesIO(b"First visit."), "text/plain")),
+        ("files", ("visit2.txt", io.BytesIO(b"Second visit."), "text/plain")),
+        ("files", ("empty.txt", io.BytesIO(b""), "text/plain")),
+        ("files", ("sheet.xlsx", io.BytesIO(b"data"), "application/octet-stream")),
+    ]
+    data = {"template_types": ["monitoring", "deviation", "sop", "sop"]}
+    resp = await client.post("/api/batch", files=files, data=data)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(resp.content), "r") as zf:
+        assert zf.testzip() is None
+        manifest = json.loads(zf.read("manifest.json"))["files"]
+        assert [m["status"] for m in manifest] == ["ok", "ok", "error", "error"]
+        assert manifest[0]["output"] == "001_visit_1_monitoring.docx"
+        assert "fill_ms" in manifest[0]["timings"]
+        assert "Unsupported file type" in manifest[3]["detail"]
+        names = set(zf.namelist())
+        assert {"001_visit_1_monitoring.docx", "002_visit2_deviation.docx"} <= names
+        inner = zipfile.ZipFile(io.BytesIO(zf.read("002_visit2_deviation.docx")))
+        assert inner.testzip() is None
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_batch_single_template_applies_to_all(mock_extract, client):
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    files = [("files", (f"f{i}.txt", io.BytesIO(b"SOP text"), "text/plain")) for i in range(3)]
+    resp = await client.post("/api/batch", files=files, data={"template_types": "sop"})
+    with zipfile.ZipFile(io.BytesIO(resp.content), "r") as zf:
+        manifest = json.loads(zf.read("manifest.json"))["files"]
+    assert [m["status"] for m in manifest] == ["ok"] * 3
+
+
+@pytest.mark.anyio
+async def test_batch_template_count_mismatch(client):
+    files = [("files", (f"f{i}.txt", io.BytesIO(b"x"), "text/plain")) for i in range(3)]
+    resp = await client.post("/api/batch", files=files, data={"template_types": ["sop", "capa"]})
+    assert resp.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_batch_total_size_is_capped(client, monkeypatch):
+    from app.api import routes
+
+    monkeypatch.setattr(routes.settings, "batch_max_total_bytes", 25)
+    files = [("files", (f"f{i}.txt", io.BytesIO(b"0123456789"), "text/plain")) for i in range(3)]
+    resp = await client.post("/api/batch", files=files, data={"template_types": "sop"})
+    assert resp.status_code == 400
+    assert "Batch too large" in resp.json()["detail"]
+
+    limits = routes.upload_body_limits("/api")
+    assert limits["/api/batch"] < routes.settings.batch_max_files * routes.MAX_FILE_SIZE
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_extract_returns_fields(mock_extract, client):
+    mock_extract.side_effect = _mock_extract_fields("training")
+    files = {"file": ("t.txt", io.BytesIO(b"Training log."), "text/plain")}
+    resp = await client.post("/api/extract", files=files, data={"template_type": "training"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["template_type"] == "training"
+    assert body["structured"] is False
+    assert body["fields"]["TRAINER_NAME"] == "Test trainer_name"
+
+
+@pytest.mark.anyio
+async def test_fill_flat_ignores_unknown_and_backfills(client):
+    body = {"template_type": "sop", "fields": {"SOP_TITLE": "Edited title", "NOT_A_KEY": "x"}}
+    resp = await client.post("/api/fill", json=body)
+    assert resp.status_code == 200
+    assert 'filename="sop_formatted.docx"' in resp.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(resp.content), "r") as zf:
+        document = zf.read("word/document.xml").decode()
+    assert "Edited title" in document
+    assert "{{PURPOSE}}" not in document
+
+
+@pytest.mark.anyio
+async def test_fill_structured_normalizes_input(client):
+    body = {
+        "template_type": "general",
+        "fields": {
+            "DOCUMENT_TITLE": "Plan",
+            "abbreviations": [{"term": "EDC", "definition": "Electronic Data Capture"}, "junk"],
+            "sections": [{"title": "Intro", "content": "Body."}],
+        },
+    }
+    resp = await client.post("/api/fill", json=body)
+    assert resp.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(resp.content), "r") as zf:
+        document = zf.read("word/document.xml").decode()
+    assert "Electronic Data Capture" in document
+    assert "Intro" in document
+
+
+@pytest.mark.anyio
+async def test_fill_body_and_field_sizes_are_capped(client):
+    from app.api import routes
+
+    long_value = "x" * (routes.MAX_FIELD_CHARS + 1)
+    resp = await client.post("/api/fill", json={"template_type": "sop", "fields": {"PURPOSE": long_value}})
+    assert resp.status_code == 400
+    assert "Field value too long" in resp.json()["detail"]
+
+    nested = {"sections": [{"title": "Intro", "content": long_value}]}
+    resp = await client.post("/api/fill", json={"template_type": "general", "fields": nested})
+    assert resp.status_code == 400
+
+    huge = {"template_type": "sop", "fields": {f"K{i}": "x" * 1000 for i in range(1100)}}
+    resp = await client.post("/api/fill", json=huge)
+    assert resp.status_code == 400
+    assert "Request too large" in resp.json()["detail"]
+
+
+@pytest.mark.anyio
+async def test_fill_unknown_template(client):
+    resp = await client.post("/api/fill", json={"template_type": "nope", "fields": {}})
+    assert resp.status_code == 400
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_large_upload_is_spooled_and_removed(mock_extract, client, tmp_path, monkeypatch):
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    monkeypatch.setattr(routes.settings, "upload_spool_threshold_bytes", 16)
+    monkeypatch.setattr(routes.settings, "upload_spool_dir", str(tmp_path))
+    monkeypatch.setattr(routes, "text_cache", build_text_cache(0))
+    sources = []
+    extract = routes.extract_text_isolated
+
+    def spy(source, filename):
+        sources.append(source)
+        return extract(source, filename)
+
+    monkeypatch.setattr(routes, "extract_text_isolated", spy)
+    files = {"file": ("long.txt", io.BytesIO(b"A long SOP document. " * 100), "text/plain")}
+    resp = await client.post("/api/format", files=files, data={"template_type": "sop"})
+    assert resp.status_code == 200
+    assert isinstance(sources[0], str) and sources[0].startswith(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_repeat_upload_reuses_extracted_text(mock_extract, client, monkeypatch):
+    mock_extract.side_effect = _mock_extract_fields("deviation")
+    monkeypatch.setattr(routes, "text_cache", build_text_cache(10_000))
+    calls = []
+    extract = routes.extract_text_isolated
+
+    def spy(source, filename):
+        calls.append(filename)
+        return extract(source, filename)
+
+    monkeypatch.setattr(routes, "extract_text_isolated", spy)
+    for template_type in ("deviation", "deviation"):
+        files = {"file": ("report.txt", io.BytesIO(b"Deviation on line 3."), "text/plain")}
+        resp = await client.post("/api/format", files=files, data={"template_type": template_type})
+        assert resp.status_code == 200
+    assert calls == ["report.txt"]
+    assert routes.text_cache.hits == 1
+
+
+@pytest.mark.anyio
+async def test_oversized_content_length_rejected_before_body_is_read():
+    sent = []
+
+    async def receive():
+        raise AssertionError("body was read")
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/format",
+        "raw_path": b"/api/format",
+        "query_string": b"",
+        "headers": [(b"content-length", str(50 * 1024 * 1024).encode()), (b"host", b"test")],
+        "scheme": "http",
+        "server": ("test", 80),
+        "client": ("client", 1234),
+        "root_path": "",
+        "http_version": "1.1",
+        "asgi": {"version": "3.0"},
+    }
+    await app(scope, receive, send)
+    assert sent[0]["status"] == 400
+    assert b"Request too large" in sent[1]["body"]
+
+
+# Sandbox targets run in spawned worker processes, so they must be importable
+# module-level functions.
+def _sandbox_sleep(file_bytes: bytes, filename: str) -> str:
+    time.sleep(60)
+    return ""
+
+
+def _sandbox_spin(file_bytes: bytes, filename: str) -> str:
+    while True:
+        pass
+
+
+def _sandbox_hog(file_bytes: bytes, filename: str) -> str:
+    return bytes(2 * 1024**3).decode()
+
+
+@pytest.fixture
+def sandbox_pool(monkeypatch):
+    """Install a sandbox pool running `target` under the given limits."""
+    pools = []
+
+    def install(target, timeout=30.0, cpu_seconds=0, memory_mb=0):
+        pool = sandbox.SandboxPool(
+            workers=1,
+            max_jobs_per_worker=10,
+            timeout=timeout,
+            limits=sandbox.SandboxLimits(cpu_seconds=cpu_seconds, memory_bytes=memory_mb * 1024 * 1024),
+            target=target,
+        )
+        pools.append(pool)
+        monkeypatch.setattr(sandbox.settings, "sandbox_enabled", True)
+        monkeypatch.setattr(sandbox, "_pool", pool)
+        monkeypatch.setattr(routes, "text_cache", build_text_cache(0))  # always reach the pool
+        return pool
+
+    yield install
+    for pool in pools:
+        pool.shutdown()
+
+
+async def _format_txt(client):
+    files = {"file": ("notes.txt", io.BytesIO(b"Some notes."), "text/plain")}
+    return await client.post("/api/format", files=files, data={"template_type": "sop"})
+
+
+@pytest.mark.anyio
+async def test_sandbox_timeout_is_a_400(client, sandbox_pool):
+    sandbox_pool(_sandbox_sleep, timeout=1.0)
+    resp = await _format_txt(client)
+    assert resp.status_code == 400
+    assert "timed out" in resp.json()["detail"]
+
+
+@pytest.mark.anyio
+async def test_sandbox_cpu_limit_is_a_400(client, sandbox_pool):
+    sandbox_pool(_sandbox_spin, cpu_seconds=1)
+    resp = await _format_txt(client)
+    assert resp.status_code == 400
+    assert "CPU or memory limit" in resp.json()["detail"]
+
+
+@pytest.mark.anyio
+async def test_sandbox_memory_limit_is_a_400(client, sandbox_pool):
+    sandbox_pool(_sandbox_hog, memory_mb=1024)
+    resp = await _format_txt(client)
+    assert resp.status_code == 400
+    assert "memory limit" in resp.json()["detail"]
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_admission_sheds_with_retry_after(mock_extract, client, monkeypatch):
+    from app.api.admission import AdmissionLimits, admission
+    from app.extraction.resilience import LatencyTracker
+    from app.observability.metrics import admission_rejections_total
+
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    rejected = admission_rejections_total.value(reason="inflight")
+    monkeypatch.setattr(admission, "limits", AdmissionLimits(max_inflight=0, default_retry_after=7))
+    monkeypatch.setattr(admission, "request_latency", LatencyTracker())  # no history: default wait
+    files = {"file": ("sop.txt", io.BytesIO(b"SOP text."), "text/plain")}
+    resp = await client.post("/api/format", files=files, data={"template_type": "sop"})
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "7"
+    assert admission_rejections_total.value(reason="inflight") == rejected + 1
+    mock_extract.assert_not_called()
+
+    # Other routes are not gated.
+    assert (await client.get("/api/templates")).status_code == 200
+
+    monkeypatch.setattr(admission, "limits", AdmissionLimits())
+    files = {"file": ("sop.txt", io.BytesIO(b"SOP text."), "text/plain")}
+    resp = await client.post("/api/format", files=files, data={"template_type": "sop"})
+    assert resp.status_code == 200
+    assert admission.inflight == 0
+
+
+@pytest.mark.anyio
+async def test_admission_retry_after_tracks_drain_time():
+    from app.api.admission import AdmissionController, AdmissionLimits
+
+    controller = AdmissionController(AdmissionLimits(max_inflight=2))
+    for _ in range(5):
+        controller.request_latency.record(4.0)
+    controller.inflight = 3  # two over capacity, draining two at a time
+    rejection = controller.check()
+    assert (rejection.reason, rejection.retry_after) == ("inflight", 4)
+
+
+@pytest.mark.anyio
+async def test_admission_sheds_on_model_queue_wait(monkeypatch):
+    from types import SimpleNamespace
+
+    from app.api import admission
+    from app.extraction.resilience import LatencyTracker
+
+    latency = LatencyTracker(min_samples=1)
+    latency.record(20.0)
+    monkeypatch.setattr(admission, "model_latency", latency)
+    controller = admission.AdmissionController(admission.AdmissionLimits(max_model_wait=30.0))
+
+    # One full round of calls ahead: ~20 s, within the limit.
+    monkeypatch.setattr(admission, "model_limiter", SimpleNamespace(limit=4, active=4, waiting=3))
+    assert controller.check() is None
+
+    # Three rounds ahead: ~60 s, 30 s over.
+    monkeypatch.setattr(admission, "model_limiter", SimpleNamespace(limit=4, active=4, waiting=11))
+    rejection = controller.check()
+    assert (rejection.reason, rejection.retry_after) == ("model", 30)
+
+
+def test_fill_priority_scales_with_content_and_structure(monkeypatch):
+    from app.api.scheduling import fill_priority
+    from app.config import settings
+
+    flat = get_template("deviation")
+    general = get_template("general")
+    small = {"TITLE": "x" * 100}
+    large = {"TITLE": "x" * 100_000}
+    sections = {"sections": [{"heading": "x" * 50, "content": "x" * 100_000}]}
+    assert fill_priority(flat, small) < fill_priority(flat, large) < fill_priority(general, sections)
+
+    monkeypatch.setattr(settings, "scheduler_sjf", False)
+    assert fill_priority(general, sections) == 0.0
+
+
+def _slow_extract(started: asyncio.Event, outcome: list):
+    async def mock_fn(t_type, doc_text):
+        started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            outcome.append("cancelled")
+            raise
+        return {}
+    return mock_fn
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.fill_template")
+@patch("app.api.routes.extract_fields")
+async def test_request_deadline_cancels_model_call(mock_extract, mock_fill, client, monkeypatch):
+    from app.config import settings
+    from app.observability.metrics import requests_cancelled_total
+
+    outcome = []
+    mock_extract.side_effect = _slow_extract(asyncio.Event(), outcome)
+    monkeypatch.setattr(settings, "request_timeout_seconds", 0.3)
+    before = requests_cancelled_total.value(reason="deadline", stage="extract_fields")
+
+    files = {"file": ("sop.txt", io.BytesIO(b"SOP text."), "text/plain")}
+    started = time.perf_counter()
+    resp = await client.post("/api/format", files=files, data={"template_type": "sop"})
+    assert resp.status_code == 504
+    assert time.perf_counter() - started < 5
+    assert outcome == ["cancelled"]
+    mock_fill.assert_not_called()
+    assert requests_cancelled_total.value(reason="deadline", stage="extract_fields") == before + 1
+
+
+async def _post_format_then_disconnect(started: asyncio.Event, headers: dict | None = None) -> int:
+    """POST an SOP to /api/format over raw ASGI, disconnecting once `started` is set; returns the status."""
+    import httpx
+
+    request = httpx.Request(
+        "POST", "http://test/api/format", headers=headers,
+        files={"file": ("sop.txt", b"SOP text.", "text/plain")}, data={"template_type": "sop"},
+    )
+    body = request.read()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await started.wait()  # the tab closes once the model call is under way
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/format",
+        "raw_path": b"/api/format",
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+        "scheme": "http",
+        "server": ("test", 80),
+        "client": ("client", 1234),
+        "root_path": "",
+        "http_version": "1.1",
+        "asgi": {"version": "3.0"},
+    }
+    await app(scope, receive, send)
+    return next(m["status"] for m in sent if m["type"] == "http.response.start")
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.fill_template")
+@patch("app.api.routes.extract_fields")
+async def test_client_disconnect_cancels_pipeline(mock_extract, mock_fill):
+    from app.observability.metrics import requests_cancelled_total
+
+    started, outcome = asyncio.Event(), []
+    mock_extract.side_effect = _slow_extract(started, outcome)
+    before = requests_cancelled_total.value(reason="disconnect", stage="extract_fields")
+
+    await asyncio.wait_for(_post_format_then_disconnect(started), 5)
+    assert outcome == ["cancelled"]
+    mock_fill.assert_not_called()
+    assert requests_cancelled_total.value(reason="disconnect", stage="extract_fields") == before + 1
+
+
+@pytest.fixture
+def idempotency(monkeypatch):
+    from app.storage.idempotency import IdempotentResults
+    from app.storage.results import MemoryResultStore
+
+    results = IdempotentResults(MemoryResultStore(ttl_seconds=60, max_entries=8), linger=5.0)
+    monkeypatch.setattr(routes, "idempotent_results", results)
+    return results
+
+
+async def _post_format(client, content: bytes, key: str | None, template_type: str = "sop"):
+    files = {"file": ("sop.txt", io.BytesIO(content), "text/plain")}
+    headers = {"Idempotency-Key": key} if key else {}
+    return await client.post("/api/format", files=files, data={"template_type": template_type}, headers=headers)
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_idempotency_key_replays_completed_result(mock_extract, client, idempotency):
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    first = await _post_format(client, b"SOP text.", "key-1")
+    retry = await _post_format(client, b"SOP text.", "key-1")
+    assert first.status_code == retry.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.content == first.content
+    assert mock_extract.call_count == 1
+
+    # Same key with another upload or template is a different request.
+    await _post_format(client, b"Other SOP text.", "key-1")
+    await _post_format(client, b"SOP text.", "key-1", template_type="deviation")
+    assert mock_extract.call_count == 3
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_idempotency_key_attaches_concurrent_duplicate(mock_extract, client, idempotency):
+    release = asyncio.Event()
+    values = await _mock_extract_fields("sop")("sop", "")
+
+    async def gated(t_type, doc_text):
+        await release.wait()
+        return values
+
+    mock_extract.side_effect = gated
+    first = asyncio.create_task(_post_format(client, b"SOP text.", "key-2"))
+    second = asyncio.create_task(_post_format(client, b"SOP text.", "key-2"))
+    while mock_extract.call_count == 0:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    release.set()
+    responses = await asyncio.gather(first, second)
+    assert [r.status_code for r in responses] == [200, 200]
+    assert mock_extract.call_count == 1
+    assert sorted(r.headers.get("idempotent-replayed", "") for r in responses) == ["", "true"]
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_idempotency_key_does_not_store_failures(mock_extract, client, idempotency):
+    succeed = _mock_extract_fields("sop")
+
+    async def flaky(t_type, doc_text):
+        if mock_extract.call_count == 1:
+            raise RuntimeError("upstream down")
+        return await succeed(t_type, doc_text)
+
+    mock_extract.side_effect = flaky
+    assert (await _post_format(client, b"SOP text.", "key-3")).status_code == 500
+    retry = await _post_format(client, b"SOP text.", "key-3")
+    assert retry.status_code == 200
+    assert "idempotent-replayed" not in retry.headers
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_idempotent_run_survives_disconnect_for_retry(mock_extract, client, idempotency):
+    started, release = asyncio.Event(), asyncio.Event()
+    values = await _mock_extract_fields("sop")("sop", "")
+
+    async def gated(t_type, doc_text):
+        started.set()
+        await release.wait()
+        return values
+
+    mock_extract.side_effect = gated
+    status = await asyncio.wait_for(_post_format_then_disconnect(started, {"Idempotency-Key": "key-4"}), 5)
+    assert status == 499
+
+    # The retry re-uploads after the first connection is gone.
+    retry = asyncio.create_task(_post_format(client, b"SOP text.", "key-4"))
+    await asyncio.sleep(0.1)
+    release.set()
+    retry = await retry
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert mock_extract.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_idempotency_key_length_is_validated(client, idempotency):
+    assert (await _post_format(client, b"SOP text.", "k" * 300)).status_code == 400
+
+
+@pytest.mark.anyio
+async def test_stage_executors_do_not_starve_each_other():
+    import threading
+
+    from app.executors import StageExecutor
+
+    parse, render = StageExecutor("parse", 1), StageExecutor("render", 1)
+    release = threading.Event()
+    started = []
+
+    def wait():
+        started.append(1)
+        return release.wait(5)
+
+    blocked = [asyncio.create_task(parse.run(wait)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    assert (parse.busy, parse.waiting, parse.utilization) == (1, 2, 1.0)
+
+    # The other stage still gets a thread straight away.
+    assert await asyncio.wait_for(render.run(lambda: "rendered"), 1) == "rendered"
+    assert render.busy == 0
+
+    # A queued call whose caller gives up never runs.
+    blocked[2].cancel()
+    release.set()
+    assert await asyncio.gather(*blocked[:2]) == [True, True]
+    assert len(started) == 2
+    assert parse.waiting == 0
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_executor_gauges_on_metrics(mock_extract, client):
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    files = {"file": ("sop.txt", io.BytesIO(b"SOP text."), "text/plain")}
+    assert (await client.post("/api/format", files=files, data={"template_type": "sop"})).status_code == 200
+    body = (await client.get("/metrics")).text
+    assert 'tracescribe_executor_tasks{executor="extract_text",state="busy"} 0' in body
+    assert 'tracescribe_executor_utilization{executor="fill_template"} 0' in body
+
+
+@pytest.mark.anyio
+async def test_warm_up_reports_ready_with_step_timings(monkeypatch):
+    from app.config import settings
+    from app.warmup import Readiness, warm_up
+
+    monkeypatch.setattr(settings, "sandbox_enabled", False)
+    state = Readiness()
+    await warm_up(state)
+    assert state.ready and state.error is None
+    assert list(state.steps_ms) == ["templates", "extractors", "sandbox", "model_client", "dry_run_fill"]
+
+
+@pytest.mark.anyio
+async def test_warm_up_failure_keeps_instance_unready(monkeypatch):
+    from app import warmup
+    from app.models.template_registry import TemplateInfo
+
+    broken = TemplateInfo(file_name="missing.docx", display_name="Missing", description="", placeholders=[])
+    monkeypatch.setattr(warmup, "TEMPLATES", {"missing": broken})
+    state = warmup.Readiness()
+    await warmup.warm_up(state)
+    assert not state.ready
+    assert state.error.startswith("templates:")
+
+
+@pytest.mark.anyio
+async def test_ready_endpoint_gates_on_warm_up(client, monkeypatch):
+    from app.warmup import readiness
+
+    monkeypatch.setattr(readiness, "ready", False)
+    resp = await client.get("/ready")
+    assert resp.status_code == 503 and resp.json()["ready"] is False
+    assert (await client.get("/health")).status_code == 200
+
+    monkeypatch.setattr(readiness, "ready", True)
+    monkeypatch.setattr(readiness, "steps_ms", {"templates": 12})
+    resp = await client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.json()["warmup_ms"] == {"templates": 12}
@@ -89,6 +89,28 @@ class TestTemplateRegistry:
             )
 
 
+class TestTemplateLoading:
+    def test_template_is_read_once_until_it_changes(self, tmp_path):
+        import os
+        import shutil
+
+        from app.engine.docx_engine import load_template
+
+        path = tmp_path / "sop.docx"
+        shutil.copy(get_template("sop").path, path)
+        first = load_template(str(path))
+        assert load_template(str(path)) is first
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert load_template(str(path)) is not first
+
+    def test_preload_finds_every_placeholder(self):
+        from app.engine.docx_engine import preload_template
+
+        info = get_template("deviation")
+        assert preload_template(str(info.path)) == len(info.placeholders)
+
+
 class TestFillTemplateSOP:
     """Test filling the SOP template — the most complex one."""
 
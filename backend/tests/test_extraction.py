@@ -1,12 +1,45 @@
 """Tests for text extraction (non-AI components)."""
 
+import io
+import zipfile
+
 import pytest
 
+from app.engine.xml_utils import NS
 from app.extraction.text_extractor import extract_text
 from app.extraction.prompts import build_extraction_prompt, SYSTEM_PROMPT
 from app.models.template_registry import TEMPLATES, get_template
 
 
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _para(*runs: str) -> str:
+    """A <w:p> whose text is split across one formatted run per argument."""
+    body = "".join(
+        '<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">'
+        + r.replace("\t", "</w:t><w:tab/><w:t>")
+        + "</w:t></w:r>"
+        for r in runs
+    )
+    return f"<w:p>{body}</w:p>"
+
+
+def _part(root: str, body: str) -> str:
+    return f'<w:{root} xmlns:w="{NS}">{body}</w:{root}>'
+
+
+def _make_docx(body: str, extra_parts: dict[str, str] | None = None) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("word/document.xml", f'<w:document xmlns:w="{NS}"><w:body>{body}</w:body></w:document>')
+        for name, xml in (extra_parts or {}).items():
+            zf.writestr(name, xml)
+    return buf.getvalue()
+
+
 class TestTextExtractorTxt:
     def test_utf8(self):
         text = "Hello, world!".encode("utf-8")
@@ -34,6 +67,163 @@ class TestTextExtractorDocx:
         with pytest.raises(Exception):
             extract_text(b"not a zip", "bad.docx")
 
+    def test_runs_joined_per_paragraph(self):
+        body = _para("Sentence ", "split ", "across ", "five ", "runs.") + _para("Second", "\tline")
+        text = extract_text(_make_docx(body), "doc.docx")
+        assert text.splitlines() == ["Sentence split across five runs.", "Second\tline"]
+
+    def test_tables_render_as_delimited_rows(self):
+        table = (
+            f'<w:tbl><w:tr><w:tc>{_para("Name")}</w:tc><w:tc>{_para("Role")}</w:tc></w:tr>'
+            f'<w:tr><w:tc>{_para("A. ", "Smith")}</w:tc><w:tc>{_para("PI")}{_para("Lead")}</w:tc></w:tr>'
+            f'<w:tr><w:tc>{_para("")}</w:tc><w:tc/></w:tr></w:tbl>'
+        )
+        text = extract_text(_make_docx(_para("Team") + table), "doc.docx")
+        assert text.splitlines() == ["Team", "Name | Role", "A. Smith | PI Lead"]
+
+    def test_headers_and_footers_included_once(self):
+        parts = {
+            "word/header1.xml": _part("hdr", _para("ACME ", "Clinical")),
+            "word/header2.xml": _part("hdr", _para("ACME Clinical")),
+            "word/footer1.xml": _part("ftr", _para("Confidential")),
+        }
+        text = extract_text(_make_docx(_para("Body text"), parts), "doc.docx")
+        assert text.splitlines() == ["ACME Clinical", "Body text", "Confidential"]
+
+    def test_missing_document_part(self):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("word/styles.xml", "<x/>")
+        with pytest.raises(ValueError, match="missing word/document.xml"):
+            extract_text(buf.getvalue(), "doc.docx")
+
+    def test_entities_are_not_expanded(self):
+        doc = (
+            '<?xml version="1.0"?><!DOCTYPE d [<!ENTITY e "EXPANDED">]>'
+            f'<w:document xmlns:w="{NS}"><w:body><w:p><w:r><w:t>a&e;b</w:t></w:r></w:p></w:body></w:document>'
+        )
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("word/document.xml", doc)
+        assert "EXPANDED" not in extract_text(buf.getvalue(), "doc.docx")
+
+
+class TestDocxSizeGuards:
+    def test_compression_bomb_is_rejected(self):
+        bomb = _make_docx(_para("x" * 20_000_000))  # ~20 MB inflating from ~20 KB
+        with pytest.raises(ValueError, match="compression ratio"):
+            extract_text(bomb, "bomb.docx")
+
+    def test_declared_size_over_cap_is_rejected(self, monkeypatch):
+        from app.extraction import text_extractor
+
+        monkeypatch.setattr(text_extractor.settings, "docx_max_uncompressed_mb", 1)
+        big = _make_docx(_para("x" * (2 * 1024 * 1024)))
+        with pytest.raises(ValueError, match="exceeds 1 MB"):
+            extract_text(big, "big.docx")
+
+    def test_understated_size_is_caught_while_inflating(self):
+        from app.extraction.text_extractor import _InflateBudget
+
+        info = zipfile.ZipInfo("word/document.xml")
+        info.file_size = info.compress_size = 1024 * 1024  # headers claim 1 MB, 1:1
+        budget = _InflateBudget(max_bytes=2 * 1024 * 1024, max_ratio=100)
+        stream = budget.guard(info, io.BytesIO(b"x" * (3 * 1024 * 1024)))
+        with pytest.raises(ValueError, match="exceeds 2 MB"):
+            while stream.read(64 * 1024):
+                pass
+
+    def test_budget_is_shared_across_parts(self, monkeypatch):
+        from app.extraction import text_extractor
+
+        monkeypatch.setattr(text_extractor.settings, "docx_max_uncompressed_mb", 1)
+        half = "x" * (600 * 1024)
+        docx = _make_docx(_para(half), {"word/header1.xml": _part("hdr", _para(half))})
+        with pytest.raises(ValueError, match="exceeds 1 MB"):
+            extract_text(docx, "two_parts.docx")
+
+
+def _make_pdf(pages: int, header: str = "ACME Clinical - Confidential") -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for n in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 40), header)
+        page.insert_text((72, 100), f"Body text of page {n} about site monitoring.")
+        page.insert_text((72, 800), f"Page {n} of {pages}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class TestTextExtractorPdf:
+    def test_pages_in_order(self):
+        from app.extraction.pdf_text import PdfOptions, extract_pdf_text
+
+        text = extract_pdf_text(_make_pdf(3), PdfOptions(strip_repeated_lines=False))
+        assert text.index("page 1 ") < text.index("page 2 ") < text.index("page 3 ")
+        assert "Page 2 of 3" in text
+
+    def test_repeated_headers_and_footers_dropped(self):
+        from app.extraction.pdf_text import PdfOptions, extract_pdf_text
+
+        text = extract_pdf_text(_make_pdf(6), PdfOptions())
+        assert "Confidential" not in text
+        assert "of 6" not in text
+        assert "Body text of page 6" in text
+
+    def test_page_cap_and_char_budget(self):
+        from app.extraction.pdf_text import PdfOptions, extract_pdf_text
+
+        data = _make_pdf(10)
+        assert "page 4 " not in extract_pdf_text(data, PdfOptions(max_pages=3))
+        budgeted = extract_pdf_text(data, PdfOptions(max_chars=150, strip_repeated_lines=False))
+        assert len(budgeted) == 150
+
+    def test_parallel_matches_serial(self):
+        from app.extraction.pdf_text import PdfOptions, extract_pdf_text, shutdown_pool
+
+        data = _make_pdf(12)
+        serial = extract_pdf_text(data, PdfOptions())
+        try:
+            parallel = extract_pdf_text(data, PdfOptions(workers=2, pages_per_shard=5, parallel_min_pages=2))
+        finally:
+            shutdown_pool()
+        assert parallel == serial
+
+    def test_extract_text_dispatches_pdf(self):
+        assert "Body text of page 1" in extract_text(_make_pdf(1), "protocol.pdf")
+
+
+class TestExtractFromPath:
+    """Spooled uploads reach the extractors as a file path instead of bytes."""
+
+    def test_all_types_match_bytes(self, tmp_path):
+        samples = {
+            "notes.txt": "Plain notes.".encode(),
+            "doc.docx": _make_docx(_para("Docx ", "body.")),
+            "scan.pdf": _make_pdf(3),
+        }
+        for name, data in samples.items():
+            path = tmp_path / name
+            path.write_bytes(data)
+            assert extract_text(str(path), name) == extract_text(data, name)
+
+    def test_spool_moves_to_disk_past_threshold(self, tmp_path):
+        from app.storage.uploads import UploadSpool
+
+        spool = UploadSpool("big.pdf", threshold=8, directory=str(tmp_path))
+        spool.write(b"12345")
+        assert not spool.on_disk
+        spool.write(b"67890")
+        upload = spool.finish()
+        assert upload.spooled and upload.path.endswith(".pdf")
+        with open(upload.source, "rb") as f:
+            assert f.read() == b"1234567890"
+        upload.close()
+        assert list(tmp_path.iterdir()) == []
+
 
 class TestTextExtractorUnsupported:
     def test_unsupported_extension(self):
@@ -64,3 +254,632 @@ class TestPrompts:
     def test_system_prompt_exists(self):
         assert len(SYSTEM_PROMPT) > 50
         assert "JSON" in SYSTEM_PROMPT
+
+
+class _FakeStream:
+    """Stand-in for the SDK's message stream context manager."""
+
+    def __init__(self, chunks, final):
+        self._chunks = chunks
+        self._final = final
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        async def gen():
+            for chunk in self._chunks:
+                yield chunk
+        return gen()
+
+    async def get_final_message(self):
+        return self._final
+
+
+class TestStreamingProgress:
+    @pytest.mark.anyio
+    async def test_counts_keys_split_across_chunks(self):
+        from types import SimpleNamespace
+        from app.extraction.ai_extractor import _stream_message
+
+        chunks = ['{"PURP', 'OSE": "x", "SC', 'OPE"', ': "y", "nested": {"title": ""}}']
+        final = SimpleNamespace(stop_reason="end_turn")
+        client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: _FakeStream(chunks, final)))
+        progress = []
+
+        message = await _stream_message(client, {}, {"PURPOSE", "SCOPE"}, progress.append)
+        assert message is final
+        assert progress == [1, 2]
+
+
+class TestPriorityLimiter:
+    @pytest.mark.anyio
+    async def test_waiters_served_by_priority_then_fifo(self):
+        import asyncio
+        from app.extraction.concurrency import PriorityLimiter
+
+        limiter = PriorityLimiter(1)
+        order = []
+        gate = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot():
+                await gate.wait()
+
+        async def waiter(name, priority):
+            async with limiter.slot(priority):
+                order.append(name)
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(waiter("low-a", 2)),
+            asyncio.create_task(waiter("high", 0)),
+            asyncio.create_task(waiter("low-b", 2)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.waiting == 3
+        gate.set()
+        await asyncio.gather(first, *tasks)
+        assert order == ["high", "low-a", "low-b"]
+        assert limiter.active == 0
+
+    @pytest.mark.anyio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        import asyncio
+        from app.extraction.concurrency import PriorityLimiter
+
+        limiter = PriorityLimiter(1)
+        async with limiter.slot():
+            waiter = asyncio.create_task(limiter.slot().__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.active == 0
+        async with limiter.slot():
+            assert limiter.active == 1
+
+
+    @pytest.mark.anyio
+    async def test_aging_lets_a_long_waiter_overtake_newcomers(self):
+        import asyncio
+        from app.extraction.concurrency import PriorityLimiter
+
+        async def run(aging):
+            limiter = PriorityLimiter(1, aging=aging)
+            order = []
+            gate = asyncio.Event()
+
+            async def holder():
+                async with limiter.slot():
+                    await gate.wait()
+
+            async def waiter(name, priority):
+                async with limiter.slot(priority):
+                    order.append(name)
+
+            first = asyncio.create_task(holder())
+            await asyncio.sleep(0)
+            big = asyncio.create_task(waiter("big", 2.0))
+            await asyncio.sleep(0.05)  # with aging=100, worth 5 priority units
+            small = asyncio.create_task(waiter("small", 0.0))
+            await asyncio.sleep(0)
+            gate.set()
+            await asyncio.gather(first, big, small)
+            return order
+
+        assert await run(aging=0.0) == ["small", "big"]
+        assert await run(aging=100.0) == ["big", "small"]
+
+
+class _FakeMessages:
+    def __init__(self, response_text):
+        self.calls = 0
+        self._text = response_text
+
+    async def create(self, **request):
+        import asyncio
+        from types import SimpleNamespace
+
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(
+            stop_reason="end_turn",
+            content=[SimpleNamespace(type="text", text=self._text)],
+        )
+
+
+class TestModelCallCoalescing:
+    @pytest.mark.anyio
+    async def test_identical_concurrent_requests_share_one_call(self, monkeypatch):
+        import anthropic
+        import asyncio
+        from types import SimpleNamespace
+        from app.extraction import ai_extractor
+
+        messages = _FakeMessages('{"SOP_TITLE": "Cleaning"}')
+        monkeypatch.setattr(
+            anthropic, "AsyncAnthropic", lambda **kw: SimpleNamespace(messages=messages)
+        )
+
+        async def request(text):
+            stats = ai_extractor.track_model_call()
+            return await ai_extractor.extract_fields("sop", text), stats
+
+        coalesced = ai_extractor.model_calls_coalesced_total
+        before = coalesced.value(model=ai_extractor.settings.anthropic_model, template="sop")
+        results = await asyncio.gather(request("same"), request("same"), request("different"))
+        assert messages.calls == 2
+        assert coalesced.value(model=ai_extractor.settings.anthropic_model, template="sop") == before + 1
+        assert [r[0]["SOP_TITLE"] for r in results] == ["Cleaning"] * 3
+        assert sorted(r[1].coalesced for r in results) == [False, False, True]
+        assert results[0][0] is not results[1][0]
+
+    @pytest.mark.anyio
+    async def test_call_is_cancelled_once_every_caller_has_gone(self):
+        import asyncio
+        from app.extraction.concurrency import SingleFlight
+
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flight.do("k", call))
+        second = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()  # still wanted by the second caller
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.anyio
+    async def test_orphaned_call_lingers_for_a_late_caller(self):
+        import asyncio
+        from app.extraction.concurrency import SingleFlight
+
+        flight = SingleFlight(linger=0.2)
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.1)
+        late = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0.2)  # past the first linger period: re-claimed, so not cancelled
+        release.set()
+        assert await late == ("done", True)
+
+        orphan = asyncio.create_task(flight.do("k2", asyncio.Event().wait))
+        await asyncio.sleep(0.01)
+        orphan.cancel()
+        await asyncio.sleep(0.3)
+        assert not flight._inflight
+
+
+def _status_error(cls, status: int, headers: dict | None = None):
+    import httpx
+
+    request = httpx.Request("POST", "https://api.example/v1/messages")
+    return cls("upstream", response=httpx.Response(status, headers=headers, request=request), body=None)
+
+
+class TestResilience:
+    @pytest.fixture(autouse=True)
+    def _fast_policy(self):
+        from app.extraction.resilience import RetryPolicy
+
+        self.policy = RetryPolicy(
+            max_attempts=3, attempt_timeout=0.2, total_timeout=2.0, backoff_base=0.001, backoff_max=0.002
+        )
+
+    @pytest.mark.anyio
+    async def test_retries_retryable_errors(self):
+        import anthropic
+        from app.extraction.resilience import call_with_retries
+
+        calls = 0
+
+        async def flaky():
+            nonlocal calls
+            calls += 1
+            if calls < 3:
+                raise _status_error(anthropic.InternalServerError, 529)
+            return "ok"
+
+        assert await call_with_retries(flaky, self.policy) == "ok"
+        assert calls == 3
+
+    @pytest.mark.anyio
+    async def test_does_not_retry_client_errors(self):
+        import anthropic
+        from app.extraction.resilience import call_with_retries
+
+        calls = 0
+
+        async def bad_request():
+            nonlocal calls
+            calls += 1
+            raise _status_error(anthropic.BadRequestError, 400)
+
+        with pytest.raises(anthropic.BadRequestError):
+            await call_with_retries(bad_request, self.policy)
+        assert calls == 1
+
+    @pytest.mark.anyio
+    async def test_per_attempt_deadline_then_gives_up(self):
+        import asyncio
+        from app.extraction.resilience import call_with_retries
+
+        calls = 0
+
+        async def hang():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(10)
+
+        with pytest.raises(TimeoutError):
+            await call_with_retries(hang, self.policy)
+        assert calls == 3
+
+    @pytest.mark.anyio
+    async def test_request_deadline_cuts_the_budget_short(self):
+        import asyncio
+        import time
+        from app.extraction.resilience import call_with_retries, set_deadline
+
+        calls = 0
+
+        async def hang():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(10)
+
+        async def run():
+            set_deadline(time.monotonic() + 0.05)  # scoped to this task's context
+            await call_with_retries(hang, self.policy)
+
+        with pytest.raises(TimeoutError):
+            await asyncio.create_task(run())
+        assert calls == 1
+
+    @pytest.mark.anyio
+    async def test_retry_after_beyond_budget_fails_fast(self):
+        import anthropic
+        from app.extraction.resilience import call_with_retries
+
+        async def limited():
+            raise _status_error(anthropic.RateLimitError, 429, {"retry-after": "60"})
+
+        with pytest.raises(anthropic.RateLimitError):
+            await call_with_retries(limited, self.policy)
+
+    @pytest.mark.anyio
+    async def test_hedge_takes_first_success_and_cancels_loser(self):
+        import asyncio
+        from app.extraction.resilience import hedged
+
+        started = []
+        cancelled = []
+
+        async def call():
+            n = len(started)
+            started.append(n)
+            try:
+                await asyncio.sleep(1.0 if n == 0 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(n)
+                raise
+            return n
+
+        assert await hedged(call, 0.01) == 1
+        await asyncio.sleep(0)
+        assert cancelled == [0]
+
+    @pytest.mark.anyio
+    async def test_cancelled_hedge_cancels_attempt_before_hedging(self):
+        import asyncio
+        from app.extraction.resilience import hedged
+
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(5.0)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedged(slow, 1.0), 0.1)
+        await asyncio.sleep(0)
+        assert cancelled == [True]
+
+    @pytest.mark.anyio
+    async def test_fast_call_is_not_hedged(self):
+        from app.extraction.resilience import hedged
+
+        started = 0
+
+        async def call():
+            nonlocal started
+            started += 1
+            return "ok"
+
+        assert await hedged(call, 0.5) == "ok"
+        assert started == 1
+
+    def test_latency_tracker_needs_samples(self):
+        from app.extraction.resilience import LatencyTracker
+
+        tracker = LatencyTracker(min_samples=5)
+        for s in (1, 2, 3, 4):
+            tracker.record(s)
+        assert tracker.percentile(0.95) is None
+        for s in range(5, 21):
+            tracker.record(s)
+        assert tracker.percentile(0.95) == 20
+
+
+class TestRouting:
+    def test_small_flat_document_gets_floor_budget(self):
+        from app.extraction.routing import route
+
+        info = get_template("deviation")
+        decision = route("deviation", info, "x" * 2000)
+        assert decision.max_tokens == 2048
+        assert decision.max_tokens < info.max_tokens
+
+    def test_budget_never_exceeds_template_max(self):
+        from app.extraction.routing import route
+
+        info = get_template("general")
+        decision = route("general", info, "x" * 400_000)
+        assert decision.max_tokens == info.max_tokens
+
+    def test_structured_budget_scales_with_input(self):
+        from app.extraction.routing import route
+
+        info = get_template("general")
+        small = route("general", info, "x" * 4_000).max_tokens
+        medium = route("general", info, "x" * 20_000).max_tokens
+        assert small < medium <= info.max_tokens
+
+    def test_adaptive_budget_can_be_disabled(self, monkeypatch):
+        from app.config import settings
+        from app.extraction.routing import route
+
+        monkeypatch.setattr(settings, "adaptive_max_tokens", False)
+        assert route("sop", get_template("sop"), "short").max_tokens == get_template("sop").max_tokens
+
+    def test_fast_tier_only_for_small_flat_documents(self, monkeypatch):
+        from app.config import settings
+        from app.extraction.routing import route
+
+        monkeypatch.setattr(settings, "fast_model", "fast-model")
+        assert route("capa", get_template("capa"), "short").model == "fast-model"
+        assert route("capa", get_template("capa"), "x" * 100_000).model == settings.anthropic_model
+        assert route("general", get_template("general"), "short").model == settings.anthropic_model
+
+
+    def test_expected_duration_orders_small_before_large(self):
+        from app.extraction.routing import estimate_seconds, route
+
+        short_report = estimate_seconds(route("deviation", get_template("deviation"), "x" * 4_000))
+        long_report = estimate_seconds(route("deviation", get_template("deviation"), "x" * 40_000))
+        general = estimate_seconds(route("general", get_template("general"), "x" * 40_000))
+        assert short_report < long_report < general
+
+
+class TestTruncationFallback:
+    @pytest.mark.anyio
+    async def test_truncated_adaptive_budget_retries_with_full_budget(self, monkeypatch):
+        import anthropic
+        from types import SimpleNamespace
+        from app.extraction import ai_extractor
+
+        budgets = []
+
+        async def create(**request):
+            budgets.append(request["max_tokens"])
+            stop = "max_tokens" if len(budgets) == 1 else "end_turn"
+            return SimpleNamespace(stop_reason=stop, content=[SimpleNamespace(type="text", text="{}")])
+
+        client = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(anthropic, "AsyncAnthropic", lambda **kw: client)
+
+        result = await ai_extractor.extract_fields("deviation", "truncation fallback text")
+        assert budgets == [2048, get_template("deviation").max_tokens]
+        assert result["ROOT_CAUSE"] == ""
+
+
+class TestSparseOutput:
+    @pytest.mark.parametrize("template_type", ["sop", "deviation", "capa", "training", "monitoring"])
+    def test_sparse_prompt_lists_keys_without_skeleton(self, template_type):
+        info = get_template(template_type)
+        prompt = build_extraction_prompt(template_type, info.placeholders, "Sample text", sparse=True)
+        for key in info.placeholders:
+            assert key in prompt
+        assert '": ""' not in prompt
+        assert "Omit every key" in prompt
+
+    def test_sparse_general_prompt_allows_omission(self):
+        prompt = build_extraction_prompt("general", get_template("general").placeholders, "Sample", sparse=True)
+        assert "omit when the source has no matching content" in prompt
+        assert "Use empty arrays" not in prompt
+
+    @pytest.mark.anyio
+    async def test_sparse_response_is_back_filled(self, monkeypatch):
+        import anthropic
+        from types import SimpleNamespace
+        from app.extraction import ai_extractor
+
+        async def create(**request):
+            assert "Omit every key" in request["messages"][0]["content"]
+            text = '{"SOP_TITLE": "Cleaning", "PURPOSE": "Keep it clean"}'
+            return SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text=text)])
+
+        client = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(anthropic, "AsyncAnthropic", lambda **kw: client)
+        monkeypatch.setattr(ai_extractor.settings, "sparse_output", True)
+
+        result = await ai_extractor.extract_fields("sop", "sparse back-fill text")
+        assert set(result) == set(get_template("sop").placeholders)
+        assert result["SOP_TITLE"] == "Cleaning"
+        assert result["SCOPE"] == ""
+
+    def test_sparse_general_response_is_normalized(self):
+        from app.extraction.ai_extractor import normalize_fields
+
+        fields = normalize_fields(get_template("general"), {"DOCUMENT_TITLE": "Plan", "sections": [{"title": "Intro"}]})
+        assert fields["ORGANIZATION_NAME"] == ""
+        assert fields["abbreviations"] == []
+        assert fields["sections"] == [{"title": "Intro", "content": "", "subsections": []}]
+
+
+class TestRelevancePrefilter:
+    def _long_document(self):
+        filler = "\n\n".join(
+            f"Catering note {i}: lunch menu, parking directions and weather forecast for the week."
+            for i in range(400)
+        )
+        relevant = (
+            "Root cause investigation: the corrective action owner is J. Smith. "
+            "Preventive action due date 2026-03-01; effectiveness verification by QA."
+        )
+        return "CAPA-2026-007 Acme Clinical\n\n" + filler + "\n\n" + relevant + "\n\n" + filler
+
+    def test_short_text_is_untouched(self):
+        from app.extraction.relevance import prefilter
+
+        text, report = prefilter("capa", "short text", min_chars=1000, target_chars=500, head_chars=100)
+        assert text == "short text"
+        assert report is None
+
+    def test_keeps_head_and_relevant_passages(self):
+        from app.extraction.relevance import prefilter
+
+        original = self._long_document()
+        text, report = prefilter("capa", original, min_chars=5000, target_chars=3000, head_chars=200)
+        assert len(text) < 3500
+        assert text.startswith("CAPA-2026-007 Acme Clinical")
+        assert "Root cause investigation" in text
+        assert "omitted" in text
+        assert report.saved_tokens > 0
+        assert report.passages_kept < report.passages_total
+
+    def test_text_within_target_is_untouched(self):
+        from app.extraction.relevance import prefilter
+
+        original = self._long_document()
+        text, report = prefilter("capa", original, min_chars=5000, target_chars=len(original), head_chars=200)
+        assert text == original
+        assert report is None
+
+    def test_unmatched_passages_fill_leftover_budget(self):
+        from app.extraction.relevance import prefilter
+
+        original = self._long_document() + "\n\nReported by Dr. Okafor on 2024-03-12."
+        text, _ = prefilter("capa", original, min_chars=5000, target_chars=len(original) - 200, head_chars=200)
+        assert "Reported by Dr. Okafor on 2024-03-12." in text
+        assert "Root cause investigation" in text
+
+    def test_passages_split_on_blank_lines_and_size(self):
+        from app.extraction.relevance import PASSAGE_CHARS, split_passages
+
+        assert split_passages("a\nb\n\nc") == ["a\nb", "c"]
+        long_lines = "\n".join("x" * 100 for _ in range(30))
+        assert all(len(p) <= PASSAGE_CHARS + 101 for p in split_passages(long_lines))
+
+    def test_vocabulary_comes_from_template(self):
+        from app.extraction.relevance import template_vocabulary
+
+        vocab = template_vocabulary("capa")
+        assert {"corrective", "preventive", "root", "cause"} <= vocab
+        assert "the" not in vocab
+
+    @pytest.mark.anyio
+    async def test_runs_off_the_event_loop_thread(self, monkeypatch):
+        import anthropic
+        import threading
+        from types import SimpleNamespace
+        from app.extraction import ai_extractor, relevance
+
+        threads = []
+
+        def recording_prefilter(*args):
+            threads.append(threading.get_ident())
+            return relevance.prefilter(*args)
+
+        async def create(**request):
+            return SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text="{}")])
+
+        client = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(anthropic, "AsyncAnthropic", lambda **kw: client)
+        monkeypatch.setattr(ai_extractor, "prefilter", recording_prefilter)
+        monkeypatch.setattr(ai_extractor.settings, "prefilter_enabled", True)
+        monkeypatch.setattr(ai_extractor.settings, "prefilter_min_chars", 5000)
+        monkeypatch.setattr(ai_extractor.settings, "prefilter_target_chars", 3000)
+
+        await ai_extractor.extract_fields("capa", self._long_document())
+        assert threads and threads[0] != threading.get_ident()
+
+
+def _sandbox_pid(file_bytes: bytes, filename: str) -> str:
+    """Sandbox target (must be importable in the worker): the worker's pid."""
+    import os
+
+    return str(os.getpid())
+
+
+class TestSandbox:
+    def test_workers_are_recycled_after_max_jobs(self):
+        from app.extraction.sandbox import SandboxLimits, SandboxPool
+
+        pool = SandboxPool(
+            workers=1, max_jobs_per_worker=2, timeout=30.0,
+            limits=SandboxLimits(cpu_seconds=0, memory_bytes=0), target=_sandbox_pid,
+        )
+        try:
+            pids = [pool.run(b"", "x.txt") for _ in range(3)]
+        finally:
+            pool.shutdown()
+        assert pids[0] == pids[1] != pids[2]
+
+    def test_errors_surface_as_value_error(self):
+        from app.extraction.sandbox import SandboxLimits, SandboxPool
+
+        pool = SandboxPool(
+            workers=1, max_jobs_per_worker=10, timeout=30.0,
+            limits=SandboxLimits(cpu_seconds=0, memory_bytes=0),
+        )
+        try:
+            with pytest.raises(ValueError, match="Unsupported file type"):
+                pool.run(b"data", "x.exe")
+            assert pool.run(b"still usable", "x.txt") == "still usable"
+        finally:
+            pool.shutdown()
+
+    def test_disabled_sandbox_extracts_in_process(self, monkeypatch):
+        from app.extraction import sandbox
+
+        def no_pool():
+            raise AssertionError("sandbox pool used while disabled")
+
+        monkeypatch.setattr(sandbox.settings, "sandbox_enabled", False)
+        monkeypatch.setattr(sandbox, "get_pool", no_pool)
+        assert sandbox.extract_text_isolated(b"plain", "a.txt") == "plain"
@@ -0,0 +1,23 @@
+"""Import-time budget: heavy dependencies load with their stage, not at start-up."""
+
+import pytest
+
+from benchmarks.import_time import import_seconds, loaded_modules
+
+# Cold-import budgets in seconds (best of 3, interpreter start-up excluded).
+# Measured at about 0.7 s and 0.05 s; the headroom absorbs slower CI machines
+# but not an eager import of the model SDK (~0.6 s on its own).
+BUDGETS = {"app.main": 1.5, "app.engine": 0.5}
+
+
+def test_app_start_does_not_load_model_sdk_or_pdf_library():
+    assert not {"anthropic", "fitz"} & loaded_modules("app.main")
+
+
+def test_engine_imports_without_web_stack():
+    assert not {"anthropic", "fitz", "fastapi", "pydantic_settings"} & loaded_modules("app.engine")
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_cold_import_within_budget(module):
+    assert min(import_seconds(module, runs=3)) < BUDGETS[module]
@@ -0,0 +1,185 @@
+"""Tests for the background job manager and result stores."""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.jobs.manager import FAILED, SUCCEEDED, JobManager, QueueFullError
+from app.storage.results import MemoryResultStore, SqliteResultStore, build_result_store
+from app.storage.text_cache import MemoryTextCache, build_text_cache, text_cache_key
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class TestMemoryResultStore:
+    def test_put_get(self):
+        store = MemoryResultStore(ttl_seconds=60)
+        store.put("k", b"data", "out.docx")
+        entry = store.get("k")
+        assert entry.content == b"data"
+        assert entry.filename == "out.docx"
+
+    def test_expired_entries_are_gone(self):
+        store = MemoryResultStore(ttl_seconds=0)
+        store.put("k", b"data", "out.docx")
+        assert store.get("k") is None
+
+    def test_bounded_size_evicts_oldest(self):
+        store = MemoryResultStore(ttl_seconds=60, max_entries=2)
+        for key in ("a", "b", "c"):
+            store.put(key, key.encode(), "out.docx")
+        assert store.get("a") is None
+        assert store.get("c").content == b"c"
+
+
+class TestSqliteResultStore:
+    def test_round_trip_and_delete(self, tmp_path):
+        store = SqliteResultStore(str(tmp_path / "results.sqlite3"), ttl_seconds=60)
+        store.put("k", b"\x00docx", "out.docx")
+        assert store.get("k").content == b"\x00docx"
+        store.delete("k")
+        assert store.get("k") is None
+
+    def test_persists_across_instances(self, tmp_path):
+        path = str(tmp_path / "results.sqlite3")
+        SqliteResultStore(path, ttl_seconds=60).put("k", b"data", "out.docx")
+        assert SqliteResultStore(path, ttl_seconds=60).get("k").content == b"data"
+
+    def test_expired_rows_are_hidden(self, tmp_path):
+        store = SqliteResultStore(str(tmp_path / "results.sqlite3"), ttl_seconds=0)
+        store.put("k", b"data", "out.docx")
+        assert store.get("k") is None
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError, match="Unknown result store backend"):
+            build_result_store("redis", 60)
+
+
+class TestTextCache:
+    def test_memory_tier_is_bounded_by_characters(self):
+        cache = MemoryTextCache(max_chars=10)
+        cache.put("a", "12345")
+        cache.put("b", "12345")
+        cache.get("a")  # a is now most recently used
+        cache.put("c", "123")
+        assert cache.get("b") is None
+        assert cache.get("a") == "12345" and cache.get("c") == "123"
+        cache.put("huge", "x" * 11)
+        assert cache.get("huge") is None
+
+    def test_disk_tier_survives_a_new_cache(self, tmp_path):
+        path = str(tmp_path / "texts.sqlite3")
+        build_text_cache(1000, path).put("k", "text")
+        fresh = build_text_cache(1000, path)
+        assert fresh.get("k") == "text"
+        assert fresh.memory.get("k") == "text"  # promoted on read
+        assert (fresh.hits, fresh.misses) == (1, 0)
+
+    def test_disk_tier_prunes_least_recently_used(self, tmp_path):
+        cache = build_text_cache(0, str(tmp_path / "texts.sqlite3"), disk_max_entries=2)
+        cache.put("a", "1")
+        time.sleep(0.01)
+        cache.put("b", "2")
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1" and cache.get("c") == "3"
+
+    def test_key_separates_file_type_and_extractor_version(self):
+        keys = {
+            text_cache_key("abc", "a.txt", "v1"),
+            text_cache_key("abc", "a.docx", "v1"),
+            text_cache_key("abc", "a.txt", "v2"),
+        }
+        assert len(keys) == 3
+
+
+async def _until_finished(manager: JobManager, job_id: str):
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job.finished:
+            return job
+        await asyncio.sleep(0.005)
+    raise AssertionError("job did not finish")
+
+
+class TestJobManager:
+    @pytest.mark.anyio
+    async def test_success_stores_result(self):
+        manager = JobManager(MemoryResultStore(60), workers=2, queue_size=10, ttl_seconds=60)
+
+        async def run():
+            return b"docx"
+
+        job = manager.submit("sop", "sop_formatted.docx", run)
+        job = await _until_finished(manager, job.id)
+        assert job.status == SUCCEEDED
+        assert manager.store.get(job.id).content == b"docx"
+        await manager.shutdown()
+
+    @pytest.mark.anyio
+    async def test_http_errors_are_kept(self):
+        manager = JobManager(MemoryResultStore(60), workers=1, queue_size=10, ttl_seconds=60)
+
+        async def run():
+            raise HTTPException(status_code=400, detail="bad upload")
+
+        job = await _until_finished(manager, manager.submit("sop", "x.docx", run).id)
+        assert (job.status, job.error_status, job.error_detail) == (FAILED, 400, "bad upload")
+        await manager.shutdown()
+
+    @pytest.mark.anyio
+    async def test_concurrency_is_bounded(self):
+        manager = JobManager(MemoryResultStore(60), workers=2, queue_size=10, ttl_seconds=60)
+        running = 0
+        peak = 0
+
+        async def run():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return b""
+
+        jobs = [manager.submit("sop", "x.docx", run) for _ in range(6)]
+        for job in jobs:
+            await _until_finished(manager, job.id)
+        assert peak == 2
+        await manager.shutdown()
+
+    @pytest.mark.anyio
+    async def test_queue_full(self):
+        manager = JobManager(MemoryResultStore(60), workers=1, queue_size=1, ttl_seconds=60)
+        gate = asyncio.Event()
+
+        async def run():
+            await gate.wait()
+            return b""
+
+        manager.submit("sop", "x.docx", run)
+        await asyncio.sleep(0)  # let the worker pick up the first job
+        manager.submit("sop", "x.docx", run)
+        with pytest.raises(QueueFullError):
+            manager.submit("sop", "x.docx", run)
+        gate.set()
+        await manager.shutdown()
+
+    @pytest.mark.anyio
+    async def test_finished_jobs_expire(self):
+        manager = JobManager(MemoryResultStore(60), workers=1, queue_size=10, ttl_seconds=60)
+
+        async def run():
+            return b""
+
+        job = await _until_finished(manager, manager.submit("sop", "x.docx", run).id)
+        job.finished_at = time.time() - 120
+        assert manager.get(job.id) is None
+        await manager.shutdown()
@@ -0,0 +1,292 @@
+"""Tests for metrics, tracing and profiling."""
+
+import io
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.main import app
+from app.models.template_registry import get_template
+from app.observability import metrics
+from app.observability.metrics import Counter, Gauge, Histogram, Registry
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+def _mock_extract_fields(template_type: str):
+    values = {key: f"Test {key.lower()}" for key in get_template(template_type).placeholders}
+
+    async def mock_fn(t_type, doc_text):
+        return values
+    return mock_fn
+
+
+class TestMetricsRegistry:
+    def test_exposition_format(self):
+        registry = Registry()
+        counter = registry.register(Counter("jobs_total", "Jobs.", ("kind",)))
+        histogram = registry.register(Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0)))
+        registry.register(Gauge("depth", "Depth.", lambda: {(): 3}))
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        histogram.observe(0.05, stage="x")
+        histogram.observe(0.5, stage="x")
+        histogram.observe(5, stage="x")
+
+        lines = registry.render().splitlines()
+        assert "# TYPE jobs_total counter" in lines
+        assert 'jobs_total{kind="a\\"b"} 3' in lines
+        assert 'latency_seconds_bucket{stage="x",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="x",le="1"} 2' in lines
+        assert 'latency_seconds_bucket{stage="x",le="+Inf"} 3' in lines
+        assert 'latency_seconds_count{stage="x"} 3' in lines
+        assert 'latency_seconds_sum{stage="x"} 5.55' in lines
+        assert "depth 3" in lines
+
+    def test_labels_must_match(self):
+        counter = Counter("c", "C.", ("a",))
+        with pytest.raises(ValueError):
+            counter.inc(b="x")
+
+    def test_usage_is_counted(self):
+        before = metrics.model_input_tokens_total.value(model="m", template="sop")
+        metrics.record_usage("m", "sop", SimpleNamespace(input_tokens=120, output_tokens=30))
+        metrics.record_usage("m", "sop", None)
+        assert metrics.model_input_tokens_total.value(model="m", template="sop") == before + 120
+        assert metrics.model_output_tokens_total.value(model="m", template="sop") >= 30
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_metrics_endpoint_reports_requests_and_stages(mock_extract, client):
+    mock_extract.side_effect = _mock_extract_fields("capa")
+    route = dict(route="/api/format", template="capa")
+    before = metrics.request_seconds.count(**route)
+    fills_before = metrics.stage_seconds.count(stage="fill_template", template="capa")
+
+    files = {"file": ("capa.txt", io.BytesIO(b"Metrics CAPA notes."), "text/plain")}
+    assert (await client.post("/api/format", files=files, data={"template_type": "capa"})).status_code == 200
+    files = {"file": ("blank.txt", io.BytesIO(b"   "), "text/plain")}
+    assert (await client.post("/api/format", files=files, data={"template_type": "capa"})).status_code == 400
+
+    assert metrics.request_seconds.count(**route) == before + 2
+    assert metrics.requests_total.value(method="POST", status="400", **route) >= 1
+    assert metrics.stage_seconds.count(stage="fill_template", template="capa") == fills_before + 1
+    assert metrics.stage_errors_total.value(stage="extract_text", status="400") >= 1
+
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert 'tracescribe_stage_duration_seconds_count{stage="upload_read",template="capa"}' in body
+    assert 'tracescribe_threadpool_tasks{state="waiting"}' in body
+    assert 'tracescribe_model_calls{state="active"}' in body
+    assert "tracescribe_job_queue_depth" in body
+
+
+@pytest.fixture
+def span_file(tmp_path, monkeypatch):
+    from app.observability import tracing
+
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing.exporter, "_target", tracing.JsonLinesExporter(str(path)))
+    return path
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_background_job_exports_its_own_trace(mock_extract, client, span_file):
+    import asyncio
+    import json
+
+    from app.observability import tracing
+
+    mock_extract.side_effect = _mock_extract_fields("capa")
+    # The job workers start on this test's loop, inside the first request.
+    request_ids = []
+    for _ in range(2):
+        files = {"file": ("capa.txt", io.BytesIO(b"CAPA notes."), "text/plain")}
+        resp = await client.post("/api/jobs", files=files, data={"template_type": "capa"})
+        request_ids.append(resp.headers["x-request-id"])
+        status_url = resp.json()["status_url"]
+        while (await client.get(status_url)).json()["status"] in ("queued", "running"):
+            await asyncio.sleep(0.01)
+
+    tracing.exporter.flush()
+    spans = [json.loads(line) for line in span_file.read_text().splitlines()]
+    pipelines = [s for s in spans if s["name"] == "format_pipeline"]
+    assert len(pipelines) == 2
+    assert all(s["parent_id"] is None and s["trace_id"] not in request_ids for s in pipelines)
+    first_request = [s for s in spans if s["trace_id"] == request_ids[0]]
+    assert {s["name"] for s in first_request} == {"POST /api/jobs", "upload_read"}
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_format_reports_server_timing_and_exports_spans(mock_extract, client, span_file):
+    import json
+
+    from app.observability import tracing
+
+    mock_extract.side_effect = _mock_extract_fields("training")
+    files = {"file": ("training.txt", io.BytesIO(b"Tracing training log."), "text/plain")}
+    resp = await client.post("/api/format", files=files, data={"template_type": "training"})
+    assert resp.status_code == 200
+
+    timing = resp.headers["server-timing"]
+    for stage in ("upload_read", "extract_text", "extract_fields", "fill_template"):
+        assert f"{stage};dur=" in timing
+    trace_id = resp.headers["x-request-id"]
+
+    tracing.exporter.flush()
+    spans = [json.loads(line) for line in span_file.read_text().splitlines()]
+    spans = {s["name"]: s for s in spans if s["trace_id"] == trace_id}
+    root = spans["POST /api/format"]
+    assert root["parent_id"] is None
+    assert root["attributes"]["template"] == "training"
+    assert root["attributes"]["http.status_code"] == 200
+    assert spans["extract_text"]["parent_id"] == root["span_id"]
+    assert spans["extract_text"]["attributes"]["characters"] == len("Tracing training log.")
+    assert spans["upload_read"]["attributes"]["bytes"] == len(b"Tracing training log.")
+    # Engine sub-stages run in the thread pool but still join the request's trace.
+    assert spans["fill.part"]["parent_id"] == spans["fill_template"]["span_id"]
+
+
+def test_spans_nest_and_record_errors():
+    from app.observability.tracing import child_span, span
+
+    with child_span("outside") as detached:
+        pass
+    assert detached.trace_id == ""
+
+    with pytest.raises(ValueError):
+        with span("root") as root:
+            with span("child", size=3) as child:
+                raise ValueError("boom")
+    assert child.parent_id == root.span_id and child.trace_id == root.trace_id
+    assert child.error == "ValueError: boom" and root.error == "ValueError: boom"
+    assert [s.name for s in root._trace.spans] == ["child", "root"]
+
+
+def test_otlp_exporter_posts_otlp_json(monkeypatch):
+    import httpx
+
+    from app.observability.tracing import OtlpHttpExporter, span
+
+    posted = []
+
+    def fake_post(url, json, timeout):
+        posted.append((url, json))
+        return httpx.Response(200, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(httpx, "post", fake_post)
+    with span("root", template="sop") as root:
+        with span("child", tokens=12, cached=False):
+            pass
+    OtlpHttpExporter("http://collector:4318/v1/traces").export(root._trace.spans)
+
+    url, payload = posted[0]
+    assert url == "http://collector:4318/v1/traces"
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    child, exported_root = spans
+    assert child["parentSpanId"] == exported_root["spanId"] == root.span_id
+    assert {"key": "tokens", "value": {"intValue": "12"}} in child["attributes"]
+    assert {"key": "cached", "value": {"boolValue": False}} in child["attributes"]
+    assert exported_root["kind"] == 2 and "parentSpanId" not in exported_root
+
+
+@pytest.fixture
+def profiling(tmp_path, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "profiling_token", "s3cret")
+    monkeypatch.setattr(settings, "profiling_mode", "cprofile")
+    monkeypatch.setattr(settings, "profiling_dir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason="cprofile falls back to sampling on 3.12+")
+@patch("app.api.routes.extract_fields")
+async def test_operator_token_profiles_request(mock_extract, client, profiling):
+    import pstats
+
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    files = {"file": ("sop.txt", io.BytesIO(b"Profiled SOP text."), "text/plain")}
+    resp = await client.post(
+        "/api/format", files=files, data={"template_type": "sop"}, headers={"X-Profile-Token": "s3cret"}
+    )
+    assert resp.status_code == 200
+    request_id = resp.headers["x-profile-id"]
+    assert request_id == resp.headers["x-request-id"]
+
+    stats = pstats.Stats(str(profiling / f"{request_id}.pstats"))
+    profiled_functions = {name for _, _, name in stats.stats}
+    assert "fill_template" in profiled_functions
+    assert "extract_text" in profiled_functions  # parsed in-process, not in the sandbox
+
+    download = await client.get(f"/api/profiles/{request_id}", headers={"X-Profile-Token": "s3cret"})
+    assert download.status_code == 200 and download.content
+    assert (await client.get(f"/api/profiles/{request_id}", headers={"X-Profile-Token": "wrong"})).status_code == 404
+    assert (await client.get(f"/api/profiles/{request_id}")).status_code == 404
+
+
+@pytest.mark.anyio
+@patch("app.api.routes.extract_fields")
+async def test_wrong_or_missing_token_is_not_profiled(mock_extract, client, profiling):
+    mock_extract.side_effect = _mock_extract_fields("sop")
+    # The token is only accepted as a header: a query string ends up in access logs.
+    for params in ({"profile": "nope"}, {"profile": "s3cret"}, {}):
+        files = {"file": ("sop.txt", io.BytesIO(b"Unprofiled SOP text."), "text/plain")}
+        resp = await client.post("/api/format", files=files, data={"template_type": "sop"}, params=params)
+        assert resp.status_code == 200
+        assert "x-profile-id" not in resp.headers
+    assert list(profiling.iterdir()) == []
+
+
+def test_cprofile_falls_back_to_sampling_where_interpreter_wide(monkeypatch):
+    from app.observability import profiling
+
+    monkeypatch.setattr(profiling, "CPROFILE_PER_THREAD", False)
+    assert profiling.ProfileSession("abc123", "cprofile").mode == "sample"
+    monkeypatch.setattr(profiling, "CPROFILE_PER_THREAD", True)
+    assert profiling.ProfileSession("abc123", "cprofile").mode == "cprofile"
+
+
+def _busy_wait(seconds: float) -> int:
+    import time
+
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def test_sampling_mode_writes_collapsed_stacks(tmp_path):
+    import threading
+
+    from app.observability.profiling import ProfileSession
+
+    session = ProfileSession("abc123", "sample")
+    worker = threading.Thread(target=session.run, args=(_busy_wait, 0.2))
+    worker.start()
+    worker.join()
+    path = session.save(str(tmp_path))
+    lines = (tmp_path / "abc123.collapsed").read_text().splitlines()
+    assert path.endswith("abc123.collapsed")
+    assert any("_busy_wait" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
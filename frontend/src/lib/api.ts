@@ -2,6 +2,11 @@ import { TemplateType } from "./types";
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+// Network errors (not HTTP errors) are retried this many times. Every try
+// sends the same Idempotency-Key, so a retry attaches to the server's run in
+// flight or gets its stored result instead of paying for the pipeline again.
+const NETWORK_RETRIES = 2;
+
 /** Upload a document, let TraceScribe process it, and get the formatted .docx back. */
 export async function formatDocument(
   file: File,
@@ -10,11 +15,20 @@ export async function formatDocument(
   const formData = new FormData();
   formData.append("file", file);
   formData.append("template_type", templateType);
+  const idempotencyKey = crypto.randomUUID();
 
-  const response = await fetch(`${API_URL}/api/format`, {
-    method: "POST",
-    body: formData,
-  });
+  let response: Response | undefined;
+  for (let attempt = 0; response === undefined; attempt++) {
+    try {
+      response = await fetch(`${API_URL}/api/format`, {
+        method: "POST",
+        body: formData,
+        headers: { "Idempotency-Key": idempotencyKey },
+      });
+    } catch (err) {
+      if (attempt >= NETWORK_RETRIES) throw err;
+    }
+  }
 
   if (!response.ok) {
     const error = await response.json().catch(() => ({ detail: "Unknown error" }));